@@ -1,43 +1,72 @@
 # booking/admin.py
 
 from django.contrib import admin
-from .models import Venue, Event, Seat, Order, OrderItem
-
-# 註冊您的模型
-admin.site.register(Venue)
-admin.site.register(Event)
-admin.site.register(Seat)
-admin.site.register(Order)
-admin.site.register(OrderItem)
-
-# 如果想在後台看到更詳細的列表和搜尋功能，可以這樣定義：
-# @admin.register(Venue)
-# class VenueAdmin(admin.ModelAdmin):
-#     list_display = ('name', 'capacity')
-#     search_fields = ('name',)
-
-# @admin.register(Event)
-# class EventAdmin(admin.ModelAdmin):
-#     list_display = ('name', 'venue', 'event_date', 'event_time', 'base_price', 'is_active')
-#     list_filter = ('is_active', 'venue', 'event_date')
-#     search_fields = ('name', 'description')
-#     raw_id_fields = ('venue',) # 讓 ForeignKey 選擇更方便
-
-# @admin.register(Seat)
-# class SeatAdmin(admin.ModelAdmin):
-#     list_display = ('event', 'row', 'column', 'status', 'price', 'locked_until')
-#     list_filter = ('status', 'event')
-#     search_fields = ('event__name', 'row', 'column')
-#     raw_id_fields = ('event',)
-
-# @admin.register(Order)
-# class OrderAdmin(admin.ModelAdmin):
-#     list_display = ('order_number', 'user', 'event', 'total_amount', 'status', 'created_at')
-#     list_filter = ('status', 'created_at', 'event')
-#     search_fields = ('order_number', 'buyer_name', 'buyer_email', 'user__username')
-#     raw_id_fields = ('user', 'event')
-
-# @admin.register(OrderItem)
-# class OrderItemAdmin(admin.ModelAdmin):
-#     list_display = ('order', 'seat', 'quantity', 'price_at_purchase')
-#     raw_id_fields = ('order', 'seat')
\ No newline at end of file
+from .models import Venue, Event, PriceTier, Seat, Order, OrderItem
+
+# 列表頁會顯示關聯物件 (各模型的 __str__ 也會讀取關聯)，
+# 以 list_select_related 一次 JOIN 取得，避免每列各查詢一次；
+# 座位與訂單數量龐大，外鍵一律使用 raw_id_fields 以免編輯頁載入全部選項
+
+
+@admin.register(Venue)
+class VenueAdmin(admin.ModelAdmin):
+    list_display = ('name', 'capacity')
+    search_fields = ('name',)
+
+
+@admin.register(Event)
+class EventAdmin(admin.ModelAdmin):
+    list_display = ('name', 'venue', 'event_date', 'event_time', 'base_price', 'is_active')
+    list_filter = ('is_active', 'venue', 'event_date')
+    search_fields = ('name', 'description')
+    list_select_related = ('venue',)
+    raw_id_fields = ('venue',) # 讓 ForeignKey 選擇更方便
+
+
+@admin.register(PriceTier)
+class PriceTierAdmin(admin.ModelAdmin):
+    list_display = ('event', 'name', 'price', 'updated_at')
+    search_fields = ('event__name', 'name')
+    list_select_related = ('event__venue',)
+    raw_id_fields = ('event',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # 座位圖佈局含有票價，調價後讓其重建
+        from .services import seat_map_index
+        seat_map_index.invalidate(obj.event_id)
+
+
+@admin.register(Seat)
+class SeatAdmin(admin.ModelAdmin):
+    list_display = ('event', 'section', 'row', 'column', 'status', 'price_tier', 'price', 'locked_until')
+    list_filter = ('status',)
+    search_fields = ('event__name', 'row', 'column')
+    list_select_related = ('event__venue', 'price_tier')
+    raw_id_fields = ('event', 'price_tier')
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    raw_id_fields = ('seat',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('order', 'seat__event')
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('order_number', 'buyer_name', 'event', 'total_amount', 'status', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('order_number', 'buyer_name', 'user__username')
+    list_select_related = ('event__venue',)
+    raw_id_fields = ('user', 'event')
+    inlines = [OrderItemInline]
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(admin.ModelAdmin):
+    list_display = ('order', 'seat', 'quantity', 'price_at_purchase')
+    list_select_related = ('order', 'seat__event')
+    raw_id_fields = ('order', 'seat')
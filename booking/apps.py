@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class BookingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'booking'
+
+    def ready(self):
+        # 註冊場次 / 場地快取的失效 signals
+        from . import cache  # noqa: F401
+        # 註冊資料庫查詢計時的 execute wrapper
+        from . import instrumentation  # noqa: F401
@@ -0,0 +1,546 @@
+# booking/async_views.py
+
+"""
+座位鎖定、解鎖與座位圖的 async 視圖。
+
+這些端點在選座高峰時請求量最大，每個請求主要是在等待 Redis 與資料庫往返。
+以 async 視圖搭配 redis.asyncio 與 Django async ORM 實作後，
+等待期間事件迴圈可以處理其他請求，單一 ASGI 行程 (uvicorn) 即可同時服務大量連線，
+不再受限於同步工作行程的數量。
+
+視圖繼承 AsyncAPIView：請求解析 (request.data)、認證、權限、節流、CSRF 與錯誤格式
+都與其他 DRF 視圖相同 (REST_FRAMEWORK 設定、custom_exception_handler)，只有處理函式以 async 執行。
+
+請求與回應格式與原本的 DRF 端點相同：
+    POST /api/seats/lock/              {"seat_ids": [...], "session_id": "..."}
+    POST /api/seats/unlock/            {"seat_ids": [...], "session_id": "..."}
+    GET  /api/events/{id}/seat-map/    ?encoding=rle|binary&layout=1
+    POST /api/events/{id}/best-available/  {"quantity": 2, "session_id": "...", "max_price": 2000, "section": "..."}
+    GET  /api/events/{id}/hold/             ?session_id=...
+    POST /api/events/{id}/hold/renew/       {"session_id": "..."}
+    POST /api/events/{id}/hold/release/     {"session_id": "..."}
+
+鎖定的座位會加入該會話在場次的保留 (hold，見 holds.py)，保留秒數依場次設定。
+settings.SEAT_LOCK_STATE['MODE'] 為 'redis' 時，鎖定中的狀態只寫入 Redis，不更新資料庫 (見 lockstate.py)。
+
+需透過 asgi.py 以 ASGI 伺服器提供服務；在 WSGI 下 Django 仍可執行，但每個請求會佔用一個執行緒。
+"""
+
+import weakref
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseBase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .connections import get_async_lock_router, get_async_redis
+from .best_available import MAX_QUANTITY, SeatRowIndex, cached_row_index, store_row_index
+from .holds import AsyncHoldManager, hold_id, hold_policy
+from .lockstate import AsyncLockStateJournal, lockable_statuses, redis_authoritative
+from .locks import LOCK_ACQUIRED, LOCK_CONFLICT, LOCK_RENEWED, AsyncSeatLockManager
+from .waiting_room import AsyncWaitingRoom, queue_token_from_request
+from .models import Event, Seat
+from .seatmap import (
+    AsyncSeatMapIndex, STATE_AVAILABLE, STATE_LOCKED, STATE_NAMES, STATUS_TO_STATE, decode_states, run_length_encode,
+)
+
+# 自動配位時，選中的座位被搶走後最多重新尋找的次數
+BEST_AVAILABLE_ATTEMPTS = 5
+
+# 每個 redis.asyncio 客戶端 (即每個事件迴圈) 一組管理器，Lua 腳本只註冊一次
+_managers = weakref.WeakKeyDictionary()
+
+
+def _async_managers():
+    client = get_async_redis()
+    managers = _managers.get(client)
+    if managers is None:
+        router = get_async_lock_router(client)
+        managers = (
+            AsyncHoldManager(router),
+            AsyncSeatMapIndex(client, AsyncSeatLockManager(router)),
+            AsyncWaitingRoom(client),
+            AsyncLockStateJournal(client),
+        )
+        _managers[client] = managers
+    return managers
+
+
+def _error(detail, status=status.HTTP_400_BAD_REQUEST):
+    return Response({'detail': detail}, status=status)
+
+
+class AsyncAPIView(APIView):
+    """
+    處理函式為 async def 的 APIView。
+    initial() (認證、權限與節流檢查，可能查詢資料庫) 以 sync_to_async 執行，
+    例外一律交給 handle_exception()，錯誤回應與同步的 DRF 視圖相同。
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            # OPTIONS 沿用 APIView 的同步實作
+            if not isinstance(response, HttpResponseBase):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+def _request_data(request):
+    """request.data 不是物件 (例如 JSON 陣列) 時視為空的請求內容。"""
+    return request.data if hasattr(request.data, 'get') else {}
+
+
+def _parse_seat_request(request):
+    """解析 {"seat_ids": [...], "session_id": "..."}，回傳 (去重後的座位 ID, session_id, 錯誤回應)。"""
+    data = _request_data(request)
+    seat_ids = data.get('seat_ids', [])
+    session_id = data.get('session_id', None)
+    if not seat_ids or not session_id:
+        return None, None, _error('seat_ids and session_id are required.')
+    try:
+        # 去除重複的座位 ID，並保留請求中的順序
+        seat_ids = list(dict.fromkeys(int(seat_id) for seat_id in seat_ids))
+    except (TypeError, ValueError):
+        return None, None, _error('seat_ids must be a list of integers.')
+    return seat_ids, str(session_id), None
+
+
+def _group_by_event(seats):
+    seats_by_event = {}
+    for seat in seats:
+        seats_by_event.setdefault(seat.event_id, []).append(seat)
+    return seats_by_event
+
+
+async def _seats_by_id(seat_ids):
+    return {seat.id: seat async for seat in Seat.objects.filter(id__in=seat_ids)}
+
+
+def _write_locked_rows(seats, all_or_nothing):
+    """
+    在交易中鎖住仍可鎖定的列後才寫入，讀取座位之後才被下單或鎖定的座位不會被覆蓋。
+    回傳實際寫入的座位 ID；all_or_nothing 時只要有一個座位不可鎖定就不寫入任何座位。
+    """
+    with transaction.atomic():
+        writable = set(
+            Seat.objects.select_for_update()
+            .filter(id__in=[seat.id for seat in seats], status__in=lockable_statuses())
+            .values_list('id', flat=True)
+        )
+        if all_or_nothing and len(writable) != len(seats):
+            return set()
+        Seat.objects.bulk_update(
+            [seat for seat in seats if seat.id in writable], ['status', 'locked_until', 'locked_by_session'],
+        )
+    return writable
+
+
+async def _save_locked(seats, journal, all_or_nothing=False):
+    """
+    寫回鎖定的座位，回傳實際寫入的座位 ID：
+    database 模式以 _write_locked_rows 寫入，redis 模式只記錄到期時間 (seat.locked_until)。
+    """
+    if redis_authoritative():
+        await journal.locked(seats)
+        return {seat.id for seat in seats}
+    return await sync_to_async(_write_locked_rows)(seats, all_or_nothing)
+
+
+class SeatLockView(AsyncAPIView):
+    async def post(self, request):
+        """
+        批次鎖定多個座位並加入會話在該場次的保留。
+        一次查詢取得座位、每個場次一次 Lua 腳本呼叫取得所有鎖 (盡力而為)、在交易中確認狀態後一次 bulk_update 寫回
+        (redis 模式下不寫資料庫)，全部成功回傳 200，部分失敗回傳 207 並列出 failed_seats。
+        """
+        seat_ids, session_id, error = _parse_seat_request(request)
+        if error:
+            return error
+        holds, seat_map_index, waiting_room, journal = _async_managers()
+
+        locked_seats = []
+        failed_seats = []
+        seats_by_id = {seat.id: seat async for seat in Seat.objects.filter(id__in=seat_ids).select_related('event')}
+
+        # 啟用排隊室的場次只接受已放行的排隊憑證
+        token = queue_token_from_request(request)
+        for event in {seat.event_id: seat.event for seat in seats_by_id.values()}.values():
+            if event.waiting_room_enabled and not await waiting_room.is_admitted(event.id, token):
+                return Response({'detail': 'Waiting room admission required.', 'event_id': event.id}, status=status.HTTP_403_FORBIDDEN)
+
+        candidates = []
+        for seat_id in seat_ids:
+            seat = seats_by_id.get(seat_id)
+            if seat is None:
+                failed_seats.append({'id': seat_id, 'reason': 'not found'})
+            elif seat.status not in lockable_statuses():
+                failed_seats.append({'id': seat.id, 'reason': f'status: {seat.status}'})
+            else:
+                candidates.append(seat)
+
+        seats_to_update = []
+        hold_info = []
+        for event_id, event_candidates in _group_by_event(candidates).items():
+            event = event_candidates[0].event
+            ttl_seconds, max_seconds = hold_policy(event)
+            results = await holds.acquire(
+                event_id, session_id, [seat.id for seat in event_candidates], ttl_seconds, max_seconds,
+            )
+
+            locked_until = timezone.now() + timedelta(seconds=ttl_seconds)
+            for seat in event_candidates:
+                if results[seat.id] in (LOCK_ACQUIRED, LOCK_RENEWED):
+                    seat.status = 'locked'
+                    seat.locked_until = locked_until
+                    seat.locked_by_session = session_id
+                    seats_to_update.append(seat)
+                    locked_seats.append(seat.id)
+                else:
+                    failed_seats.append({'id': seat.id, 'reason': 'locked by another user'})
+            hold_info.append({'event_id': event_id, 'hold_id': hold_id(event_id, session_id), 'expires_in': ttl_seconds})
+
+        if seats_to_update:
+            saved = await _save_locked(seats_to_update, journal)
+            changed = [seat for seat in seats_to_update if seat.id not in saved]
+            # 讀取之後狀態已改變 (例如已被下單) 的座位：歸還剛取得的鎖
+            for event_id, event_changed in _group_by_event(changed).items():
+                await holds.release(event_id, session_id, [seat.id for seat in event_changed])
+            failed_seats.extend({'id': seat.id, 'reason': 'status changed'} for seat in changed)
+            locked_seats = [seat_id for seat_id in locked_seats if seat_id in saved]
+            await seat_map_index.mark([seat for seat in seats_to_update if seat.id in saved], STATE_LOCKED)
+
+        return Response(
+            {'locked_seats': locked_seats, 'failed_seats': failed_seats, 'holds': hold_info},
+            status=status.HTTP_200_OK if not failed_seats else status.HTTP_207_MULTI_STATUS,
+        )
+
+
+lock_seats = SeatLockView.as_view()
+
+
+class SeatUnlockView(AsyncAPIView):
+    async def post(self, request):
+        """
+        批次解鎖多個座位，只會釋放仍由本會話持有的鎖，並從會話的保留中移除。
+        """
+        seat_ids, session_id, error = _parse_seat_request(request)
+        if error:
+            return error
+        holds, seat_map_index, _, journal = _async_managers()
+
+        unlocked_seats = []
+        failed_seats = []
+        seats_by_id = await _seats_by_id(seat_ids)
+
+        candidates = []
+        for seat_id in seat_ids:
+            seat = seats_by_id.get(seat_id)
+            if seat is None:
+                failed_seats.append({'id': seat_id, 'reason': 'not found'})
+            elif seat.status not in (lockable_statuses() if redis_authoritative() else ('locked',)):
+                failed_seats.append({'id': seat.id, 'reason': 'not locked'})
+            else:
+                candidates.append(seat)
+
+        if candidates:
+            # 原子比對持有者後刪除，只會釋放本會話的鎖
+            released = set()
+            for event_id, event_candidates in _group_by_event(candidates).items():
+                released.update(await holds.release(event_id, session_id, [seat.id for seat in event_candidates]))
+            seats_to_update = []
+            for seat in candidates:
+                if seat.id in released:
+                    seat.status = 'available'
+                    seat.locked_until = None
+                    seat.locked_by_session = None
+                    seats_to_update.append(seat)
+                    unlocked_seats.append(seat.id)
+                else:
+                    failed_seats.append({'id': seat.id, 'reason': 'locked by another session or lock expired'})
+
+            if seats_to_update:
+                if redis_authoritative():
+                    await journal.released(seats_to_update)
+                else:
+                    await Seat.objects.abulk_update(seats_to_update, ['status', 'locked_until', 'locked_by_session'])
+                await seat_map_index.mark(seats_to_update, STATE_AVAILABLE)
+
+        return Response(
+            {'unlocked_seats': unlocked_seats, 'failed_seats': failed_seats},
+            status=status.HTTP_200_OK if not failed_seats else status.HTTP_207_MULTI_STATUS,
+        )
+
+
+unlock_seats = SeatUnlockView.as_view()
+
+
+class SeatMapView(AsyncAPIView):
+    async def get(self, request, event_id):
+        """
+        以精簡格式回傳場次的座位狀態，直接讀取 Redis 位元圖而不查詢資料庫。
+        ?encoding=rle (預設) 回傳 [狀態代碼, 連續長度] 列表；?encoding=binary 回傳原始 2-bit 位元圖。
+        ?layout=1 時一併回傳依序號排列的 [seat_id, row, column, price]。
+        """
+        _, seat_map_index, _, _ = _async_managers()
+        bits, layout = await seat_map_index.get(event_id)
+        # 只有在索引為空時才查詢資料庫，確認場次是否存在
+        if not layout and not await Event.objects.filter(id=event_id).aexists():
+            return _error('Event not found.', status=status.HTTP_404_NOT_FOUND)
+
+        encoding = request.query_params.get('encoding', 'rle')
+        if encoding == 'binary':
+            response = HttpResponse(bits, content_type='application/octet-stream')
+            response['X-Seat-Count'] = str(len(layout))
+            return response
+        if encoding != 'rle':
+            return _error('encoding must be "rle" or "binary".')
+
+        data = {
+            'event_id': event_id,
+            'seat_count': len(layout),
+            'states': STATE_NAMES,
+            'encoding': 'rle',
+            'runs': run_length_encode(decode_states(bits, len(layout))),
+        }
+        if request.query_params.get('layout') in ('1', 'true'):
+            data['layout'] = layout
+        return Response(data)
+
+
+seat_map = SeatMapView.as_view()
+
+
+def _parse_best_available_request(request):
+    """解析自動配位請求，回傳 (quantity, session_id, max_price, section, 錯誤回應)。"""
+    data = _request_data(request)
+    session_id = data.get('session_id')
+    if not session_id:
+        return None, None, None, None, _error('session_id is required.')
+    try:
+        quantity = int(data.get('quantity', 1))
+        max_price = None if data.get('max_price') in (None, '') else int(data['max_price'])
+    except (TypeError, ValueError):
+        return None, None, None, None, _error('quantity and max_price must be integers.')
+    if not 1 <= quantity <= MAX_QUANTITY:
+        return None, None, None, None, _error(f'quantity must be between 1 and {MAX_QUANTITY}.')
+    section = data.get('section')
+    section = None if section in (None, '') else str(section)
+    return quantity, str(session_id), max_price, section, None
+
+
+async def _row_index(seat_map_index, event_id):
+    """取得場次的 (位元圖, 行程內排索引)；座位配置未變動時只從 Redis 讀取位元圖。"""
+    bits, floor = await seat_map_index.bits_with_floor(event_id)
+    index = cached_row_index(event_id, floor)
+    if bits is None or index is None:
+        bits, layout = await seat_map_index.get(event_id)
+        sections = {
+            seat_id: section
+            async for seat_id, section in Seat.objects.filter(event_id=event_id).values_list('id', 'section')
+        }
+        index = SeatRowIndex(layout, sections)
+        store_row_index(event_id, floor, index)
+    return bits, index
+
+
+class BestAvailableView(AsyncAPIView):
+    async def post(self, request, event_id):
+        """
+        自動配位：找出同一排連續 quantity 個可選座位 (可限制票價上限與區域) 並一次鎖定。
+        以座位狀態位元圖尋找，選中的座位以全有或全無的方式取得 Redis 鎖；
+        被其他人搶先時略過這些座位重新尋找，最多 BEST_AVAILABLE_ATTEMPTS 次。
+        成功回傳 200 與鎖定的座位，找不到足夠的連續座位回傳 409。
+        """
+        quantity, session_id, max_price, section, error = _parse_best_available_request(request)
+        if error:
+            return error
+        event = await Event.objects.filter(id=event_id).only(
+            'id', 'waiting_room_enabled', 'hold_ttl_seconds', 'hold_max_seconds',
+        ).afirst()
+        if event is None:
+            return _error('Event not found.', status=status.HTTP_404_NOT_FOUND)
+        holds, seat_map_index, waiting_room, journal = _async_managers()
+        ttl_seconds, max_seconds = hold_policy(event)
+        if event.waiting_room_enabled and not await waiting_room.is_admitted(event.id, queue_token_from_request(request)):
+            return Response({'detail': 'Waiting room admission required.', 'event_id': event.id}, status=status.HTTP_403_FORBIDDEN)
+
+        bits, index = await _row_index(seat_map_index, event_id)
+        excluded = set()
+        for _ in range(BEST_AVAILABLE_ATTEMPTS):
+            slots = index.find_best(bits, quantity, max_price=max_price, section=section, exclude=excluded)
+            if slots is None:
+                break
+            ordinals = {slot.seat_id: slot.ordinal for slot in slots}
+            seat_ids = list(ordinals)
+
+            results = await holds.acquire(event_id, session_id, seat_ids, ttl_seconds, max_seconds, all_or_nothing=True)
+            conflicts = [seat_id for seat_id, code in results.items() if code == LOCK_CONFLICT]
+            if conflicts:
+                excluded.update(ordinals[seat_id] for seat_id in conflicts)
+                continue
+
+            # 位元圖可能稍微落後於資料庫 (例如回收程式尚未處理)，以資料庫狀態再確認一次
+            seats = await _seats_by_id(seat_ids)
+            stale = [seat for seat in seats.values() if seat.status not in lockable_statuses()]
+            if stale or len(seats) != len(seat_ids):
+                await holds.release(
+                    event_id, session_id, [seat_id for seat_id, code in results.items() if code == LOCK_ACQUIRED],
+                )
+                excluded.update(ordinal for seat_id, ordinal in ordinals.items() if seat_id not in seats)
+                excluded.update(ordinals[seat.id] for seat in stale)
+                # 修正落後的位元圖
+                for state in {STATUS_TO_STATE.get(seat.status, STATE_AVAILABLE) for seat in stale}:
+                    await seat_map_index.mark(
+                        [seat for seat in stale if STATUS_TO_STATE.get(seat.status, STATE_AVAILABLE) == state], state,
+                    )
+                continue
+
+            locked_until = timezone.now() + timedelta(seconds=ttl_seconds)
+            seats_to_update = [seats[seat_id] for seat_id in seat_ids]
+            for seat in seats_to_update:
+                seat.status = 'locked'
+                seat.locked_until = locked_until
+                seat.locked_by_session = session_id
+            saved = await _save_locked(seats_to_update, journal, all_or_nothing=True)
+            if len(saved) != len(seat_ids):
+                # 再確認之後才被下單或鎖定：不寫入任何座位，歸還剛取得的鎖後重新尋找
+                await holds.release(
+                    event_id, session_id, [seat_id for seat_id, code in results.items() if code == LOCK_ACQUIRED],
+                )
+                excluded.update(ordinals.values())
+                continue
+            await seat_map_index.mark(seats_to_update, STATE_LOCKED)
+
+            return Response({
+                'event_id': event_id,
+                'locked_seats': seat_ids,
+                # 票價取自座位圖佈局 (票價等級的目前價格)
+                'seats': [
+                    {'id': slot.seat_id, 'section': slot.section, 'row': slot.row, 'column': slot.column, 'price': slot.price}
+                    for slot in slots
+                ],
+                'total_price': sum(slot.price for slot in slots),
+                'locked_until': locked_until,
+                'holds': [{'event_id': event_id, 'hold_id': hold_id(event_id, session_id), 'expires_in': ttl_seconds}],
+            })
+
+        return _error(f'No {quantity} adjacent seats available.', status=status.HTTP_409_CONFLICT)
+
+
+best_available = BestAvailableView.as_view()
+
+
+def _session_from_body(request):
+    """從請求內容取得 session_id，回傳 (session_id, 錯誤回應)。"""
+    session_id = _request_data(request).get('session_id')
+    if not session_id:
+        return None, _error('session_id is required.')
+    return str(session_id), None
+
+
+async def _hold_event(event_id):
+    return await Event.objects.filter(id=event_id).only('id', 'hold_ttl_seconds', 'hold_max_seconds').afirst()
+
+
+class HoldView(AsyncAPIView):
+    async def get(self, request, event_id):
+        """查詢會話在場次的保留：保留中的座位與剩餘秒數。"""
+        session_id = request.query_params.get('session_id')
+        if not session_id:
+            return _error('session_id is required.')
+        holds, _, _, _ = _async_managers()
+        hold = await holds.get(event_id, session_id)
+        if hold is None:
+            return _error('No active hold for this session.', status=status.HTTP_404_NOT_FOUND)
+        return Response({'hold_id': hold_id(event_id, session_id), 'event_id': event_id, **hold})
+
+
+hold_detail = HoldView.as_view()
+
+
+class HoldRenewView(AsyncAPIView):
+    async def post(self, request, event_id):
+        """
+        續期 (心跳) 會話在場次的保留：一次 Lua 腳本呼叫延長所有座位鎖，一次 UPDATE 更新 locked_until
+        (redis 模式下改為更新 Redis 中的到期時間)，並遞增座位圖版本。
+        已失效 (過期或被釋放) 的座位列在 lost_seat_ids；續期不會超過場次的保留上限秒數。
+        """
+        session_id, error = _session_from_body(request)
+        if error:
+            return error
+        event = await _hold_event(event_id)
+        if event is None:
+            return _error('Event not found.', status=status.HTTP_404_NOT_FOUND)
+        holds, seat_map_index, _, journal = _async_managers()
+
+        ttl_seconds, max_seconds = hold_policy(event)
+        result = await holds.renew(event_id, session_id, ttl_seconds, max_seconds)
+        if result is None:
+            return _error('No active hold for this session.', status=status.HTTP_404_NOT_FOUND)
+        expires_in, renewed, lost = result
+
+        expires_at = timezone.now() + timedelta(seconds=expires_in)
+        if renewed and redis_authoritative():
+            await journal.locked([Seat(id=seat_id, event_id=event_id, locked_until=expires_at) for seat_id in renewed])
+        elif renewed:
+            await Seat.objects.filter(id__in=renewed, status='locked', locked_by_session=session_id).aupdate(
+                locked_until=expires_at,
+            )
+        if renewed:
+            # 座位列表含有到期時間，遞增座位圖版本讓 ETag、快取的 JSON 與 ?since= 反映續期
+            await seat_map_index.mark([Seat(id=seat_id, event_id=event_id) for seat_id in renewed], STATE_LOCKED)
+        return Response({
+            'hold_id': hold_id(event_id, session_id),
+            'event_id': event_id,
+            'seat_ids': renewed,
+            'lost_seat_ids': lost,
+            'expires_in': expires_in,
+            'expires_at': expires_at,
+        }, status=status.HTTP_200_OK if renewed else status.HTTP_410_GONE)
+
+
+renew_hold = HoldRenewView.as_view()
+
+
+class HoldReleaseView(AsyncAPIView):
+    async def post(self, request, event_id):
+        """釋放會話在場次保留的所有座位：一次 Lua 腳本呼叫、一次 UPDATE 與一次位元圖更新。"""
+        session_id, error = _session_from_body(request)
+        if error:
+            return error
+        holds, seat_map_index, _, journal = _async_managers()
+
+        released = await holds.release(event_id, session_id)
+        if released:
+            seats = [Seat(id=seat_id, event_id=event_id) for seat_id in released]
+            if redis_authoritative():
+                await journal.released(seats)
+            else:
+                await Seat.objects.filter(id__in=released, status='locked').aupdate(
+                    status='available', locked_until=None, locked_by_session=None,
+                )
+            await seat_map_index.mark(seats, STATE_AVAILABLE)
+        return Response({'hold_id': hold_id(event_id, session_id), 'event_id': event_id, 'released_seats': released})
+
+
+release_hold = HoldReleaseView.as_view()
@@ -0,0 +1,495 @@
+# booking/benchmark.py
+
+"""
+訂位熱點流程的壓力測試 (由 manage.py benchmark_booking 呼叫)。
+
+在獨立的測試資料庫中建立 N 個場次 × M 個座位，
+以多個執行緒透過 Django 測試客戶端呼叫實際的端點，反覆執行
+「鎖定座位 → 建立訂單 → 取消訂單」的流程，並統計：
+
+    - 每種操作的吞吐量與 p50 / p95 / p99 延遲
+    - 每次操作平均的資料庫查詢數與 Redis 往返次數 (pipeline 計為一次)
+    - 重複售出 (同一座位同時屬於兩張有效訂單) 的次數，必須為 0
+
+座位競爭程度 (contention)：
+    disjoint   每個執行緒只選自己的座位，沒有競爭
+    same       所有執行緒搶同一組座位
+    hot-rows   八成的請求集中在每個場次的前幾排
+
+Redis 可使用 fakeredis (預設) 或本機 Redis (會清空指定的 db)。
+lock_state 可切換座位鎖定狀態的儲存模式 (database / redis，見 lockstate.py)，比較兩者的資料庫查詢數。
+lock_nodes / lock_node_urls 把座位鎖依場次分散到多個 Redis 節點 (見 lockrouter.py)，
+可與單一節點比較；fakeredis 為同一行程內的多個獨立伺服器，實際的吞吐量差異需以多個 redis-server 量測。
+結果為 JSON，可在不同 commit 之間比較。
+"""
+
+import contextvars
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import date, time as dt_time
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+CONTENTION_MODES = ('disjoint', 'same', 'hot-rows')
+LOCK_STATE_MODES = ('database', 'redis')
+SEATS_PER_ROW = 20
+HOT_ROWS = 2
+HOT_SHARE = 0.8
+
+# 目前操作的計數器 (查詢數與 Redis 往返次數)；
+# contextvar 會跟著 async_to_sync / sync_to_async 傳遞到處理請求的執行緒
+_op_counters = contextvars.ContextVar('benchmark_op_counters', default=None)
+
+
+def _count(name):
+    counters = _op_counters.get()
+    if counters is not None:
+        counters[name] += 1
+
+
+def _count_query(execute, sql, params, many, context):
+    _count('queries')
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+@contextmanager
+def _instrumented():
+    """在測試期間計算每個連線的查詢數與 Redis 客戶端的往返次數。"""
+    patched = []
+
+    def patch(cls, name, wrapper_factory):
+        original = cls.__dict__[name]
+        setattr(cls, name, wrapper_factory(original))
+        patched.append((cls, name, original))
+
+    def counting(original):
+        def wrapper(self, *args, **kwargs):
+            _count('redis_calls')
+            return original(self, *args, **kwargs)
+        return wrapper
+
+    def async_counting(original):
+        async def wrapper(self, *args, **kwargs):
+            _count('redis_calls')
+            return await original(self, *args, **kwargs)
+        return wrapper
+
+    # 單一指令 (含 EVALSHA) 經過 execute_command；pipeline 的指令在 execute 時一次送出
+    patch(redis.client.Redis, 'execute_command', counting)
+    patch(redis.client.Pipeline, 'execute', counting)
+    patch(aioredis.client.Redis, 'execute_command', async_counting)
+    patch(aioredis.client.Pipeline, 'execute', async_counting)
+    connection_created.connect(_install_query_counter)
+    for conn in connections.all():
+        _install_query_counter(None, conn)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(_install_query_counter)
+        for conn in connections.all():
+            if _count_query in conn.execute_wrappers:
+                conn.execute_wrappers.remove(_count_query)
+        for cls, name, original in reversed(patched):
+            setattr(cls, name, original)
+
+
+@contextmanager
+def _redis_backend(mode, redis_db, lock_nodes=1, lock_node_urls=()):
+    """
+    把 booking 的 Redis 客戶端換成 fakeredis 或指定 db 的本機 Redis。
+    lock_nodes > 1 (fakeredis) 或指定 lock_node_urls (本機 Redis) 時，座位鎖依場次分散到多個節點。
+    """
+    from booking import async_views, services, views
+    from booking.lockrouter import AsyncLockRouter, LockRouter
+    from booking.locks import SeatLockManager
+    from booking.seatmap import SeatMapIndex
+    from booking.waiting_room import WaitingRoom
+    from booking.idempotency import IdempotencyStore
+    from booking.holds import HoldManager
+    from booking.lockstate import LockStateJournal
+    from booking.cancellation import OrderCanceller
+
+    if mode == 'fake':
+        import fakeredis
+        server = fakeredis.FakeServer()
+        sync_client = fakeredis.FakeStrictRedis(server=server)
+        make_async_client = lambda: fakeredis.FakeAsyncRedis(server=server)
+        lock_servers = [fakeredis.FakeServer() for _ in range(lock_nodes)] if lock_nodes > 1 else []
+        lock_node_factories = {
+            f'node{index}': (
+                lambda server=lock_server: fakeredis.FakeStrictRedis(server=server),
+                lambda server=lock_server: fakeredis.FakeAsyncRedis(server=server),
+            )
+            for index, lock_server in enumerate(lock_servers)
+        }
+    else:
+        kwargs = {'host': settings.REDIS['HOST'], 'port': settings.REDIS['PORT'], 'db': redis_db,
+                  'password': settings.REDIS.get('PASSWORD') or None}
+        sync_client = redis.StrictRedis(**kwargs)
+        sync_client.flushdb()
+        make_async_client = lambda: aioredis.StrictRedis(**kwargs)
+        lock_node_factories = {
+            f'node{index}': (
+                lambda url=url: redis.StrictRedis.from_url(url),
+                lambda url=url: aioredis.StrictRedis.from_url(url),
+            )
+            for index, url in enumerate(lock_node_urls)
+        }
+
+    if lock_node_factories:
+        lock_clients = {name: make_sync() for name, (make_sync, _) in lock_node_factories.items()}
+        if mode != 'fake':
+            for client in lock_clients.values():
+                client.flushdb()
+        lock_router = LockRouter(lock_clients, control_client=sync_client)
+    else:
+        lock_router = LockRouter.single(sync_client)
+
+    # redis.asyncio 客戶端綁定事件迴圈，每個迴圈各建一個 (與 connections.get_async_redis 相同)
+    async_clients = weakref.WeakKeyDictionary()
+    async_routers = weakref.WeakKeyDictionary()
+
+    def get_async_redis():
+        import asyncio
+        loop = asyncio.get_running_loop()
+        if loop not in async_clients:
+            async_clients[loop] = make_async_client()
+        return async_clients[loop]
+
+    def get_async_lock_router(default_client=None):
+        import asyncio
+        default_client = default_client or get_async_redis()
+        if not lock_node_factories:
+            return AsyncLockRouter.single(default_client)
+        loop = asyncio.get_running_loop()
+        if loop not in async_routers:
+            async_routers[loop] = AsyncLockRouter(
+                {name: make_async() for name, (_, make_async) in lock_node_factories.items()},
+                control_client=default_client,
+            )
+        return async_routers[loop]
+
+    lock_manager = SeatLockManager(lock_router)
+    lock_journal = LockStateJournal(sync_client)
+    seat_map_index = SeatMapIndex(sync_client, lock_manager)
+    instances = {
+        'lock_manager': lock_manager,
+        'hold_manager': HoldManager(lock_router),
+        'lock_journal': lock_journal,
+        'seat_map_index': seat_map_index,
+        'order_canceller': OrderCanceller(lock_manager, lock_journal, seat_map_index),
+        'waiting_room': WaitingRoom(sync_client),
+        'idempotency_store': IdempotencyStore(sync_client, 'orders'),
+    }
+    # views.py 以 from .services import ... 取得實例，兩個模組都要替換
+    replacements = [
+        (services, 'redis_client', sync_client),
+        (views, 'redis_instance', sync_client),
+        *((module, name, value) for module in (services, views) for name, value in instances.items()),
+        (async_views, 'get_async_redis', get_async_redis),
+        (async_views, 'get_async_lock_router', get_async_lock_router),
+    ]
+    originals = [(module, name, getattr(module, name)) for module, name, _ in replacements]
+    for module, name, value in replacements:
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for module, name, value in originals:
+            setattr(module, name, value)
+
+
+@contextmanager
+def _benchmark_database():
+    """建立獨立的測試資料庫；SQLite 改用暫存檔並等待鎖，讓多個執行緒可以同時寫入。"""
+    settings_dict = connection.settings_dict
+    tmpdir = None
+    if connection.vendor == 'sqlite':
+        tmpdir = tempfile.TemporaryDirectory()
+        settings_dict.setdefault('TEST', {})['NAME'] = f"{tmpdir.name}/benchmark.sqlite3"
+        options = settings_dict.setdefault('OPTIONS', {})
+        options.setdefault('timeout', 30)
+        options.setdefault('transaction_mode', 'IMMEDIATE')
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    old_config = runner.setup_databases()
+    try:
+        yield
+    finally:
+        connections.close_all()
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+
+def seed(events, seats_per_event):
+    """建立測試用場地、場次與座位，回傳 {event_id: [依排分組的座位 ID 列表]}。"""
+    from booking.models import Venue, Event, Seat
+
+    venue = Venue.objects.create(name=f'Benchmark {uuid.uuid4().hex[:8]}', capacity=seats_per_event)
+    Event.objects.bulk_create([
+        Event(venue=venue, name=f'Benchmark event {i}', event_date=date(2030, 1, 1),
+              event_time=dt_time(i % 24, (i // 24) % 60), base_price=100)
+        for i in range(events)
+    ])
+    event_ids = list(Event.objects.filter(venue=venue).order_by('id').values_list('id', flat=True))
+    Seat.objects.bulk_create([
+        Seat(event_id=event_id, row=f'R{n // SEATS_PER_ROW:03d}', column=str(n % SEATS_PER_ROW + 1), price=100)
+        for event_id in event_ids for n in range(seats_per_event)
+    ], batch_size=2000)
+
+    rows_by_event = {event_id: defaultdict(list) for event_id in event_ids}
+    for seat_id, event_id, row in Seat.objects.filter(event_id__in=event_ids).order_by('id').values_list('id', 'event_id', 'row'):
+        rows_by_event[event_id][row].append(seat_id)
+    return {event_id: [rows[row] for row in sorted(rows)] for event_id, rows in rows_by_event.items()}
+
+
+class SeatPicker:
+    """依競爭模式為每個執行緒挑選要搶的座位。"""
+
+    def __init__(self, layout, mode, workers, seats_per_order):
+        self.layout = layout
+        self.mode = mode
+        self.workers = workers
+        self.seats_per_order = seats_per_order
+        self.event_ids = sorted(layout)
+
+    def pick(self, worker, cycle, rng):
+        """回傳 (event_id, 座位 ID 列表)。"""
+        k = self.seats_per_order
+        if self.mode == 'same':
+            event_id = self.event_ids[0]
+            return event_id, [seat for row in self.layout[event_id] for seat in row][:k]
+
+        if self.mode == 'disjoint':
+            # 每個執行緒固定使用一個場次中屬於自己的座位區段
+            event_id = self.event_ids[worker % len(self.event_ids)]
+            seats = [seat for row in self.layout[event_id] for seat in row]
+            sharers = len(range(worker % len(self.event_ids), self.workers, len(self.event_ids)))
+            share = len(seats) // max(sharers, 1)
+            start = (worker // len(self.event_ids)) * share
+            own = seats[start:start + share]
+            if len(own) < k:
+                raise ValueError('Not enough seats for disjoint mode; add seats or reduce workers.')
+            offset = (cycle * k) % (len(own) - k + 1)
+            return event_id, own[offset:offset + k]
+
+        event_id = rng.choice(self.event_ids)
+        rows = self.layout[event_id]
+        if rng.random() < HOT_SHARE:
+            row = rng.choice(rows[:HOT_ROWS])
+        else:
+            row = rng.choice(rows[HOT_ROWS:] or rows)
+        start = rng.randrange(0, max(len(row) - k, 0) + 1)
+        return event_id, row[start:start + k]
+
+
+class Recorder:
+    """收集每次操作的延遲、狀態碼與計數 (執行緒安全)。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.status_codes = defaultdict(Counter)
+        self.counters = defaultdict(Counter)
+        self.errors = Counter()
+        # 每個座位的持有區間 [訂單成立, 送出取消)，用來偵測重複售出
+        self.holdings = defaultdict(list)
+
+    def call(self, name, func, *args, **kwargs):
+        counters = Counter()
+        token = _op_counters.set(counters)
+        started = time.perf_counter()
+        try:
+            response = func(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.errors[name] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            _op_counters.reset(token)
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            self.status_codes[name][response.status_code] += 1
+            self.counters[name].update(counters)
+        return response
+
+    def hold(self, seat_ids, start):
+        holding = [start, None]
+        with self._lock:
+            for seat_id in seat_ids:
+                self.holdings[seat_id].append(holding)
+        return holding
+
+    def double_bookings(self):
+        """同一座位有兩個持有區間重疊的次數。"""
+        count = 0
+        for intervals in self.holdings.values():
+            ordered = sorted(intervals, key=lambda interval: interval[0])
+            for previous, current in zip(ordered, ordered[1:]):
+                if previous[1] is None or current[0] < previous[1]:
+                    count += 1
+        return count
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def _worker(index, picker, recorder, cycles, cancel_ratio, seed_value):
+    client = Client()
+    rng = random.Random(seed_value + index)
+    session_id = f"bench-{index}-{uuid.uuid4().hex[:8]}"
+    completed = 0
+    try:
+        for cycle in range(cycles):
+            event_id, seat_ids = picker.pick(index, cycle, rng)
+            body = {'seat_ids': seat_ids, 'session_id': session_id}
+            response = recorder.call('lock', client.post, '/api/seats/lock/', body, content_type='application/json')
+            locked = response.json().get('locked_seats', []) if response.status_code in (200, 207) else []
+            if response.status_code != 200:
+                if locked:
+                    recorder.call('unlock', client.post, '/api/seats/unlock/',
+                                  {'seat_ids': locked, 'session_id': session_id}, content_type='application/json')
+                continue
+
+            response = recorder.call('order', client.post, '/api/orders/', {
+                'event_id': event_id, 'seat_ids': seat_ids, 'buyer_name': 'benchmark', 'session_id': session_id,
+            }, content_type='application/json')
+            if response.status_code != 201:
+                recorder.call('unlock', client.post, '/api/seats/unlock/', body, content_type='application/json')
+                continue
+            holding = recorder.hold(seat_ids, time.perf_counter())
+            completed += 1
+
+            if rng.random() < cancel_ratio:
+                holding[1] = time.perf_counter()
+                recorder.call('cancel', client.post, f"/api/orders/{response.json()['id']}/cancel/")
+    finally:
+        connections.close_all()
+    return completed
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _consistency_check():
+    """結束後比對資料庫：已登記的座位數應等於有效訂單的訂單項數。"""
+    from booking.models import Seat, OrderItem
+
+    registered = Seat.objects.filter(status='registered').count()
+    active_items = OrderItem.objects.filter(order__status='registered').count()
+    return abs(registered - active_items)
+
+
+def run_benchmark(events=2, seats=500, workers=8, cycles=50, contention='hot-rows', seats_per_order=2,
+                  cancel_ratio=1.0, redis_mode='fake', redis_db=15, seed_value=0, lock_state='database',
+                  lock_nodes=1, lock_node_urls=()):
+    """執行一次壓力測試並回傳可輸出成 JSON 的結果。"""
+    if contention not in CONTENTION_MODES:
+        raise ValueError(f'contention must be one of {", ".join(CONTENTION_MODES)}.')
+    if lock_state not in LOCK_STATE_MODES:
+        raise ValueError(f'lock_state must be one of {", ".join(LOCK_STATE_MODES)}.')
+
+    import logging
+    request_logger = logging.getLogger('django.request')
+    previous_level = request_logger.level
+    # 207 / 400 等預期中的失敗回應不需要逐筆記錄
+    request_logger.setLevel(logging.ERROR)
+
+    local_cache = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    lock_state_settings = {**settings.SEAT_LOCK_STATE, 'MODE': lock_state}
+    try:
+        with _benchmark_database(), _redis_backend(redis_mode, redis_db, lock_nodes, lock_node_urls), \
+                override_settings(CACHES=local_cache, SEAT_LOCK_STATE=lock_state_settings):
+            layout = seed(events, seats)
+            picker = SeatPicker(layout, contention, workers, seats_per_order)
+            recorder = Recorder()
+            with _instrumented():
+                started = time.perf_counter()
+                completed_counts = []
+                threads = []
+                for index in range(workers):
+                    thread = threading.Thread(
+                        target=lambda i=index: completed_counts.append(
+                            _worker(i, picker, recorder, cycles, cancel_ratio, seed_value)
+                        ),
+                    )
+                    threads.append(thread)
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                duration = time.perf_counter() - started
+            inconsistent = _consistency_check()
+            vendor = connection.vendor
+    finally:
+        request_logger.setLevel(previous_level)
+
+    operations = {}
+    for name, latencies in sorted(recorder.latencies.items()):
+        ordered = sorted(latencies)
+        count = len(ordered)
+        operations[name] = {
+            'count': count,
+            'errors': recorder.errors[name],
+            'status_codes': {str(code): n for code, n in sorted(recorder.status_codes[name].items())},
+            'throughput_per_second': round(count / duration, 2) if duration else None,
+            'latency_ms': {
+                'mean': round(statistics.fmean(ordered) * 1000, 3),
+                'p50': round(_percentile(ordered, 0.50) * 1000, 3),
+                'p95': round(_percentile(ordered, 0.95) * 1000, 3),
+                'p99': round(_percentile(ordered, 0.99) * 1000, 3),
+                'max': round(ordered[-1] * 1000, 3),
+            },
+            'queries_per_operation': round(recorder.counters[name]['queries'] / count, 2),
+            'redis_calls_per_operation': round(recorder.counters[name]['redis_calls'] / count, 2),
+        }
+
+    completed = sum(completed_counts)
+    return {
+        'revision': _git_revision(),
+        'environment': {'database': vendor, 'redis': redis_mode},
+        'config': {
+            'events': events, 'seats_per_event': seats, 'workers': workers, 'cycles_per_worker': cycles,
+            'contention': contention, 'seats_per_order': seats_per_order, 'cancel_ratio': cancel_ratio,
+            'seed': seed_value, 'lock_state': lock_state,
+            'lock_nodes': len(lock_node_urls) if redis_mode == 'real' and lock_node_urls else lock_nodes,
+        },
+        'duration_seconds': round(duration, 3),
+        'orders_completed': completed,
+        'orders_per_second': round(completed / duration, 2) if duration else None,
+        'double_bookings': recorder.double_bookings(),
+        'inconsistent_seats': inconsistent,
+        'operations': operations,
+    }
@@ -0,0 +1,166 @@
+# booking/best_available.py
+
+"""
+「最佳可選座位」自動配位。
+
+客戶端只需提供張數 (以及票價上限、區域)，由伺服器在座位狀態位元圖中
+找出同一排連續的 N 個可選座位並一次鎖定，不必下載整張座位圖、
+在瀏覽器中搜尋、鎖定失敗再重試。
+
+SeatRowIndex 是每個場次的行程內索引：依 (區域, 排) 分組，排內依座位號的自然順序排列，
+記錄每個座位在位元圖中的序號。索引只與座位配置有關，快取在行程內，
+以座位圖的 floor (座位新增 / 刪除時變動，見 seatmap.py) 區分版本。
+
+各排的空位區間 (free runs) 也保存在索引中，並記下算出區間時該排在位元圖中的位元組。
+位元圖依 (排, 座位號) 排序 (見 seatmap._index_rows)，每排佔一段連續的位元組；
+配位時只比對各排的位元組 (C 層級的 bytes 比較)，只有被鎖定 / 解鎖 / 下單 / 取消
+(seat_map_index.mark，任何行程) 改到的排才重新解碼，其餘排沿用上次的空位區間。
+最長空位區間小於張數的排直接略過，不必逐一檢查座位。
+
+「最佳」的定義：
+    1. 排號越前面越好 (自然排序，R2 在 R10 之前)
+    2. 同一排中越靠近該排中央越好
+座位號皆為數字時，號碼不連續 (例如走道) 的兩個座位不視為相鄰。
+"""
+
+import re
+from collections import namedtuple
+
+from .cache import LocalLRU
+from .seatmap import STATE_AVAILABLE
+
+# 一次最多配位的張數
+MAX_QUANTITY = 10
+# 行程內索引的快取秒數與場次數上限
+INDEX_TIMEOUT = 300
+INDEX_MAX_ENTRIES = 256
+
+SeatSlot = namedtuple('SeatSlot', ['ordinal', 'seat_id', 'row', 'column', 'price', 'section'])
+
+_natural_re = re.compile(r'(\d+)')
+
+
+def natural_key(value):
+    """'R2' < 'R10'、'9' < '10' 的自然排序鍵。"""
+    return tuple(int(part) if part.isdigit() else part for part in _natural_re.split(str(value)))
+
+
+def _adjacent(left, right):
+    if left.column.isdigit() and right.column.isdigit():
+        return int(right.column) == int(left.column) + 1
+    return True
+
+
+class SeatRowIndex:
+    """場次的 (區域, 排) -> 依座位號排序的座位列表、每排的相鄰區段，以及各排的空位區間快取。"""
+
+    def __init__(self, layout, sections):
+        """
+        layout 為座位圖索引的 [seat_id, row, column, price] 列表 (索引即序號)，
+        sections 為 {seat_id: 區域名稱}。
+        """
+        rows = {}
+        for ordinal, (seat_id, row, column, price) in enumerate(layout):
+            section = sections.get(seat_id, '')
+            rows.setdefault((section, row), []).append(
+                SeatSlot(ordinal, seat_id, row, str(column), price, section)
+            )
+
+        self.seat_count = len(layout)
+        # 每一排再切成實體上相鄰的區段 (走道兩側視為不同區段)
+        self.rows = []
+        # 每排在位元圖中的位元組範圍 [開始, 結束)
+        self.spans = []
+        for (section, row) in sorted(rows, key=lambda key: (natural_key(key[1]), natural_key(key[0]))):
+            slots = sorted(rows[(section, row)], key=lambda slot: natural_key(slot.column))
+            segments = [[slots[0]]]
+            for previous, current in zip(slots, slots[1:]):
+                if _adjacent(previous, current):
+                    segments[-1].append(current)
+                else:
+                    segments.append([current])
+            self.rows.append((section, row, len(slots), segments))
+            ordinals = [slot.ordinal for slot in slots]
+            self.spans.append((min(ordinals) // 4, max(ordinals) // 4 + 1))
+        # 排的索引 -> (算出空位區間時該排的位元組, 空位區間列表, 最長區間長度)
+        self._free_runs = {}
+
+    def _row_free_runs(self, position, bits):
+        """
+        取得第 position 排的空位區間，回傳 ([(區段在排中的起點, 區段, 開始, 結束)...], 最長區間長度)。
+        空位區間為區段中連續、狀態為可選且有票價的座位 [開始, 結束)。
+        """
+        start, end = self.spans[position]
+        chunk = bits[start:end]
+        cached = self._free_runs.get(position)
+        if cached is not None and cached[0] == chunk:
+            return cached[1], cached[2]
+
+        runs = []
+        longest = 0
+        offset = 0
+        for segment in self.rows[position][3]:
+            run_start = None
+            for i, slot in enumerate(segment):
+                byte = slot.ordinal // 4 - start
+                state = (chunk[byte] >> (6 - 2 * (slot.ordinal % 4))) & 0b11 if byte < len(chunk) else STATE_AVAILABLE
+                if state == STATE_AVAILABLE and slot.price is not None:
+                    if run_start is None:
+                        run_start = i
+                    continue
+                if run_start is not None:
+                    runs.append((offset, segment, run_start, i))
+                    longest = max(longest, i - run_start)
+                    run_start = None
+            if run_start is not None:
+                runs.append((offset, segment, run_start, len(segment)))
+                longest = max(longest, len(segment) - run_start)
+            offset += len(segment)
+        self._free_runs[position] = (chunk, runs, longest)
+        return runs, longest
+
+    def find_best(self, bits, quantity, max_price=None, section=None, exclude=()):
+        """
+        依目前的座位狀態位元圖找出最佳的 quantity 個連續座位，回傳 SeatSlot 列表，找不到時回傳 None。
+        exclude 為要略過的序號 (例如剛被其他人搶先鎖定的座位)。
+        """
+        for position, (row_section, row, row_length, segments) in enumerate(self.rows):
+            if section is not None and row_section != section:
+                continue
+            runs, longest = self._row_free_runs(position, bits)
+            if longest < quantity:
+                continue
+            best = None
+            for offset, segment, run_begin, run_end in runs:
+                if run_end - run_begin < quantity:
+                    continue
+                # 以滑動視窗找出空位區間中所有連續 quantity 個符合條件的座位
+                window_start = None
+                for i in range(run_begin, run_end):
+                    slot = segment[i]
+                    if slot.ordinal in exclude or (max_price is not None and slot.price > max_price):
+                        window_start = None
+                        continue
+                    if window_start is None:
+                        window_start = i
+                    if i - window_start + 1 >= quantity:
+                        first = i - quantity + 1
+                        # 視窗中心與該排中心的距離，越小越好
+                        distance = abs(offset + (first + i) / 2 - (row_length - 1) / 2)
+                        if best is None or distance < best[0]:
+                            best = (distance, segment[first:i + 1])
+            if best is not None:
+                return best[1]
+        return None
+
+
+_indexes = LocalLRU()
+
+
+def cached_row_index(event_id, floor):
+    """取得行程內快取的索引，座位配置變動 (floor 不同) 或過期時回傳 None。"""
+    return _indexes.get((event_id, floor))
+
+
+def store_row_index(event_id, floor, index):
+    _indexes.set((event_id, floor), index, INDEX_TIMEOUT, INDEX_MAX_ENTRIES)
@@ -0,0 +1,243 @@
+# booking/cache.py
+
+"""
+場次 (Event) 與場地 (Venue) 的讀取快取，以及每個場次的票價等級表。
+
+開賣期間場次與場地幾乎不會變動，卻在每次下單、讀取座位列表時以主鍵查詢。
+這裡在資料庫前加上兩層快取：
+
+    1. 行程內 LRU (local)：完全不需網路往返，但其他行程的修改無法通知到，
+       因此只保留很短的時間 (LOCAL_TIMEOUT 秒)。
+    2. Django cache framework (shared，預設為 Redis)：所有行程共用，
+       模型 save / delete 時由 signals 刪除。
+
+兩層都存放 pickle 後的模型實例，每次讀取都還原成新的實例，
+呼叫端修改取得的物件不會影響快取內容。場次快取會一併帶入所屬場地 (select_related)。
+票價等級表 (price_table_cache) 以場次 ID 為鍵，存放 {tier_id: price}，供計算票價時不必查詢資料庫。
+共用快取無法連線時記錄警告並直接查詢資料庫，不影響主要流程。
+QuerySet.update() 等不觸發 signals 的批次修改需自行呼叫 invalidate()。
+
+設定 (settings.BOOKING_ENTITY_CACHE，皆可省略)：
+    ENABLED             是否啟用，預設 True
+    CACHE_ALIAS         使用的 Django 快取，預設 'default'
+    TIMEOUT             共用快取秒數，預設 300
+    LOCAL_TIMEOUT       行程內快取秒數，預設 5
+    LOCAL_MAX_ENTRIES   行程內快取筆數上限，預設 1024
+"""
+
+import logging
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .instrumentation import register_collector
+from .models import Venue, Event, PriceTier
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 300,
+    'LOCAL_TIMEOUT': 5,
+    'LOCAL_MAX_ENTRIES': 1024,
+}
+
+# 模型欄位變動時遞增，避免讀到舊版本 pickle 的實例
+KEY_VERSION = 3
+
+
+def _setting(name):
+    return getattr(settings, 'BOOKING_ENTITY_CACHE', {}).get(name, DEFAULTS[name])
+
+
+class LocalLRU:
+    """執行緒安全、每筆帶有到期時間的行程內 LRU 快取。"""
+
+    def __init__(self):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout, max_entries):
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = LocalLRU()
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_stats():
+    """回傳本行程的命中 / 未命中計數 (local_hits, shared_hits, misses, errors)。"""
+    with _stats_lock:
+        return {name: _stats[name] for name in ('local_hits', 'shared_hits', 'misses', 'errors')}
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _collect_metrics():
+    # 在 /metrics 輸出本行程的命中 / 未命中計數
+    lines = [
+        '# HELP booking_entity_cache_lookups_total Entity cache lookups by result.',
+        '# TYPE booking_entity_cache_lookups_total counter',
+    ]
+    for result, count in cache_stats().items():
+        lines.append(f'booking_entity_cache_lookups_total{{result="{result}"}} {count}')
+    return lines
+
+
+register_collector(_collect_metrics)
+
+
+class EntityCache:
+    """以主鍵讀取單一模型實例的兩層快取。"""
+
+    def __init__(self, model, select_related=()):
+        self.model = model
+        self.select_related = select_related
+
+    def key(self, pk):
+        return f"entity:{self.model._meta.label_lower}:{pk}:v{KEY_VERSION}"
+
+    def _load(self, pk):
+        queryset = self.model.objects.all()
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        return queryset.get(pk=pk)
+
+    def get(self, pk):
+        """
+        依主鍵取得實例，依序查詢行程內快取、共用快取與資料庫。
+        不存在時拋出 model.DoesNotExist (不快取不存在的結果)。
+        """
+        if not _setting('ENABLED'):
+            return self._load(pk)
+
+        key = self.key(pk)
+        data = _local.get(key)
+        if data is not None:
+            _count('local_hits')
+            return pickle.loads(data)
+
+        shared = caches[_setting('CACHE_ALIAS')]
+        try:
+            data = shared.get(key)
+        except Exception:
+            _count('errors')
+            logger.warning('Entity cache read failed for %s', key, exc_info=True)
+            data = None
+        if data is not None:
+            _count('shared_hits')
+        else:
+            _count('misses')
+            instance = self._load(pk)
+            data = pickle.dumps(instance, pickle.HIGHEST_PROTOCOL)
+            try:
+                shared.set(key, data, _setting('TIMEOUT'))
+            except Exception:
+                _count('errors')
+                logger.warning('Entity cache write failed for %s', key, exc_info=True)
+
+        _local.set(key, data, _setting('LOCAL_TIMEOUT'), _setting('LOCAL_MAX_ENTRIES'))
+        return pickle.loads(data)
+
+    def invalidate(self, *pks):
+        """刪除指定主鍵在兩層快取中的資料 (其他行程的行程內快取於 LOCAL_TIMEOUT 後過期)。"""
+        keys = [self.key(pk) for pk in pks]
+        if not keys:
+            return
+        for key in keys:
+            _local.delete(key)
+        try:
+            caches[_setting('CACHE_ALIAS')].delete_many(keys)
+        except Exception:
+            _count('errors')
+            logger.warning('Entity cache invalidation failed for %s', keys, exc_info=True)
+
+
+class PriceTableCache(EntityCache):
+    """以場次 ID 讀取該場次的票價等級表 {tier_id: price} (場次沒有等級時為空 dict)。"""
+
+    def __init__(self):
+        super().__init__(PriceTier)
+
+    def key(self, event_id):
+        return f"pricetable:{event_id}:v{KEY_VERSION}"
+
+    def _load(self, event_id):
+        return dict(PriceTier.objects.filter(event_id=event_id).values_list('id', 'price'))
+
+
+venue_cache = EntityCache(Venue)
+event_cache = EntityCache(Event, select_related=('venue',))
+price_table_cache = PriceTableCache()
+
+
+def _invalidate_now_and_on_commit(entity_cache, pks):
+    # 交易提交前先刪除一次，提交後再刪一次，
+    # 避免其他請求在提交前讀到舊資料並重新寫回快取
+    entity_cache.invalidate(*pks)
+    transaction.on_commit(lambda: entity_cache.invalidate(*pks))
+
+
+@receiver([post_save, post_delete], sender=Venue, dispatch_uid='booking_cache_venue_changed')
+def venue_changed(sender, instance, **kwargs):
+    _invalidate_now_and_on_commit(venue_cache, [instance.pk])
+    # 場次快取內含所屬場地，一併刪除
+    event_ids = list(Event.objects.filter(venue_id=instance.pk).values_list('id', flat=True))
+    if event_ids:
+        _invalidate_now_and_on_commit(event_cache, event_ids)
+
+
+@receiver([post_save, post_delete], sender=Event, dispatch_uid='booking_cache_event_changed')
+def event_changed(sender, instance, **kwargs):
+    _invalidate_now_and_on_commit(event_cache, [instance.pk])
+
+
+@receiver([post_save, post_delete], sender=PriceTier, dispatch_uid='booking_cache_price_tier_changed')
+def price_tier_changed(sender, instance, **kwargs):
+    _invalidate_now_and_on_commit(price_table_cache, [instance.event_id])
+
+
+def invalidate_price_tables(*event_ids):
+    """bulk_update 等不觸發 signals 的票價修改後呼叫。"""
+    _invalidate_now_and_on_commit(price_table_cache, event_ids)
@@ -0,0 +1,122 @@
+# booking/cancellation.py
+
+"""
+以集合操作批次取消訂單 (單筆訂單、訂單列表或整個場次)。
+
+每一批訂單在一個短交易內完成：
+    1. SELECT ... FOR UPDATE 鎖定仍為 registered 的訂單 (依 id 順序)
+    2. SELECT ... FOR UPDATE 依 id 順序鎖定其座位 (與建立訂單相同的順序，避免死結)
+    3. 一次 UPDATE 釋放座位、一次 DELETE 刪除訂單項、一次 UPDATE 把訂單改為 cancelled
+交易提交後，再以 pipeline 清除座位鎖 (每個場次一次 DEL) 並更新座位狀態位元圖。
+
+每批各自提交，大量取消不會長時間持有行鎖；批次之間可暫停，讓選座與下單流量先行。
+只會處理仍為 registered 的訂單，中斷後重新執行即從尚未取消的訂單繼續。
+"""
+
+import time
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Seat, Order, OrderItem
+from .seatmap import STATE_AVAILABLE
+
+# 取消訂單時會被釋放的座位狀態
+RELEASABLE_STATUSES = ('registered', 'locked')
+
+
+@dataclass
+class CancellationProgress:
+    """批次取消的累計進度；last_order_id 為已處理的最大訂單 ID。"""
+    orders: int = 0
+    seats: int = 0
+    batches: int = 0
+    last_order_id: int = 0
+
+
+class OrderCanceller:
+    def __init__(self, lock_manager, lock_journal, seat_map_index):
+        self.lock_manager = lock_manager
+        self.lock_journal = lock_journal
+        self.seat_map_index = seat_map_index
+
+    def cancel_rows(self, order_ids):
+        """
+        在呼叫端的交易中取消已鎖定的訂單，回傳被釋放的座位 (只載入 id 與 event_id)。
+        交易提交後須以 release() 清除 Redis 中的狀態。
+        """
+        seats = list(
+            Seat.objects.select_for_update(of=('self',))
+            .filter(orderitem__order_id__in=order_ids, status__in=RELEASABLE_STATUSES)
+            .order_by('id')
+            .only('id', 'event_id')
+        )
+        if seats:
+            Seat.objects.filter(id__in=[seat.id for seat in seats]).update(
+                status='available', locked_until=None, locked_by_session=None
+            )
+        OrderItem.objects.filter(order_id__in=order_ids).delete()
+        # update() 不會觸發 auto_now，一併寫入更新時間
+        Order.objects.filter(id__in=order_ids).update(status='cancelled', updated_at=timezone.now())
+        return seats
+
+    def release(self, seats):
+        """清除座位鎖並把座位在位元圖中改回可選，場次的座位鎖在其他節點時各自一次 DEL。"""
+        if not seats:
+            return
+        by_event = {}
+        for seat in seats:
+            by_event.setdefault(seat.event_id, []).append(seat.id)
+        for event_id, seat_ids in by_event.items():
+            self.lock_manager.clear_many(event_id, seat_ids)
+        pipe = self.lock_journal.client.pipeline(transaction=False)
+        self.lock_journal.released(seats, pipeline=pipe)
+        self.seat_map_index.mark(seats, STATE_AVAILABLE, pipeline=pipe)
+        pipe.execute()
+
+    def cancel_batch(self, order_ids):
+        """取消一批訂單 (略過已不是 registered 的訂單)，回傳 (取消的訂單 ID, 釋放的座位)。"""
+        with transaction.atomic():
+            locked_ids = list(
+                Order.objects.select_for_update()
+                .filter(id__in=order_ids, status='registered')
+                .order_by('id')
+                .values_list('id', flat=True)
+            )
+            seats = self.cancel_rows(locked_ids) if locked_ids else []
+        self.release(seats)
+        return locked_ids, seats
+
+    def cancel(self, order_ids=None, event_id=None, batch_size=200, pause=0.0, after_id=0, progress=None):
+        """
+        分批取消 order_ids 中的訂單，或 event_id 場次的所有訂單，回傳 CancellationProgress。
+        依訂單 ID 遞增處理，after_id 可從上次回報的 last_order_id 之後繼續；
+        每批完成後呼叫 progress(CancellationProgress)，並暫停 pause 秒。
+        """
+        if order_ids is None and event_id is None:
+            raise ValueError('Either order_ids or event_id is required.')
+        orders = Order.objects.filter(status='registered')
+        if order_ids is not None:
+            orders = orders.filter(id__in=list(order_ids))
+        if event_id is not None:
+            orders = orders.filter(event_id=event_id)
+
+        result = CancellationProgress(last_order_id=after_id)
+        while True:
+            batch = list(
+                orders.filter(id__gt=result.last_order_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not batch:
+                return result
+            cancelled, seats = self.cancel_batch(batch)
+            result.orders += len(cancelled)
+            result.seats += len(seats)
+            result.batches += 1
+            result.last_order_id = batch[-1]
+            if progress is not None:
+                progress(result)
+            if len(batch) < batch_size:
+                return result
+            if pause:
+                time.sleep(pause)
@@ -0,0 +1,171 @@
+# booking/connections.py
+
+"""
+共用的 Redis 連線池與連線健康檢查。
+
+所有模組都應從這裡取得 Redis 客戶端，不要自行建立 StrictRedis：
+
+    redis_client         同步客戶端 (views、serializers、回收程式與管理指令)
+    get_async_redis()    目前事件迴圈的 redis.asyncio 客戶端 (async 視圖與 SSE 推送)
+    lock_router          座位鎖與保留的路由器 (依場次分配節點，見 lockrouter.py)
+    get_async_lock_router()  lock_router 的 async 版本
+
+連線參數來自 settings.REDIS (預設由 REDIS_HOST / REDIS_PORT 等環境變數設定)；
+座位鎖節點來自 settings.REDIS_LOCK_NODES / REDIS_LOCK_CLUSTER_URL，未設定時與 redis_client 相同。
+同步客戶端使用 BlockingConnectionPool：連線數達上限時等待 POOL_TIMEOUT 秒，
+不會無限制地建立新連線。async 客戶端另有上限 ASYNC_MAX_CONNECTIONS；
+SSE 推送在每個事件迴圈只佔用其中一條連線做 pub/sub 訂閱 (見 streaming.py)。
+
+資料庫的持續連線 (CONN_MAX_AGE) 與連線健康檢查在 settings.DATABASES 設定。
+"""
+
+import time
+import weakref
+import asyncio
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.db import connection
+
+from .instrumentation import InstrumentedRedis, InstrumentedAsyncRedis
+from .lockrouter import AsyncLockRouter, LockRouter
+
+
+def _timeout_kwargs():
+    config = settings.REDIS
+    return {
+        'socket_timeout': config['SOCKET_TIMEOUT'],
+        'socket_connect_timeout': config['SOCKET_CONNECT_TIMEOUT'],
+        'health_check_interval': config['HEALTH_CHECK_INTERVAL'],
+    }
+
+
+def _redis_kwargs():
+    config = settings.REDIS
+    return {
+        'host': config['HOST'],
+        'port': config['PORT'],
+        'db': config['DB'],
+        'password': config.get('PASSWORD') or None,
+        **_timeout_kwargs(),
+    }
+
+
+redis_pool = redis.BlockingConnectionPool(
+    max_connections=settings.REDIS['MAX_CONNECTIONS'],
+    timeout=settings.REDIS['POOL_TIMEOUT'],
+    **_redis_kwargs(),
+)
+# 指令數與耗時會計入目前請求的統計 (見 instrumentation.py)
+redis_client = InstrumentedRedis(connection_pool=redis_pool)
+
+# redis.asyncio 的連線綁定在建立它的事件迴圈上，因此每個事件迴圈各有一個客戶端
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis():
+    """取得目前事件迴圈共用的 redis.asyncio 客戶端 (須在事件迴圈中呼叫)。"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        pool = aioredis.ConnectionPool(
+            max_connections=settings.REDIS['ASYNC_MAX_CONNECTIONS'],
+            **_redis_kwargs(),
+        )
+        client = InstrumentedAsyncRedis(connection_pool=pool)
+        _async_clients[loop] = client
+    return client
+
+
+def _build_lock_router():
+    if settings.REDIS_LOCK_CLUSTER_URL:
+        from redis.cluster import RedisCluster
+        return LockRouter({'cluster': RedisCluster.from_url(settings.REDIS_LOCK_CLUSTER_URL, **_timeout_kwargs())})
+    if not settings.REDIS_LOCK_NODES:
+        return LockRouter.single(redis_client)
+    nodes = {
+        name: InstrumentedRedis(connection_pool=redis.BlockingConnectionPool.from_url(
+            url, max_connections=settings.REDIS['MAX_CONNECTIONS'], timeout=settings.REDIS['POOL_TIMEOUT'],
+            **_timeout_kwargs(),
+        ))
+        for name, url in settings.REDIS_LOCK_NODES.items()
+    }
+    return LockRouter(nodes, control_client=redis_client, draining=settings.REDIS_LOCK_DRAINING)
+
+
+lock_router = _build_lock_router()
+
+_async_lock_routers = weakref.WeakKeyDictionary()
+
+
+def get_async_lock_router(default_client=None):
+    """
+    取得目前事件迴圈的座位鎖路由器 (須在事件迴圈中呼叫)。
+    未設定分區時所有鎖使用 default_client (預設為 get_async_redis())。
+    """
+    default_client = default_client or get_async_redis()
+    if not settings.REDIS_LOCK_CLUSTER_URL and not settings.REDIS_LOCK_NODES:
+        return AsyncLockRouter.single(default_client)
+    loop = asyncio.get_running_loop()
+    router = _async_lock_routers.get(loop)
+    if router is None:
+        if settings.REDIS_LOCK_CLUSTER_URL:
+            from redis.asyncio.cluster import RedisCluster
+            cluster = RedisCluster.from_url(settings.REDIS_LOCK_CLUSTER_URL, **_timeout_kwargs())
+            router = AsyncLockRouter({'cluster': cluster})
+        else:
+            nodes = {
+                name: InstrumentedAsyncRedis(connection_pool=aioredis.ConnectionPool.from_url(
+                    url, max_connections=settings.REDIS['ASYNC_MAX_CONNECTIONS'], **_timeout_kwargs(),
+                ))
+                for name, url in settings.REDIS_LOCK_NODES.items()
+            }
+            router = AsyncLockRouter(nodes, control_client=default_client, draining=settings.REDIS_LOCK_DRAINING)
+        _async_lock_routers[loop] = router
+    return router
+
+
+def redis_pool_stats(pool=redis_pool):
+    """回傳同步連線池的使用狀況。"""
+    # BlockingConnectionPool 以佇列存放閒置連線 (None 代表尚未建立的名額)
+    idle_slots = pool.pool.qsize()
+    return {
+        'max_connections': pool.max_connections,
+        'created': len(pool._connections),
+        'in_use': pool.max_connections - idle_slots,
+        'idle': len(pool._connections) - (pool.max_connections - idle_slots),
+    }
+
+
+def _timed(check):
+    started = time.perf_counter()
+    try:
+        check()
+    except Exception as exc:
+        return {'ok': False, 'error': f"{type(exc).__name__}: {exc}"}
+    return {'ok': True, 'latency_ms': round((time.perf_counter() - started) * 1000, 2)}
+
+
+def _check_database():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+def health_check():
+    """檢查資料庫與 Redis 連線，回傳 (是否全部正常, 詳細資訊)。"""
+    database = _timed(_check_database)
+    database['conn_max_age'] = connection.settings_dict.get('CONN_MAX_AGE')
+    database['conn_health_checks'] = connection.settings_dict.get('CONN_HEALTH_CHECKS')
+
+    redis_status = _timed(redis_client.ping)
+    redis_status['pool'] = redis_pool_stats()
+
+    healthy = database['ok'] and redis_status['ok']
+    details = {'database': database, 'redis': redis_status}
+    if lock_router.partitioned or settings.REDIS_LOCK_CLUSTER_URL:
+        nodes = {name: _timed(client.ping) for name, client in lock_router.nodes.items()}
+        healthy = healthy and all(node['ok'] for node in nodes.values())
+        details['redis_lock_nodes'] = nodes
+    return healthy, details
@@ -0,0 +1,166 @@
+# booking/exports.py
+
+"""
+訂單、訂單項與場次座位名冊的串流匯出 (CSV / NDJSON)。
+
+以 values_list() 搭配 iterator(chunk_size=...) 逐批讀取 (PostgreSQL 使用伺服器端游標)，
+不建立模型實例也不經過 serializer，每一列讀到就寫出，
+不論場次有多少訂單，記憶體用量都維持固定。
+API (StreamingHttpResponse) 與管理指令 (manage.py export_bookings) 共用這裡的產生器。
+ASGI 下 StreamingHttpResponse 只會逐塊送出 async iterator (同步產生器會先被整個讀進記憶體)，
+API 因此以 async_chunks() 包裝，每個區塊在 sync_to_async 中從資料庫游標讀取。
+
+匯出種類：
+    orders        每張訂單一列
+    order-items   每個訂單項一列，附上訂單與座位資訊
+    seats         場次座位名冊，每個座位一列，已售出的座位附上訂單號與購買者
+"""
+
+import csv
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Order, OrderItem, Seat
+from .pricing import CURRENT_PRICE
+
+# 每次從資料庫游標取回的列數
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# 匯出種類 -> (模型, [(欄位名稱, ORM 查詢路徑或查詢運算式), ...])
+EXPORTS = {
+    'orders': (Order, [
+        ('id', 'id'),
+        ('order_number', 'order_number'),
+        ('event_id', 'event_id'),
+        ('buyer_name', 'buyer_name'),
+        ('status', 'status'),
+        ('total_amount', 'total_amount'),
+        ('created_at', 'created_at'),
+        ('updated_at', 'updated_at'),
+    ]),
+    'order-items': (OrderItem, [
+        ('id', 'id'),
+        ('order_id', 'order_id'),
+        ('order_number', 'order__order_number'),
+        ('event_id', 'order__event_id'),
+        ('buyer_name', 'order__buyer_name'),
+        ('order_status', 'order__status'),
+        ('seat_id', 'seat_id'),
+        ('section', 'seat__section'),
+        ('row', 'seat__row'),
+        ('column', 'seat__column'),
+        ('price_at_purchase', 'price_at_purchase'),
+    ]),
+    'seats': (Seat, [
+        ('id', 'id'),
+        ('event_id', 'event_id'),
+        ('section', 'section'),
+        ('row', 'row'),
+        ('column', 'column'),
+        ('price_tier', 'price_tier__name'),
+        ('price', CURRENT_PRICE),
+        ('status', 'status'),
+        ('order_number', 'orderitem__order__order_number'),
+        ('buyer_name', 'orderitem__order__buyer_name'),
+    ]),
+}
+
+# 各匯出種類中「場次」與「狀態」篩選條件對應的查詢路徑
+_EVENT_FILTERS = {'orders': 'event_id', 'order-items': 'order__event_id', 'seats': 'event_id'}
+_STATUS_FILTERS = {'orders': 'status', 'order-items': 'order__status', 'seats': 'status'}
+_ORDERINGS = {'orders': ('id',), 'order-items': ('order_id', 'id'), 'seats': ('row', 'column', 'id')}
+
+
+def export_columns(kind):
+    return [name for name, _ in EXPORTS[kind][1]]
+
+
+def export_rows(kind, event_id=None, status=None, chunk_size=CHUNK_SIZE):
+    """依序產生匯出資料的每一列 (tuple)，以資料庫游標逐批讀取。"""
+    model, columns = EXPORTS[kind]
+    queryset = model.objects.all()
+    if event_id is not None:
+        queryset = queryset.filter(**{_EVENT_FILTERS[kind]: event_id})
+    if status:
+        queryset = queryset.filter(**{_STATUS_FILTERS[kind]: status})
+    # 查詢運算式 (例如目前票價) 以 annotate 加入，名稱加上前綴避免與模型欄位衝突
+    expressions = {f'export_{name}': path for name, path in columns if not isinstance(path, str)}
+    if expressions:
+        queryset = queryset.annotate(**expressions)
+    paths = [path if isinstance(path, str) else f'export_{name}' for name, path in columns]
+    queryset = queryset.order_by(*_ORDERINGS[kind]).values_list(*paths)
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    # csv.writer 需要可寫入的物件；直接回傳寫入的字串，讓每一列可以逐一產生
+    def write(self, value):
+        return value
+
+
+def csv_lines(columns, rows):
+    """以 CSV 格式逐行產生字串，第一行為欄位名稱。"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(columns, rows):
+    """每一列輸出為一行 JSON 物件。"""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+def export_lines(kind, output_format, event_id=None, status=None):
+    """依格式產生匯出內容的每一行。"""
+    columns = export_columns(kind)
+    rows = export_rows(kind, event_id=event_id, status=status)
+    if output_format == 'ndjson':
+        return ndjson_lines(columns, rows)
+    return csv_lines(columns, rows)
+
+
+def encoded_chunks(lines, chunk_bytes=64 * 1024):
+    """把逐行的字串合併成約 chunk_bytes 大小的 UTF-8 區塊，減少串流回應的寫入次數。"""
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_bytes:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+async def async_chunks(chunks):
+    """
+    把 encoded_chunks() 的同步產生器包成 async iterator，每個區塊以 sync_to_async 取得。
+    thread_sensitive 讓所有區塊在同一個執行緒讀取，資料庫游標與連線不會跨執行緒。
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await next_chunk(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # 客戶端中途斷線時關閉產生器，釋放資料庫游標
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+def export_filename(kind, output_format, event_id=None):
+    suffix = f"-event-{event_id}" if event_id is not None else ''
+    return f"{kind}{suffix}.{output_format}"
@@ -0,0 +1,303 @@
+# booking/holds.py
+
+"""
+座位保留 (hold)：每個會話在每個場次一個保留，擁有該會話鎖定的所有座位。
+
+座位鎖仍是 seat_lock:{event_id}:seat_id 鍵 (見 locks.py)，另以一個 hash 記錄保留中的座位：
+續期 (心跳) 與釋放都只需一次 Lua 腳本呼叫 (先以 HKEYS 讀出保留中的座位)，不論保留多少座位，
+都在 Redis 端原子地處理所有座位鎖，往返次數固定。
+
+時間政策可依場次設定 (Event.hold_ttl_seconds / hold_max_seconds)，未設定時使用 settings.SEAT_HOLDS：
+    TTL          鎖定或每次續期後保留的秒數
+    MAX_SECONDS  自保留建立起最多可續期到的秒數，避免以心跳無限期佔住座位
+
+Redis 鍵 (以場次為 hash tag，與座位鎖位於同一個節點，見 lockrouter.py)：
+    hold:{event_id}:session_id   hash，_created -> 建立時間 (unix 秒)，seat_id -> 1
+
+所有座位鎖鍵都以 KEYS 傳入腳本；座位鎖與保留必須位於同一個節點 (Cluster 中為同一個 slot)。
+讀出座位之後才加入保留的座位不在本次腳本處理的範圍內，它們剛被鎖定，本來就有完整的保留秒數。
+"""
+
+import time
+
+from django.conf import settings
+
+from .lockrouter import AsyncLockRouter, as_router
+from .locks import seat_lock_key
+
+CREATED_FIELD = '_created'
+
+# KEYS[1]: hold, KEYS[2..]: 座位鎖定鍵
+# ARGV[1]: 持有者, ARGV[2]: 秒數, ARGV[3]: '1' 表示全有或全無, ARGV[4]: 現在時間, ARGV[5]: 續期上限秒數,
+# ARGV[6..]: 座位 ID
+# 與 locks.ACQUIRE_MANY_SCRIPT 相同的結果代碼，成功 (新取得或續期) 的座位加入保留。
+# 保留已存在時，所有到期時間與 HOLD_RENEW_SCRIPT 一樣不超過建立時間 + 上限：
+# 重新鎖定不能用來繞過續期上限；已用完上限的保留不再延長，也不能再加入新座位
+HOLD_ACQUIRE_SCRIPT = """
+local owner = ARGV[1]
+local ttl = tonumber(ARGV[2])
+local all_or_nothing = ARGV[3] == '1'
+local created = redis.call('HGET', KEYS[1], '_created')
+if created then
+    ttl = math.min(ttl, tonumber(created) + tonumber(ARGV[5]) - tonumber(ARGV[4]))
+end
+local results = {}
+
+if all_or_nothing then
+    local conflict = false
+    for i = 2, #KEYS do
+        local current = redis.call('GET', KEYS[i])
+        if (current and current ~= owner) or (not current and ttl < 1) then
+            results[i - 1] = 0
+            conflict = true
+        else
+            results[i - 1] = -1
+        end
+    end
+    if conflict then
+        return results
+    end
+end
+
+local held = 0
+for i = 2, #KEYS do
+    local key = KEYS[i]
+    if ttl >= 1 and redis.call('SET', key, owner, 'EX', ttl, 'NX') then
+        results[i - 1] = 1
+    elseif redis.call('GET', key) == owner then
+        if ttl >= 1 then
+            redis.call('EXPIRE', key, ttl)
+        end
+        results[i - 1] = 2
+    else
+        results[i - 1] = 0
+    end
+    if results[i - 1] ~= 0 then
+        redis.call('HSET', KEYS[1], ARGV[i + 4], 1)
+        held = held + 1
+    end
+end
+if held > 0 then
+    redis.call('HSETNX', KEYS[1], '_created', ARGV[4])
+    if ttl >= 1 and redis.call('TTL', KEYS[1]) < ttl then
+        redis.call('EXPIRE', KEYS[1], ttl)
+    end
+end
+return results
+"""
+
+# KEYS[1]: hold, KEYS[2..]: 座位鎖定鍵
+# ARGV[1]: 持有者, ARGV[2]: 秒數, ARGV[3]: 現在時間, ARGV[4]: 續期上限秒數, ARGV[5..]: 與 KEYS[2..] 對應的座位 ID
+# 把保留中所有仍由持有者擁有的座位鎖延長到同一個到期時間 (不超過建立時間 + 上限)，
+# 已失效的座位從保留中移除 (已不在保留中的座位略過)。
+# 回傳 {剩餘秒數, {續期的座位 ID}, {已失效的座位 ID}}，保留不存在時回傳 {-1}
+HOLD_RENEW_SCRIPT = """
+local created = redis.call('HGET', KEYS[1], '_created')
+if not created then
+    return {-1}
+end
+local owner = ARGV[1]
+local now = tonumber(ARGV[3])
+local ttl = math.min(tonumber(ARGV[2]), tonumber(created) + tonumber(ARGV[4]) - now)
+local renewed = {}
+local lost = {}
+for i = 2, #KEYS do
+    local seat = ARGV[i + 3]
+    if redis.call('HEXISTS', KEYS[1], seat) == 1 then
+        if redis.call('GET', KEYS[i]) == owner then
+            if ttl >= 1 then
+                redis.call('EXPIRE', KEYS[i], ttl)
+            end
+            renewed[#renewed + 1] = tonumber(seat)
+        else
+            redis.call('HDEL', KEYS[1], seat)
+            lost[#lost + 1] = tonumber(seat)
+        end
+    end
+end
+
+if redis.call('HLEN', KEYS[1]) <= 1 then
+    redis.call('DEL', KEYS[1])
+    return {0, renewed, lost}
+end
+if ttl >= 1 then
+    redis.call('EXPIRE', KEYS[1], ttl)
+end
+return {redis.call('TTL', KEYS[1]), renewed, lost}
+"""
+
+# KEYS[1]: hold, KEYS[2..]: 座位鎖定鍵；ARGV[1]: 持有者, ARGV[2..]: 與 KEYS[2..] 對應的座位 ID
+# 只刪除仍由持有者擁有的座位鎖，回傳實際釋放的座位 ID；保留中沒有座位時一併刪除保留
+HOLD_RELEASE_SCRIPT = """
+local released = {}
+for i = 2, #KEYS do
+    local seat = ARGV[i]
+    if redis.call('GET', KEYS[i]) == ARGV[1] then
+        redis.call('DEL', KEYS[i])
+        released[#released + 1] = tonumber(seat)
+    end
+    redis.call('HDEL', KEYS[1], seat)
+end
+if redis.call('HLEN', KEYS[1]) <= 1 then
+    redis.call('DEL', KEYS[1])
+end
+return released
+"""
+
+
+def hold_key(event_id, owner):
+    return f"hold:{{{event_id}}}:{owner}"
+
+
+def hold_id(event_id, owner):
+    """對外顯示的保留 ID。"""
+    return f"{event_id}:{owner}"
+
+
+def hold_policy(event):
+    """回傳場次的 (保留秒數, 續期上限秒數)，未設定時使用 settings.SEAT_HOLDS。"""
+    defaults = settings.SEAT_HOLDS
+    return (
+        event.hold_ttl_seconds or defaults['TTL'],
+        event.hold_max_seconds or defaults['MAX_SECONDS'],
+    )
+
+
+def _acquire_args(event_id, seat_ids, owner, ttl_seconds, max_seconds, all_or_nothing, now):
+    keys = _hold_keys(event_id, owner, seat_ids)
+    args = [owner, int(ttl_seconds), '1' if all_or_nothing else '0', int(now), int(max_seconds), *seat_ids]
+    return keys, args
+
+
+def _hold_keys(event_id, owner, seat_ids):
+    return [hold_key(event_id, owner), *(seat_lock_key(event_id, seat_id) for seat_id in seat_ids)]
+
+
+def _held_seat_ids(fields):
+    return sorted(int(field) for field in fields if field.decode() != CREATED_FIELD)
+
+
+def _renew_args(event_id, owner, seat_ids, ttl_seconds, max_seconds, now):
+    keys = _hold_keys(event_id, owner, seat_ids)
+    args = [owner, int(ttl_seconds), int(now), int(max_seconds), *seat_ids]
+    return keys, args
+
+
+def _renew_result(result):
+    if int(result[0]) < 0:
+        return None
+    expires_in, renewed, lost = result
+    return int(expires_in), [int(seat_id) for seat_id in renewed], [int(seat_id) for seat_id in lost]
+
+
+def _parse_hold(fields, ttl):
+    seat_ids = _held_seat_ids(fields)
+    if not seat_ids:
+        return None
+    return {'seat_ids': seat_ids, 'expires_in': max(int(ttl), 0)}
+
+
+class HoldManager:
+    """以 Lua 腳本管理座位保留；可傳入相容 redis-py 的客戶端 (包含 fakeredis) 或 LockRouter。"""
+
+    def __init__(self, client):
+        self.router = as_router(client)
+        registered = next(iter(self.router.nodes.values()))
+        self._acquire = registered.register_script(HOLD_ACQUIRE_SCRIPT)
+        self._renew = registered.register_script(HOLD_RENEW_SCRIPT)
+        self._release = registered.register_script(HOLD_RELEASE_SCRIPT)
+
+    def client_for(self, event_id):
+        """場次的保留與座位鎖所在節點的客戶端。"""
+        return self.router.client_for(event_id)
+
+    def acquire(self, event_id, owner, seat_ids, ttl_seconds, max_seconds, all_or_nothing=False, now=None):
+        """
+        鎖定座位並加入 owner 在該場次的保留，回傳 {seat_id: 結果代碼} (代碼見 locks.py)。
+        保留已存在時，到期時間不超過保留建立時間 + max_seconds。
+        """
+        seat_ids = list(seat_ids)
+        if not seat_ids:
+            return {}
+        now = time.time() if now is None else now
+        keys, args = _acquire_args(event_id, seat_ids, owner, ttl_seconds, max_seconds, all_or_nothing, now)
+        codes = self._acquire(keys=keys, args=args, client=self.client_for(event_id))
+        return {seat_id: int(code) for seat_id, code in zip(seat_ids, codes)}
+
+    def renew(self, event_id, owner, ttl_seconds, max_seconds, now=None):
+        """
+        以一次腳本呼叫續期保留中的所有座位，回傳 (剩餘秒數, 續期的座位 ID, 已失效的座位 ID)。
+        保留不存在時回傳 None。
+        """
+        now = time.time() if now is None else now
+        client = self.client_for(event_id)
+        seat_ids = _held_seat_ids(client.hkeys(hold_key(event_id, owner)))
+        keys, args = _renew_args(event_id, owner, seat_ids, ttl_seconds, max_seconds, now)
+        return _renew_result(self._renew(keys=keys, args=args, client=client))
+
+    def release(self, event_id, owner, seat_ids=None, pipeline=None):
+        """
+        釋放保留中的座位 (seat_ids 為 None 時釋放整個保留)，回傳實際釋放的座位 ID 列表。
+        傳入 pipeline (須為場次所在節點的 pipeline) 時只把腳本排入，由呼叫端執行，此時回傳 None。
+        """
+        client = self.client_for(event_id)
+        if seat_ids is None:
+            seat_ids = _held_seat_ids(client.hkeys(hold_key(event_id, owner)))
+        elif not seat_ids:
+            return []
+        keys, args = _hold_keys(event_id, owner, seat_ids), [owner, *seat_ids]
+        if pipeline is not None:
+            self._release(keys=keys, args=args, client=pipeline)
+            return None
+        return [int(seat_id) for seat_id in self._release(keys=keys, args=args, client=client)]
+
+    def get(self, event_id, owner):
+        """回傳 {'seat_ids': [...], 'expires_in': 秒數}，保留不存在時回傳 None。"""
+        pipe = self.client_for(event_id).pipeline(transaction=False)
+        pipe.hkeys(hold_key(event_id, owner))
+        pipe.ttl(hold_key(event_id, owner))
+        fields, ttl = pipe.execute()
+        return _parse_hold(fields, ttl)
+
+
+class AsyncHoldManager:
+    """HoldManager 的 redis.asyncio 版本，使用相同的鍵與 Lua 腳本。"""
+
+    def __init__(self, client):
+        self.router = as_router(client, AsyncLockRouter)
+        registered = next(iter(self.router.nodes.values()))
+        self._acquire = registered.register_script(HOLD_ACQUIRE_SCRIPT)
+        self._renew = registered.register_script(HOLD_RENEW_SCRIPT)
+        self._release = registered.register_script(HOLD_RELEASE_SCRIPT)
+
+    async def acquire(self, event_id, owner, seat_ids, ttl_seconds, max_seconds, all_or_nothing=False, now=None):
+        seat_ids = list(seat_ids)
+        if not seat_ids:
+            return {}
+        now = time.time() if now is None else now
+        keys, args = _acquire_args(event_id, seat_ids, owner, ttl_seconds, max_seconds, all_or_nothing, now)
+        codes = await self._acquire(keys=keys, args=args, client=await self.router.client_for(event_id))
+        return {seat_id: int(code) for seat_id, code in zip(seat_ids, codes)}
+
+    async def renew(self, event_id, owner, ttl_seconds, max_seconds, now=None):
+        now = time.time() if now is None else now
+        client = await self.router.client_for(event_id)
+        seat_ids = _held_seat_ids(await client.hkeys(hold_key(event_id, owner)))
+        keys, args = _renew_args(event_id, owner, seat_ids, ttl_seconds, max_seconds, now)
+        return _renew_result(await self._renew(keys=keys, args=args, client=client))
+
+    async def release(self, event_id, owner, seat_ids=None):
+        client = await self.router.client_for(event_id)
+        if seat_ids is None:
+            seat_ids = _held_seat_ids(await client.hkeys(hold_key(event_id, owner)))
+        elif not seat_ids:
+            return []
+        keys, args = _hold_keys(event_id, owner, seat_ids), [owner, *seat_ids]
+        return [int(seat_id) for seat_id in await self._release(keys=keys, args=args, client=client)]
+
+    async def get(self, event_id, owner):
+        pipe = (await self.router.client_for(event_id)).pipeline(transaction=False)
+        pipe.hkeys(hold_key(event_id, owner))
+        pipe.ttl(hold_key(event_id, owner))
+        fields, ttl = await pipe.execute()
+        return _parse_hold(fields, ttl)
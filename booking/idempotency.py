@@ -0,0 +1,121 @@
+# booking/idempotency.py
+
+"""
+建立訂單的 Idempotency-Key 支援 (以 Redis 儲存)。
+
+客戶端逾時重送時帶上同一個 Idempotency-Key，伺服器只會真正建立一次訂單：
+
+    1. 第一次請求以 SET NX 寫入「處理中」標記 (IN_FLIGHT_TTL 秒後自動過期)，再執行建立流程；
+       標記含有每個請求各自的 token，begin() 回傳的標記內容即為這次請求的處理權憑證
+    2. 成功 (2xx) 時把回應內容存回同一個鍵，保留 TTL 秒
+    3. 失敗時刪除標記，客戶端可用同一個鍵重試
+    完成與刪除都以 Lua 腳本比對標記仍是自己寫入的才執行：處理超過 IN_FLIGHT_TTL、
+    標記過期後被另一個請求取得處理權時，原本的請求不會刪除或覆寫對方的標記
+    4. 重複的請求：已完成時直接回傳原本的回應 (不查詢資料庫)，
+       仍在處理中時回傳 409，同一個鍵搭配不同的請求內容時回傳 422
+
+鍵依 session_id 區分，不同會話使用相同的 Idempotency-Key 不會互相影響 (session_id 不可為空)。
+
+Redis 鍵：
+    idempotency:{scope}:{session_id}:{key}   JSON，{"state": "in_flight" | "done", "fingerprint": ..., ...}
+"""
+
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+STATE_IN_FLIGHT = 'in_flight'
+STATE_DONE = 'done'
+
+# KEYS[1]: 紀錄；ARGV[1]: begin() 寫入的標記, ARGV[2]: 新內容, ARGV[3]: 保留秒數
+# 標記仍是自己的才寫入最終回應，回傳 1；否則回傳 0
+COMPLETE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+# KEYS[1]: 紀錄；ARGV[1]: begin() 寫入的標記
+# 標記仍是自己的才刪除，回傳刪除的數量
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def idempotency_key_from_request(request):
+    """從 Idempotency-Key 標頭取得鍵，未提供時回傳 None；格式不正確時拋出 ValueError。"""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH or not key.isprintable():
+        raise ValueError(f'{IDEMPOTENCY_HEADER} must be 1-{MAX_KEY_LENGTH} printable characters.')
+    return key
+
+
+def request_fingerprint(data):
+    """請求內容的雜湊值，用來偵測同一個鍵被用在不同的請求上。"""
+    canonical = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class IdempotencyStore:
+    """以 Redis 儲存處理中標記與最終回應。"""
+
+    def __init__(self, client, scope):
+        self.client = client
+        self.scope = scope
+        self._complete = client.register_script(COMPLETE_SCRIPT)
+        self._release = client.register_script(RELEASE_SCRIPT)
+
+    def _key(self, session_id, key):
+        if not session_id:
+            raise ValueError('session_id is required for idempotency keys.')
+        return f"idempotency:{self.scope}:{session_id}:{key}"
+
+    def begin(self, session_id, key, fingerprint):
+        """
+        嘗試開始處理，回傳 (token, 既有紀錄)。
+        取得處理權時 token 為寫入的標記 (交給 complete / release)，既有紀錄為 None；
+        否則 token 為 None，並回傳先前請求的紀錄 (處理中或已完成)。
+        """
+        redis_key = self._key(session_id, key)
+        marker = json.dumps({'state': STATE_IN_FLIGHT, 'fingerprint': fingerprint, 'token': uuid.uuid4().hex})
+        if self.client.set(redis_key, marker, nx=True, ex=settings.IDEMPOTENCY['IN_FLIGHT_TTL']):
+            return marker, None
+        record = self.client.get(redis_key)
+        if record is None:
+            # 紀錄剛好在兩次指令之間過期，再試一次
+            return self.begin(session_id, key, fingerprint)
+        return None, json.loads(record)
+
+    def complete(self, session_id, key, token, fingerprint, status_code, data):
+        """
+        保存成功的回應，之後相同的請求直接回傳這份內容。
+        標記已不是 token (已過期並被其他請求取得) 時不寫入，回傳 False。
+        """
+        record = json.dumps({
+            'state': STATE_DONE,
+            'fingerprint': fingerprint,
+            'status': status_code,
+            'body': data,
+        }, cls=DjangoJSONEncoder)
+        return bool(self._complete(
+            keys=[self._key(session_id, key)], args=[token, record, settings.IDEMPOTENCY['TTL']],
+        ))
+
+    def release(self, session_id, key, token):
+        """處理失敗時刪除自己的處理中標記，讓客戶端可以用同一個鍵重試。"""
+        return bool(self._release(keys=[self._key(session_id, key)], args=[token]))
@@ -0,0 +1,312 @@
+# booking/instrumentation.py
+
+"""
+每個請求的資料庫 / Redis 呼叫統計與延遲指標。
+
+    RequestMetricsMiddleware   記錄每個請求的查詢數、資料庫時間、Redis 指令數與 Redis 時間，
+                               以 Server-Timing 標頭回傳，並寫入結構化日誌 (booking.requests)
+    InstrumentedRedis          connections.py 使用的 Redis 客戶端，計算指令與 pipeline 往返
+    render_metrics()           以 Prometheus 文字格式輸出各視圖的延遲直方圖 (GET /metrics)，
+                               以及其他模組以 register_collector() 註冊的指標 (例如 cache.py 的命中率)
+
+統計值存放在 contextvar 中，async 視圖透過 sync_to_async 執行的 ORM 查詢也會計入同一個請求。
+直方圖保存在行程記憶體內，多個工作行程時 Prometheus 需分別抓取每個行程。
+
+設定 (settings.BOOKING_INSTRUMENTATION，皆可省略)：
+    SERVER_TIMING     是否回傳 Server-Timing 標頭，預設 True
+    LOG_REQUESTS      是否為每個請求寫入一筆日誌，預設 True
+    BUCKETS           延遲直方圖的邊界 (秒)
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict
+
+import redis
+import redis.asyncio as aioredis
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('booking.requests')
+
+DEFAULTS = {
+    'SERVER_TIMING': True,
+    'LOG_REQUESTS': True,
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+}
+
+
+def _setting(name):
+    return getattr(settings, 'BOOKING_INSTRUMENTATION', {}).get(name, DEFAULTS[name])
+
+
+class RequestMetrics:
+    """單一請求累計的呼叫次數與耗時 (秒)。"""
+
+    __slots__ = ('db_queries', 'db_time', 'redis_calls', 'redis_time')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.redis_calls = 0
+        self.redis_time = 0.0
+
+
+_current = contextvars.ContextVar('booking_request_metrics', default=None)
+
+
+def current_metrics():
+    """目前請求的 RequestMetrics，不在請求中時回傳 None。"""
+    return _current.get()
+
+
+def _record_redis(started):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.redis_calls += 1
+        metrics.redis_time += time.perf_counter() - started
+
+
+# --- 資料庫 ---
+
+def _db_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def _install_db_wrapper(sender, connection, **kwargs):
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+connection_created.connect(_install_db_wrapper, dispatch_uid='booking_instrumentation_db_wrapper')
+
+
+# --- Redis ---
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    # pipeline 中的指令在 execute 時一次送出，計為一次往返
+    def execute(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().execute(*args, **kwargs)
+        finally:
+            _record_redis(started)
+
+
+class InstrumentedRedis(redis.StrictRedis):
+    """計算指令數與耗時的同步 Redis 客戶端 (EVALSHA 等腳本呼叫也經過 execute_command)。"""
+
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            _record_redis(started)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class InstrumentedAsyncPipeline(aioredis.client.Pipeline):
+    async def execute(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().execute(*args, **kwargs)
+        finally:
+            _record_redis(started)
+
+
+class InstrumentedAsyncRedis(aioredis.StrictRedis):
+    """InstrumentedRedis 的 redis.asyncio 版本。"""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            _record_redis(started)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedAsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+# --- Prometheus 指標 ---
+
+class Registry:
+    """依 (視圖, 方法) 分組的延遲直方圖與呼叫次數計數器 (執行緒安全)。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.buckets = tuple(_setting('BUCKETS'))
+        self.histograms = {}                    # (view, method) -> [各 bucket 計數..., 總和, 次數]
+        self.requests = defaultdict(int)        # (view, method, status) -> 次數
+        self.totals = defaultdict(float)        # (metric, view) -> 累計值
+
+    def reset(self):
+        with self._lock:
+            self._reset()
+
+    def observe(self, view, method, status_code, duration, metrics):
+        with self._lock:
+            histogram = self.histograms.get((view, method))
+            if histogram is None:
+                histogram = self.histograms[(view, method)] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    histogram[i] += 1
+            histogram[-2] += duration
+            histogram[-1] += 1
+            self.requests[(view, method, str(status_code))] += 1
+            self.totals[('booking_db_queries_total', view)] += metrics.db_queries
+            self.totals[('booking_db_seconds_total', view)] += metrics.db_time
+            self.totals[('booking_redis_commands_total', view)] += metrics.redis_calls
+            self.totals[('booking_redis_seconds_total', view)] += metrics.redis_time
+
+    def render(self):
+        lines = [
+            '# HELP booking_request_duration_seconds Request latency by view.',
+            '# TYPE booking_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            for (view, method), histogram in sorted(self.histograms.items()):
+                labels = f'view="{_escape(view)}",method="{method}"'
+                # observe() 已將每次請求計入所有不小於其耗時的 bucket，計數本身即為累積值
+                for bound, count in zip(self.buckets, histogram):
+                    lines.append(f'booking_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'booking_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram[-1]}')
+                lines.append(f'booking_request_duration_seconds_sum{{{labels}}} {histogram[-2]:.6f}')
+                lines.append(f'booking_request_duration_seconds_count{{{labels}}} {histogram[-1]}')
+
+            lines.append('# HELP booking_requests_total Requests by view, method and status code.')
+            lines.append('# TYPE booking_requests_total counter')
+            for (view, method, status_code), count in sorted(self.requests.items()):
+                lines.append(
+                    f'booking_requests_total{{view="{_escape(view)}",method="{method}",status="{status_code}"}} {count}'
+                )
+
+            by_metric = defaultdict(list)
+            for (metric, view), value in sorted(self.totals.items()):
+                by_metric[metric].append((view, value))
+        for metric, values in by_metric.items():
+            lines.append(f'# TYPE {metric} counter')
+            for view, value in values:
+                formatted = f'{value:.6f}' if metric.endswith('seconds_total') else str(int(value))
+                lines.append(f'{metric}{{view="{_escape(view)}"}} {formatted}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+_collectors = []
+
+
+def register_collector(collect):
+    """註冊額外的指標來源；collect() 回傳 Prometheus 文字格式的行列表，於每次輸出時呼叫。"""
+    _collectors.append(collect)
+
+
+def render_metrics():
+    """以 Prometheus 文字格式輸出目前行程的指標。"""
+    lines = [registry.render()]
+    for collect in _collectors:
+        lines.extend(line + '\n' for line in collect())
+    return ''.join(lines)
+
+
+# --- 中介軟體 ---
+
+def _view_name(request):
+    # 以路由名稱作為標籤 (例如 order-list)，避免以含 ID 的路徑造成過多的時間序列
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match.route or 'unresolved'
+
+
+class RequestMetricsMiddleware:
+    """
+    記錄每個請求的資料庫與 Redis 呼叫，回傳 Server-Timing 標頭並更新直方圖。
+    應放在 MIDDLEWARE 的第一個位置，計入其他中介軟體的時間。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, metrics, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, metrics, time.perf_counter() - started)
+        return response
+
+    def _finish(self, request, response, metrics, duration):
+        view = _view_name(request)
+        registry.observe(view, request.method, response.status_code, duration, metrics)
+
+        if _setting('SERVER_TIMING'):
+            timings = [
+                f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.db_queries} queries"',
+                f'redis;dur={metrics.redis_time * 1000:.2f};desc="{metrics.redis_calls} commands"',
+                f'total;dur={duration * 1000:.2f}',
+            ]
+            # 串流回應 (SSE) 的時間只涵蓋建立回應的部分
+            if response.has_header('Server-Timing'):
+                timings.insert(0, response['Server-Timing'])
+            response['Server-Timing'] = ', '.join(timings)
+
+        if _setting('LOG_REQUESTS'):
+            logger.info(
+                "%s %s %s %.1fms", request.method, request.path, response.status_code, duration * 1000,
+                extra={
+                    'view': view,
+                    'method': request.method,
+                    'path': request.path,
+                    'status_code': response.status_code,
+                    'duration_ms': round(duration * 1000, 2),
+                    'db_queries': metrics.db_queries,
+                    'db_ms': round(metrics.db_time * 1000, 2),
+                    'redis_commands': metrics.redis_calls,
+                    'redis_ms': round(metrics.redis_time * 1000, 2),
+                },
+            )
@@ -0,0 +1,204 @@
+# booking/inventory.py
+
+"""
+由場地佈局資料 (Venue.layout_data) 批次產生場次座位。
+
+佈局資料格式：
+
+    {
+        "price_tiers": {"VIP": 3000, "A": 2000},      # 可選，票價等級名稱 -> 價格
+        "sections": [
+            {
+                "name": "搖滾區",                      # 區域名稱，寫入 Seat.section
+                "row_prefix": "R",                    # 可選，加在每個排號前 (不同區域排號重複時使用)
+                "price_tier": "VIP",                  # 可選，整區的票價等級
+                "rows": [
+                    {"label": "1", "from": 1, "to": 30},
+                    {"labels": ["2", "3", "4"], "from": 1, "to": 32, "skip": [16]},
+                    {"label": "5", "from": 1, "to": 20, "price": 1800}
+                ]
+            }
+        ]
+    }
+
+每一排以 label (單排) 或 labels (多排使用相同座位範圍) 指定排號，
+from / to 為包含兩端的座位號範圍，skip 為要略過的座位號 (例如走道)。
+價格依序取 排的 price / price_tier、區域的 price / price_tier，
+都未指定時使用場次的 base_price。
+產生座位時會一併建立場次的票價等級 (PriceTier，見 pricing.py)：price_tiers 中的等級沿用其名稱，
+其餘座位依區域建立等級，之後調整票價只需修改等級。
+寫入資料庫的 Seat.row 為 row_prefix + 排號，Seat.column 為座位號，
+兩者長度都不可超過 10 個字元，且同一場次內 (row, column) 不可重複。
+"""
+
+from django.db import transaction
+
+from .models import Seat, PriceTier
+from .pricing import ensure_tiers, tier_names
+
+ROW_MAX_LENGTH = Seat._meta.get_field('row').max_length
+COLUMN_MAX_LENGTH = Seat._meta.get_field('column').max_length
+SECTION_MAX_LENGTH = Seat._meta.get_field('section').max_length
+TIER_NAME_MAX_LENGTH = PriceTier._meta.get_field('name').max_length
+
+
+class LayoutError(ValueError):
+    """佈局資料格式錯誤，或目標場次無法產生座位。"""
+
+
+def _resolve_price(spec, price_tiers, fallback):
+    """回傳 (價格, 票價等級名稱或 None)；spec 未指定價格時回傳 fallback。"""
+    tier = None
+    if 'price' in spec:
+        price = spec['price']
+    elif 'price_tier' in spec:
+        tier = spec['price_tier']
+        if tier not in price_tiers:
+            raise LayoutError(f'Unknown price tier "{tier}".')
+        if len(str(tier)) > TIER_NAME_MAX_LENGTH:
+            raise LayoutError(f'Price tier name "{tier}" is longer than {TIER_NAME_MAX_LENGTH} characters.')
+        price = price_tiers[tier]
+    else:
+        return fallback
+    try:
+        price = int(price)
+    except (TypeError, ValueError):
+        raise LayoutError(f'Price "{price}" must be an integer.')
+    if price < 0:
+        raise LayoutError(f'Price {price} must not be negative.')
+    return price, tier
+
+
+def iter_layout_seats(layout, default_price):
+    """
+    驗證佈局資料並逐一產生 (section, row, column, price, tier)，tier 為佈局指定的票價等級名稱或 None。
+    發現格式錯誤或重複座位時拋出 LayoutError。
+    """
+    if not isinstance(layout, dict) or not isinstance(layout.get('sections'), list):
+        raise LayoutError('Layout must be an object with a "sections" list.')
+    price_tiers = layout.get('price_tiers') or {}
+    if not isinstance(price_tiers, dict):
+        raise LayoutError('"price_tiers" must be an object.')
+
+    seen = set()
+    for section in layout['sections']:
+        if not isinstance(section, dict) or not isinstance(section.get('rows'), list):
+            raise LayoutError('Each section must be an object with a "rows" list.')
+        section_name = str(section.get('name', ''))
+        if len(section_name) > SECTION_MAX_LENGTH:
+            raise LayoutError(f'Section name "{section_name}" is longer than {SECTION_MAX_LENGTH} characters.')
+        row_prefix = str(section.get('row_prefix', ''))
+        section_price = _resolve_price(section, price_tiers, (default_price, None))
+
+        for row_spec in section['rows']:
+            if not isinstance(row_spec, dict):
+                raise LayoutError(f'Rows in section "{section_name}" must be objects.')
+            if 'labels' in row_spec:
+                labels = row_spec['labels']
+            elif 'label' in row_spec:
+                labels = [row_spec['label']]
+            else:
+                raise LayoutError(f'A row in section "{section_name}" has no "label" or "labels".')
+            try:
+                first, last = int(row_spec['from']), int(row_spec['to'])
+            except (KeyError, TypeError, ValueError):
+                raise LayoutError(f'A row in section "{section_name}" needs integer "from" and "to".')
+            if first > last:
+                raise LayoutError(f'A row in section "{section_name}" has "from" greater than "to".')
+            try:
+                skip = {int(number) for number in row_spec.get('skip', [])}
+            except (TypeError, ValueError):
+                raise LayoutError(f'"skip" in section "{section_name}" must be a list of seat numbers.')
+            price, tier = _resolve_price(row_spec, price_tiers, section_price)
+
+            for label in labels:
+                row = f"{row_prefix}{label}"
+                if not row or len(row) > ROW_MAX_LENGTH:
+                    raise LayoutError(f'Row "{row}" must be 1 to {ROW_MAX_LENGTH} characters.')
+                for number in range(first, last + 1):
+                    if number in skip:
+                        continue
+                    column = str(number)
+                    if len(column) > COLUMN_MAX_LENGTH:
+                        raise LayoutError(f'Seat number {column} is longer than {COLUMN_MAX_LENGTH} characters.')
+                    if (row, column) in seen:
+                        raise LayoutError(f'Seat {row}{column} appears more than once in the layout.')
+                    seen.add((row, column))
+                    yield section_name, row, column, price, tier
+
+
+def _prepare_target(event, replace):
+    """確認目標場次可以寫入座位；replace 時刪除現有座位 (須在交易中呼叫)。"""
+    existing = Seat.objects.filter(event=event)
+    if not existing.exists():
+        return
+    if not replace:
+        raise LayoutError(f'Event {event.id} already has seats. Use replace to regenerate them.')
+    if existing.exclude(status__in=['available', 'cancelled']).exists():
+        raise LayoutError(f'Event {event.id} has locked or registered seats and cannot be regenerated.')
+    existing.delete()
+
+
+def generate_event_seats(event, layout=None, replace=False, batch_size=2000):
+    """
+    依佈局資料 (預設為場地的 layout_data) 在單一交易中以 bulk_create 產生場次的所有座位。
+    回傳建立的座位數量。
+    """
+    if layout is None:
+        layout = event.venue.layout_data
+    if not layout:
+        raise LayoutError(f'Venue {event.venue_id} has no layout_data.')
+
+    # 先完整驗證佈局，避免寫到一半才失敗
+    rows = list(iter_layout_seats(layout, default_price=event.base_price))
+    if not rows:
+        raise LayoutError('Layout does not contain any seats.')
+    names, prices = tier_names((section, price, tier) for section, _, _, price, tier in rows)
+
+    with transaction.atomic():
+        _prepare_target(event, replace)
+        tier_ids = ensure_tiers(event, prices)
+        Seat.objects.bulk_create([
+            Seat(
+                event=event, section=section, row=row, column=column, price=price,
+                price_tier_id=tier_ids[names[(section, price, tier)]],
+            )
+            for section, row, column, price, tier in rows
+        ], batch_size=batch_size)
+    return len(rows)
+
+
+def clone_event_seats(source_event, target_event, replace=False, batch_size=2000):
+    """
+    將來源場次的座位配置 (區域、排號、座位號、價格與票價等級) 複製到目標場次，
+    所有座位狀態重設為可選。回傳建立的座位數量。
+    """
+    if source_event.pk == target_event.pk:
+        raise LayoutError('Source and target events must be different.')
+
+    rows = Seat.objects.filter(event=source_event).order_by('id').values_list(
+        'section', 'row', 'column', 'price', 'price_tier__name',
+    )
+    if not rows.exists():
+        raise LayoutError(f'Event {source_event.id} has no seats to clone.')
+
+    with transaction.atomic():
+        _prepare_target(target_event, replace)
+        tier_ids = ensure_tiers(
+            target_event, dict(PriceTier.objects.filter(event=source_event).values_list('name', 'price')),
+        )
+        batch = []
+        created = 0
+        for section, row, column, price, tier in rows.iterator(chunk_size=batch_size):
+            batch.append(Seat(
+                event=target_event, section=section, row=row, column=column, price=price,
+                price_tier_id=tier_ids.get(tier),
+            ))
+            if len(batch) >= batch_size:
+                Seat.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            Seat.objects.bulk_create(batch)
+            created += len(batch)
+    return created
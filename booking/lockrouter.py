@@ -0,0 +1,196 @@
+# booking/lockrouter.py
+
+"""
+座位鎖的分區：依場次把座位鎖與保留 (hold) 分散到多個 Redis 節點或 Redis Cluster。
+
+鍵名以場次作為 hash tag (seat_lock:{event_id}:seat_id、hold:{event_id}:session_id)，
+同一場次的所有鎖鍵都在同一個節點 (Cluster 中為同一個 slot)，
+多座位的 Lua 腳本與 pipeline 仍在單一節點上原子地執行；不同場次的開賣則分散到不同節點。
+
+節點以 rendezvous (HRW) hashing 選擇：每個場次使用 hash(節點名稱, 場次) 最大的節點。
+新增或移除一個節點時，只有約 1/N 的場次會換到別的節點，其餘場次的鎖不受影響。
+分配只依節點名稱決定，更換節點的連線位址不會搬動任何場次。
+
+設定：
+    REDIS_LOCK_NODES          {名稱: redis URL}；未設定時所有鎖使用 settings.REDIS 的主連線
+    REDIS_LOCK_DRAINING       準備移除的節點名稱：不再分配新場次，只服務被固定 (pin) 在上面的場次
+    REDIS_LOCK_CLUSTER_URL    改用 Redis Cluster，由 Cluster 依 hash tag 分配 slot
+                              (重新分配 slot 時由 Cluster 自行搬移鍵，不需要下面的固定流程)
+
+變更節點 (manage.py rebalance_seat_locks)：
+    鎖的存活時間有上限 (場次的保留上限秒數)，因此不搬移鍵，而是「固定後等待清空」：
+    1. 部署前執行 `rebalance_seat_locks pin --nodes ...` (新設定)：仍有鎖、且在新設定下會換節點的場次
+       被固定在目前的節點上，直到這些鎖最晚可能到期的時間
+    2. 部署新設定 (要移除的節點先列在 REDIS_LOCK_DRAINING)；被固定的場次繼續使用原節點
+    3. 固定到期 (或 `rebalance_seat_locks unpin`) 後，該場次的新鎖改到新節點；之後再移除已清空的節點
+    `rebalance_seat_locks status` 列出各節點的鎖數量、被固定的場次與不在目前分配節點上的場次。
+
+Redis 鍵 (主連線)：
+    lockrouter:pins   hash，event_id -> "節點名稱:固定到期時間 (unix 秒)"
+"""
+
+import hashlib
+import re
+import time
+from collections import Counter
+
+PINS_KEY = 'lockrouter:pins'
+# 行程內快取固定表的秒數
+PIN_REFRESH_SECONDS = 5
+DEFAULT_NODE = 'default'
+
+# 以場次為 hash tag 的座位鎖與保留鍵
+LOCK_KEY_PATTERNS = ('seat_lock:{*', 'hold:{*')
+_event_tag_re = re.compile(rb'^[a-z_]+:\{(\d+)\}:')
+
+
+def _score(name, event_id):
+    digest = hashlib.blake2b(f"{name}:{event_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def rendezvous_node(names, event_id):
+    """依 rendezvous hashing 選出場次所屬的節點名稱。"""
+    return max(names, key=lambda name: _score(name, event_id))
+
+
+def encode_pin(node, expires_at):
+    return f"{node}:{int(expires_at)}"
+
+
+def parse_pins(raw, now=None):
+    """HGETALL 的結果 -> {event_id: 節點名稱}，略過已到期的固定。"""
+    now = time.time() if now is None else now
+    pins = {}
+    for event_id, value in raw.items():
+        if isinstance(event_id, bytes):
+            event_id, value = event_id.decode(), value.decode()
+        node, _, expires_at = value.rpartition(':')
+        if int(expires_at) > now:
+            pins[int(event_id)] = node
+    return pins
+
+
+class _BaseLockRouter:
+    def __init__(self, nodes, control_client=None, draining=()):
+        """
+        nodes 為 {名稱: Redis 客戶端} (至少一個)；control_client 為存放固定表的主連線，
+        只有多個節點時才會讀取。draining 中的節點不分配新場次。
+        """
+        if not nodes:
+            raise ValueError('At least one Redis lock node is required.')
+        self.nodes = dict(nodes)
+        self.control_client = control_client
+        self.draining = frozenset(draining)
+        self.names = [name for name in self.nodes if name not in self.draining] or list(self.nodes)
+        self._homes = {}
+        self._pins = {}
+        self._pins_loaded_at = None
+
+    @property
+    def partitioned(self):
+        return len(self.nodes) > 1
+
+    def home_node(self, event_id):
+        """不考慮固定時，場次依目前設定所屬的節點名稱。"""
+        node = self._homes.get(event_id)
+        if node is None:
+            node = self._homes[event_id] = rendezvous_node(self.names, event_id)
+        return node
+
+    def _pins_stale(self):
+        return (
+            self.partitioned and self.control_client is not None
+            and (self._pins_loaded_at is None or time.monotonic() - self._pins_loaded_at > PIN_REFRESH_SECONDS)
+        )
+
+    def _set_pins(self, raw):
+        self._pins = {event_id: node for event_id, node in parse_pins(raw).items() if node in self.nodes}
+        self._pins_loaded_at = time.monotonic()
+
+    def _node_for(self, event_id):
+        return self._pins.get(event_id) or self.home_node(event_id)
+
+
+class LockRouter(_BaseLockRouter):
+    """同步版本：依場次取得座位鎖所在節點的 Redis 客戶端。"""
+
+    @classmethod
+    def single(cls, client):
+        """所有場次都使用同一個客戶端 (未設定分區時)。"""
+        return cls({DEFAULT_NODE: client})
+
+    def node_for(self, event_id):
+        if self._pins_stale():
+            self._set_pins(self.control_client.hgetall(PINS_KEY))
+        return self._node_for(event_id)
+
+    def client_for(self, event_id):
+        return self.nodes[self.node_for(event_id)]
+
+
+class AsyncLockRouter(_BaseLockRouter):
+    """redis.asyncio 版本，節點客戶端與固定表的讀取都是 async。"""
+
+    @classmethod
+    def single(cls, client):
+        return cls({DEFAULT_NODE: client})
+
+    async def node_for(self, event_id):
+        if self._pins_stale():
+            self._set_pins(await self.control_client.hgetall(PINS_KEY))
+        return self._node_for(event_id)
+
+    async def client_for(self, event_id):
+        return self.nodes[await self.node_for(event_id)]
+
+
+def as_router(client_or_router, router_class=LockRouter):
+    """接受 Redis 客戶端 (單一節點) 或已建立的路由器。"""
+    if isinstance(client_or_router, _BaseLockRouter):
+        return client_or_router
+    return router_class.single(client_or_router)
+
+
+def live_events(client, count=1000):
+    """掃描節點上的座位鎖與保留鍵 (SCAN，不阻塞節點)，回傳 {event_id: 鍵數量}。"""
+    events = Counter()
+    for pattern in LOCK_KEY_PATTERNS:
+        for key in client.scan_iter(match=pattern, count=count):
+            match = _event_tag_re.match(key if isinstance(key, bytes) else key.encode())
+            if match:
+                events[int(match.group(1))] += 1
+    return events
+
+
+def plan_pins(node_events, new_names):
+    """
+    node_events 為 {節點名稱: {event_id: 鍵數量}} (目前各節點上仍有鎖的場次)，
+    回傳在新設定 (new_names，不含準備移除的節點) 下會換節點的場次：{event_id: 目前的節點名稱}。
+    """
+    return {
+        event_id: node
+        for node, events in node_events.items()
+        for event_id in events
+        if rendezvous_node(new_names, event_id) != node
+    }
+
+
+def load_pins(control_client):
+    """目前有效的固定：{event_id: 節點名稱}。"""
+    return parse_pins(control_client.hgetall(PINS_KEY))
+
+
+def pin_events(control_client, pins, expires_at):
+    """把場次固定在指定節點，pins 為 {event_id: 節點名稱}，expires_at 為 {event_id: unix 秒}。"""
+    if pins:
+        control_client.hset(PINS_KEY, mapping={
+            event_id: encode_pin(node, expires_at[event_id]) for event_id, node in pins.items()
+        })
+
+
+def unpin_events(control_client, event_ids=None):
+    """解除固定；event_ids 為 None 時解除全部 (同時清除已到期的項目)。"""
+    if event_ids is None:
+        return control_client.delete(PINS_KEY)
+    return control_client.hdel(PINS_KEY, *event_ids) if event_ids else 0
@@ -0,0 +1,283 @@
+# booking/locks.py
+
+"""
+座位鎖定管理模組。
+
+所有 seat_lock:{id} 鍵的取得、續期與釋放都集中在這裡，
+並透過伺服器端 Lua 腳本在單次往返內原子地完成，
+避免「先 GET 再 SET / DELETE」造成的競態條件。
+腳本只在建立管理器時註冊一次，之後一律以 EVALSHA 呼叫。
+
+鍵名以場次為 hash tag (seat_lock:{event_id}:seat_id)，所有操作都以場次為單位，
+由 lockrouter.py 決定場次的鎖位於哪個 Redis 節點；一次呼叫的所有座位須屬於同一個場次。
+"""
+
+from .lockrouter import AsyncLockRouter, as_router
+
+LOCK_KEY_PREFIX = 'seat_lock:'
+
+# acquire_many 的每個座位結果代碼
+LOCK_CONFLICT = 0   # 被其他會話持有
+LOCK_ACQUIRED = 1   # 新取得鎖
+LOCK_RENEWED = 2    # 本來就由同一會話持有，已續期
+LOCK_SKIPPED = -1   # 全有或全無模式下因其他座位衝突而未嘗試
+
+# KEYS: 鎖定鍵；ARGV[1]: 持有者, ARGV[2]: 秒數, ARGV[3]: '1' 表示全有或全無
+ACQUIRE_MANY_SCRIPT = """
+local owner = ARGV[1]
+local ttl = tonumber(ARGV[2])
+local all_or_nothing = ARGV[3] == '1'
+local results = {}
+
+if all_or_nothing then
+    local conflict = false
+    for i, key in ipairs(KEYS) do
+        local current = redis.call('GET', key)
+        if current and current ~= owner then
+            results[i] = 0
+            conflict = true
+        else
+            results[i] = -1
+        end
+    end
+    if conflict then
+        return results
+    end
+end
+
+for i, key in ipairs(KEYS) do
+    if redis.call('SET', key, owner, 'EX', ttl, 'NX') then
+        results[i] = 1
+    elseif redis.call('GET', key) == owner then
+        redis.call('EXPIRE', key, ttl)
+        results[i] = 2
+    else
+        results[i] = 0
+    end
+end
+return results
+"""
+
+# KEYS: 鎖定鍵；ARGV[1]: 持有者, ARGV[2]: 秒數
+RENEW_MANY_SCRIPT = """
+local owner = ARGV[1]
+local ttl = tonumber(ARGV[2])
+local results = {}
+for i, key in ipairs(KEYS) do
+    if redis.call('GET', key) == owner then
+        redis.call('EXPIRE', key, ttl)
+        results[i] = 1
+    else
+        results[i] = 0
+    end
+end
+return results
+"""
+
+# KEYS: 鎖定鍵；ARGV[1]: 持有者
+RELEASE_MANY_SCRIPT = """
+local owner = ARGV[1]
+local results = {}
+for i, key in ipairs(KEYS) do
+    if redis.call('GET', key) == owner then
+        redis.call('DEL', key)
+        results[i] = 1
+    else
+        results[i] = 0
+    end
+end
+return results
+"""
+
+
+def lock_key_prefix(event_id):
+    """場次座位鎖鍵的前綴 (含 hash tag)。"""
+    return f"{LOCK_KEY_PREFIX}{{{event_id}}}:"
+
+
+def seat_lock_key(event_id, seat_id):
+    return f"{lock_key_prefix(event_id)}{seat_id}"
+
+
+def _lock_keys(event_id, seat_ids):
+    return [seat_lock_key(event_id, seat_id) for seat_id in seat_ids]
+
+
+def seat_ids_by_event(seats):
+    """依場次分組 Seat 實例 (或具有 id 與 event_id 的物件)，回傳 {event_id: [seat_id, ...]}。"""
+    grouped = {}
+    for seat in seats:
+        grouped.setdefault(seat.event_id, []).append(seat.id)
+    return grouped
+
+
+def _inspect_result(seat_ids, values):
+    result = {}
+    for index, seat_id in enumerate(seat_ids):
+        owner, ttl = values[2 * index], values[2 * index + 1]
+        result[seat_id] = (owner.decode('utf-8') if owner is not None else None, ttl)
+    return result
+
+
+class SeatLockManager:
+    """
+    以 Lua 腳本批次操作座位鎖的管理器。
+    可傳入任何相容 redis-py 的客戶端 (包含 fakeredis，所有鎖在同一個節點)，
+    或 LockRouter (依場次分散到多個節點)。
+    """
+
+    def __init__(self, client):
+        self.router = as_router(client)
+        registered = next(iter(self.router.nodes.values()))
+        self._acquire_many = registered.register_script(ACQUIRE_MANY_SCRIPT)
+        self._renew_many = registered.register_script(RENEW_MANY_SCRIPT)
+        self._release_many = registered.register_script(RELEASE_MANY_SCRIPT)
+
+    def client_for(self, event_id):
+        """場次的座位鎖所在節點的客戶端。"""
+        return self.router.client_for(event_id)
+
+    def acquire_many(self, event_id, seat_ids, owner, ttl_seconds, all_or_nothing=False):
+        """
+        嘗試為 owner 鎖定場次的多個座位，回傳 {seat_id: 結果代碼}。
+        已由同一 owner 持有的鎖會被續期並視為成功 (LOCK_RENEWED)。
+        """
+        seat_ids = list(seat_ids)
+        if not seat_ids:
+            return {}
+        codes = self._acquire_many(
+            keys=_lock_keys(event_id, seat_ids),
+            args=[owner, int(ttl_seconds), '1' if all_or_nothing else '0'],
+            client=self.client_for(event_id),
+        )
+        return {seat_id: int(code) for seat_id, code in zip(seat_ids, codes)}
+
+    def renew_many(self, event_id, seat_ids, owner, ttl_seconds):
+        """
+        僅續期仍由 owner 持有的鎖，回傳成功續期的座位 ID 列表。
+        不檢查續期上限；以保留 (holds.py) 鎖定的座位應改用 HoldManager.renew。
+        """
+        seat_ids = list(seat_ids)
+        if not seat_ids:
+            return []
+        codes = self._renew_many(
+            keys=_lock_keys(event_id, seat_ids),
+            args=[owner, int(ttl_seconds)],
+            client=self.client_for(event_id),
+        )
+        return [seat_id for seat_id, code in zip(seat_ids, codes) if int(code) == 1]
+
+    def release_many(self, event_id, seat_ids, owner, pipeline=None):
+        """
+        僅釋放仍由 owner 持有的鎖 (原子比對後刪除)，回傳成功釋放的座位 ID 列表。
+        傳入 pipeline (須為場次所在節點的 pipeline) 時只把腳本排入，由呼叫端執行，此時回傳 None。
+        """
+        seat_ids = list(seat_ids)
+        if not seat_ids:
+            return []
+        if pipeline is not None:
+            self._release_many(keys=_lock_keys(event_id, seat_ids), args=[owner], client=pipeline)
+            return None
+        codes = self._release_many(
+            keys=_lock_keys(event_id, seat_ids),
+            args=[owner],
+            client=self.client_for(event_id),
+        )
+        return [seat_id for seat_id, code in zip(seat_ids, codes) if int(code) == 1]
+
+    def clear_many(self, event_id, seat_ids):
+        """不論持有者，直接刪除場次的多個座位鎖 (例如訂單取消時)。"""
+        seat_ids = list(seat_ids)
+        if not seat_ids:
+            return 0
+        return self.client_for(event_id).delete(*_lock_keys(event_id, seat_ids))
+
+    def owners_many(self, event_id, seat_ids):
+        """以單次 MGET 取得場次多個座位目前的鎖定持有者，回傳 {seat_id: owner 或 None}。"""
+        seat_ids = list(seat_ids)
+        if not seat_ids:
+            return {}
+        values = self.client_for(event_id).mget(_lock_keys(event_id, seat_ids))
+        return {
+            seat_id: value.decode('utf-8') if value is not None else None
+            for seat_id, value in zip(seat_ids, values)
+        }
+
+    def inspect_many(self, event_id, seat_ids):
+        """以單一 pipeline 取得場次多個座位鎖的持有者與剩餘秒數，回傳 {seat_id: (owner 或 None, ttl)}。"""
+        seat_ids = list(seat_ids)
+        if not seat_ids:
+            return {}
+        pipe = self.client_for(event_id).pipeline(transaction=False)
+        for key in _lock_keys(event_id, seat_ids):
+            pipe.get(key)
+            pipe.ttl(key)
+        return _inspect_result(seat_ids, pipe.execute())
+
+    def inspect_seats(self, seats):
+        """inspect_many 的跨場次版本：seats 為 Seat 實例，每個場次一次 pipeline。"""
+        result = {}
+        for event_id, seat_ids in seat_ids_by_event(seats).items():
+            result.update(self.inspect_many(event_id, seat_ids))
+        return result
+
+
+class AsyncSeatLockManager:
+    """
+    SeatLockManager 的 redis.asyncio 版本，供 async 視圖使用。
+    使用相同的 Lua 腳本與結果代碼，與同步版本操作的是同一組鎖。
+    """
+
+    def __init__(self, client):
+        self.router = as_router(client, AsyncLockRouter)
+        registered = next(iter(self.router.nodes.values()))
+        self._acquire_many = registered.register_script(ACQUIRE_MANY_SCRIPT)
+        self._renew_many = registered.register_script(RENEW_MANY_SCRIPT)
+        self._release_many = registered.register_script(RELEASE_MANY_SCRIPT)
+
+    async def acquire_many(self, event_id, seat_ids, owner, ttl_seconds, all_or_nothing=False):
+        """嘗試為 owner 鎖定場次的多個座位，回傳 {seat_id: 結果代碼}。"""
+        seat_ids = list(seat_ids)
+        if not seat_ids:
+            return {}
+        codes = await self._acquire_many(
+            keys=_lock_keys(event_id, seat_ids),
+            args=[owner, int(ttl_seconds), '1' if all_or_nothing else '0'],
+            client=await self.router.client_for(event_id),
+        )
+        return {seat_id: int(code) for seat_id, code in zip(seat_ids, codes)}
+
+    async def renew_many(self, event_id, seat_ids, owner, ttl_seconds):
+        """僅續期仍由 owner 持有的鎖，回傳成功續期的座位 ID 列表。"""
+        seat_ids = list(seat_ids)
+        if not seat_ids:
+            return []
+        codes = await self._renew_many(
+            keys=_lock_keys(event_id, seat_ids),
+            args=[owner, int(ttl_seconds)],
+            client=await self.router.client_for(event_id),
+        )
+        return [seat_id for seat_id, code in zip(seat_ids, codes) if int(code) == 1]
+
+    async def release_many(self, event_id, seat_ids, owner):
+        """僅釋放仍由 owner 持有的鎖，回傳成功釋放的座位 ID 列表。"""
+        seat_ids = list(seat_ids)
+        if not seat_ids:
+            return []
+        codes = await self._release_many(
+            keys=_lock_keys(event_id, seat_ids),
+            args=[owner],
+            client=await self.router.client_for(event_id),
+        )
+        return [seat_id for seat_id, code in zip(seat_ids, codes) if int(code) == 1]
+
+    async def owners_many(self, event_id, seat_ids):
+        """以單次 MGET 取得場次多個座位目前的鎖定持有者，回傳 {seat_id: owner 或 None}。"""
+        seat_ids = list(seat_ids)
+        if not seat_ids:
+            return {}
+        values = await (await self.router.client_for(event_id)).mget(_lock_keys(event_id, seat_ids))
+        return {
+            seat_id: value.decode('utf-8') if value is not None else None
+            for seat_id, value in zip(seat_ids, values)
+        }
@@ -0,0 +1,209 @@
+# booking/lockstate.py
+
+"""
+座位「鎖定中」狀態的儲存位置。
+
+settings.SEAT_LOCK_STATE['MODE']：
+    database  (預設) 鎖定 / 解鎖 / 續期時同步寫入 Seat 的 status、locked_until、locked_by_session
+    redis     鎖定中的狀態只存在 Redis (座位鎖與座位狀態位元圖)，選座期間不寫資料庫；
+              Seat 只保存持久的狀態 (available / registered)，由下單與取消流程寫入
+
+redis 模式下：
+    - WRITE_BEHIND 為 True 時，鎖定狀態有變動的座位會記入 dirty 集合，
+      由 manage.py flush_seat_locks 批次把鎖定狀態鏡像回資料庫 (供報表與後台查看)；
+      關閉時資料庫完全不記錄鎖定中的狀態
+    - 資料庫中的 'locked' 只是鏡像，是否可鎖定一律以 Redis 鎖為準
+    - 座位圖位元圖重建與完整座位列表 (/api/events/{id}/seats/) 會以 Redis 鎖補上鎖定中的狀態
+    - 鎖到期時不會有任何請求寫入，另以 sorted set 記錄每個鎖的到期時間，
+      由回收程式 (release_expired_locks) 把到期的座位在位元圖中改回可選
+
+Redis 鍵：
+    lockstate:expiring   sorted set，"{event_id}:{seat_id}" -> 鎖的到期時間 (unix 秒)
+    lockstate:dirty      set，等待寫回資料庫的座位 "{event_id}:{seat_id}"
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+
+MODE_DATABASE = 'database'
+MODE_REDIS = 'redis'
+
+EXPIRING_KEY = 'lockstate:expiring'
+DIRTY_KEY = 'lockstate:dirty'
+
+# KEYS[1]: expiring；ARGV[1]: 現在時間, ARGV[2..]: 成對的 項目, 座位鎖剩餘秒數
+# 座位鎖可能位於其他節點 (見 lockrouter.py)，因此由呼叫端先查詢鎖的剩餘秒數：
+# 仍存在 (已續期) 時依剩餘秒數更新到期時間，不存在時移除並回傳，由呼叫端把座位改回可選。
+# 查詢之後才被重新鎖定的項目到期時間已晚於現在，不會被處理
+EXPIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local expired = {}
+for i = 2, #ARGV, 2 do
+    local member = ARGV[i]
+    local ttl = tonumber(ARGV[i + 1])
+    local score = redis.call('ZSCORE', KEYS[1], member)
+    if score and tonumber(score) <= now then
+        if ttl > 0 then
+            redis.call('ZADD', KEYS[1], now + ttl, member)
+        else
+            redis.call('ZREM', KEYS[1], member)
+            expired[#expired + 1] = member
+        end
+    end
+end
+return expired
+"""
+
+
+def redis_authoritative():
+    """鎖定中的狀態是否只存在 Redis。"""
+    return settings.SEAT_LOCK_STATE['MODE'] == MODE_REDIS
+
+
+def write_behind_enabled():
+    return redis_authoritative() and settings.SEAT_LOCK_STATE['WRITE_BEHIND']
+
+
+def lockable_statuses():
+    """可以嘗試鎖定的資料庫狀態；redis 模式下 'locked' 只是鏡像，由 Redis 鎖決定。"""
+    if redis_authoritative():
+        return ('available', 'cancelled', 'locked')
+    return ('available', 'cancelled')
+
+
+def member(event_id, seat_id):
+    return f"{event_id}:{seat_id}"
+
+
+def parse_member(value):
+    """'{event_id}:{seat_id}' -> (event_id, seat_id)。"""
+    if isinstance(value, bytes):
+        value = value.decode()
+    event_id, seat_id = value.split(':')
+    return int(event_id), int(seat_id)
+
+
+def _group(pairs):
+    grouped = {}
+    for event_id, seat_id in pairs:
+        grouped.setdefault(event_id, []).append(seat_id)
+    return grouped
+
+
+def _locked_commands(pipe, seats):
+    members = [member(seat.event_id, seat.id) for seat in seats]
+    pipe.zadd(EXPIRING_KEY, {
+        value: seat.locked_until.timestamp() for value, seat in zip(members, seats)
+    })
+    if settings.SEAT_LOCK_STATE['WRITE_BEHIND']:
+        pipe.sadd(DIRTY_KEY, *members)
+
+
+def _released_commands(pipe, seats):
+    members = [member(seat.event_id, seat.id) for seat in seats]
+    pipe.zrem(EXPIRING_KEY, *members)
+    if settings.SEAT_LOCK_STATE['WRITE_BEHIND']:
+        pipe.sadd(DIRTY_KEY, *members)
+
+
+def apply_redis_locks(seats, lock_manager, now=None):
+    """
+    以 Redis 鎖覆寫 Seat 實例 (記憶體中) 的鎖定狀態，讓序列化結果反映實際的鎖定情形。
+    只在 redis 模式下有作用；已登記的座位不受影響。
+    """
+    if not redis_authoritative():
+        return seats
+    candidates = [seat for seat in seats if seat.status in lockable_statuses()]
+    if not candidates:
+        return seats
+    now = now or timezone.now()
+    locks = lock_manager.inspect_seats(candidates)
+    for seat in candidates:
+        owner, ttl = locks[seat.id]
+        if owner is not None:
+            seat.status = 'locked'
+            seat.locked_by_session = owner
+            seat.locked_until = now + timedelta(seconds=max(ttl, 0))
+        elif seat.status == 'locked':
+            seat.status = 'available'
+            seat.locked_by_session = None
+            seat.locked_until = None
+    return seats
+
+
+class LockStateJournal:
+    """
+    redis 模式下記錄鎖定狀態的變動 (到期時間與待寫回的座位)；database 模式下不做任何事。
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._expire = client.register_script(EXPIRE_SCRIPT)
+
+    def _run(self, build, pipeline):
+        pipe = pipeline if pipeline is not None else self.client.pipeline(transaction=False)
+        build(pipe)
+        if pipeline is None:
+            pipe.execute()
+
+    def locked(self, seats, pipeline=None):
+        """座位被鎖定或續期，到期時間取自 seat.locked_until。"""
+        seats = list(seats)
+        if seats and redis_authoritative():
+            self._run(lambda pipe: _locked_commands(pipe, seats), pipeline)
+
+    def released(self, seats, pipeline=None):
+        """座位的鎖已釋放 (解鎖、下單或取消)。"""
+        seats = list(seats)
+        if seats and redis_authoritative():
+            self._run(lambda pipe: _released_commands(pipe, seats), pipeline)
+
+    def pop_expired(self, now, batch_size, lock_manager):
+        """
+        取出一批鎖已到期的座位，回傳 (鎖確實已不存在的 [(event_id, seat_id), ...], 本批檢查的數量)。
+        """
+        timestamp = int(now.timestamp())
+        members = self.client.zrangebyscore(EXPIRING_KEY, '-inf', timestamp, start=0, num=batch_size)
+        if not members:
+            return [], 0
+        seats = [parse_member(value) for value in members]
+        locks = {}
+        for event_id, seat_ids in _group(seats).items():
+            locks.update(lock_manager.inspect_many(event_id, seat_ids))
+        args = [timestamp]
+        for event_id, seat_id in seats:
+            args += [member(event_id, seat_id), locks[seat_id][1] if locks[seat_id][0] is not None else 0]
+        expired = self._expire(keys=[EXPIRING_KEY], args=args)
+        return [parse_member(value) for value in expired], len(members)
+
+    def mark_dirty(self, seats):
+        if seats and write_behind_enabled():
+            self.client.sadd(DIRTY_KEY, *[member(seat.event_id, seat.id) for seat in seats])
+
+    def pop_dirty(self, batch_size):
+        """取出一批待寫回的座位，回傳 [(event_id, seat_id), ...]。"""
+        return [parse_member(value) for value in self.client.spop(DIRTY_KEY, batch_size) or []]
+
+
+class AsyncLockStateJournal:
+    """LockStateJournal 的 redis.asyncio 版本，供 async 視圖使用。"""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def locked(self, seats):
+        seats = list(seats)
+        if seats and redis_authoritative():
+            pipe = self.client.pipeline(transaction=False)
+            _locked_commands(pipe, seats)
+            await pipe.execute()
+
+    async def released(self, seats):
+        seats = list(seats)
+        if seats and redis_authoritative():
+            pipe = self.client.pipeline(transaction=False)
+            _released_commands(pipe, seats)
+            await pipe.execute()
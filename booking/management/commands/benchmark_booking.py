@@ -0,0 +1,96 @@
+# booking/management/commands/benchmark_booking.py
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.benchmark import CONTENTION_MODES, LOCK_STATE_MODES, run_benchmark
+
+
+class Command(BaseCommand):
+    help = '在獨立的測試資料庫中以多執行緒壓測「鎖定 → 下單 → 取消」流程，輸出 JSON 結果。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=2, help='建立的場次數 (預設 2)')
+        parser.add_argument('--seats', type=int, default=500, help='每個場次的座位數 (預設 500)')
+        parser.add_argument('--workers', type=int, default=8, help='同時執行的客戶端數 (預設 8)')
+        parser.add_argument('--cycles', type=int, default=50, help='每個客戶端執行的流程次數 (預設 50)')
+        parser.add_argument('--seats-per-order', type=int, default=2, help='每張訂單的座位數 (預設 2)')
+        parser.add_argument(
+            '--contention', choices=CONTENTION_MODES, default='hot-rows',
+            help='座位競爭程度：disjoint 無競爭、same 全部搶同一組座位、hot-rows 集中在前幾排 (預設)',
+        )
+        parser.add_argument(
+            '--cancel-ratio', type=float, default=1.0,
+            help='成功下單後立即取消的比例 (預設 1.0，座位會被釋放重複使用)',
+        )
+        parser.add_argument(
+            '--redis', choices=('fake', 'real'), default='fake',
+            help='fake 使用 fakeredis (需另行安裝)；real 使用 settings.REDIS 的伺服器',
+        )
+        parser.add_argument(
+            '--redis-db', type=int, default=15,
+            help='--redis real 時使用的 db 編號，開始前會被清空 (預設 15)',
+        )
+        parser.add_argument(
+            '--lock-state', choices=LOCK_STATE_MODES, default='database',
+            help='座位鎖定狀態的儲存模式：database 同步寫入資料庫 (預設)、redis 只存在 Redis',
+        )
+        parser.add_argument(
+            '--lock-nodes', type=int, default=1,
+            help='--redis fake 時把座位鎖依場次分散到幾個 fakeredis 伺服器 (預設 1)',
+        )
+        parser.add_argument(
+            '--lock-node-url', action='append', default=[],
+            help='--redis real 時的座位鎖節點 (可重複指定，例如多個本機 redis-server)，開始前會被清空',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='亂數種子')
+        parser.add_argument('--output', help='將 JSON 結果寫入檔案 (預設輸出到標準輸出)')
+
+    def handle(self, *args, **options):
+        if options['redis'] == 'fake':
+            try:
+                import fakeredis  # noqa: F401
+            except ImportError:
+                raise CommandError('--redis fake requires the fakeredis package (pip install fakeredis).')
+        if options['seats_per_order'] < 1 or options['workers'] < 1 or options['events'] < 1:
+            raise CommandError('--events, --workers and --seats-per-order must be at least 1.')
+        if not 0 <= options['cancel_ratio'] <= 1:
+            raise CommandError('--cancel-ratio must be between 0 and 1.')
+        if options['lock_nodes'] < 1:
+            raise CommandError('--lock-nodes must be at least 1.')
+        if options['lock_node_url'] and options['redis'] != 'real':
+            raise CommandError('--lock-node-url requires --redis real.')
+
+        try:
+            result = run_benchmark(
+                events=options['events'],
+                seats=options['seats'],
+                workers=options['workers'],
+                cycles=options['cycles'],
+                contention=options['contention'],
+                seats_per_order=options['seats_per_order'],
+                cancel_ratio=options['cancel_ratio'],
+                redis_mode=options['redis'],
+                redis_db=options['redis_db'],
+                seed_value=options['seed'],
+                lock_state=options['lock_state'],
+                lock_nodes=options['lock_nodes'],
+                lock_node_urls=options['lock_node_url'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        output = json.dumps(result, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+            self.stdout.write(f"Benchmark results written to {options['output']}.")
+        else:
+            self.stdout.write(output)
+
+        if result['double_bookings'] or result['inconsistent_seats']:
+            raise CommandError(
+                f"Double booking detected: {result['double_bookings']} overlapping holdings, "
+                f"{result['inconsistent_seats']} inconsistent seats."
+            )
@@ -0,0 +1,46 @@
+# booking/management/commands/cancel_orders.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.models import Event
+from booking.services import order_canceller
+
+
+class Command(BaseCommand):
+    help = (
+        '分批取消訂單並釋放座位：指定訂單 ID，或以 --event 取消整個場次的所有訂單。'
+        '每批各自提交，中斷後重新執行 (或加上 --after-id) 即從尚未取消的訂單繼續。'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('order_ids', nargs='*', type=int, help='要取消的訂單 ID')
+        parser.add_argument('--event', type=int, help='取消此場次的所有訂單')
+        parser.add_argument('--batch-size', type=int, default=200, help='每個交易處理的訂單數 (預設 200)')
+        parser.add_argument('--pause', type=float, default=0.05, help='批次之間暫停的秒數，讓線上流量先行 (預設 0.05)')
+        parser.add_argument('--after-id', type=int, default=0, help='只處理 ID 大於此值的訂單 (上次回報的 last order id)')
+
+    def handle(self, *args, **options):
+        if bool(options['order_ids']) == bool(options['event']):
+            raise CommandError('Pass either order IDs or --event, not both.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        if options['event'] and not Event.objects.filter(pk=options['event']).exists():
+            raise CommandError(f"Event {options['event']} does not exist.")
+
+        def report(progress):
+            self.stdout.write(
+                f"batch {progress.batches}: {progress.orders} orders, {progress.seats} seats released "
+                f"(last order id {progress.last_order_id})"
+            )
+
+        result = order_canceller.cancel(
+            order_ids=options['order_ids'] or None,
+            event_id=options['event'],
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            after_id=options['after_id'],
+            progress=report,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Cancelled {result.orders} orders and released {result.seats} seats in {result.batches} batches."
+        ))
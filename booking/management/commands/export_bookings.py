@@ -0,0 +1,38 @@
+# booking/management/commands/export_bookings.py
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.exports import EXPORTS, FORMATS, encoded_chunks, export_lines
+from booking.models import Event
+
+
+class Command(BaseCommand):
+    help = '以串流方式匯出訂單、訂單項或場次座位名冊 (CSV / NDJSON)，記憶體用量不隨資料量增加。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS), help='匯出種類：orders、order-items 或 seats (座位名冊)')
+        parser.add_argument('--event', type=int, help='只匯出此場次 ID (匯出 seats 時必填)')
+        parser.add_argument('--status', help='只匯出此狀態的訂單 (或座位)')
+        parser.add_argument('--format', dest='output_format', choices=list(FORMATS), default='csv', help='輸出格式 (預設 csv)')
+        parser.add_argument('--output', help='輸出檔案路徑 (預設輸出到標準輸出)')
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        event_id = options['event']
+        if kind == 'seats' and event_id is None:
+            raise CommandError('--event is required when exporting seats.')
+        if event_id is not None and not Event.objects.filter(pk=event_id).exists():
+            raise CommandError(f"Event {event_id} does not exist.")
+
+        lines = export_lines(kind, options['output_format'], event_id=event_id, status=options['status'])
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for chunk in encoded_chunks(lines):
+                    f.write(chunk)
+            self.stderr.write(f"Exported {kind} to {options['output']}.")
+        else:
+            for chunk in encoded_chunks(lines):
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,28 @@
+# booking/management/commands/flush_seat_locks.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.lockstate import write_behind_enabled
+from booking.writebehind import run_once
+
+
+class Command(BaseCommand):
+    help = "SEAT_LOCK_STATE 為 redis 模式時，持續把 Redis 中的座位鎖定狀態批次寫回資料庫。"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=2.0, help='每輪寫回間隔秒數 (預設 2)')
+        parser.add_argument('--batch-size', type=int, default=500, help='每次 bulk_update 處理的座位數 (預設 500)')
+        parser.add_argument('--once', action='store_true', help='只執行一輪後結束')
+
+    def handle(self, *args, **options):
+        if not write_behind_enabled():
+            raise CommandError("SEAT_LOCK_STATE must use MODE 'redis' with WRITE_BEHIND enabled.")
+        while True:
+            changed = run_once(batch_size=options['batch_size'])
+            if changed:
+                self.stdout.write(f"Wrote back lock state for {changed} seats.")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
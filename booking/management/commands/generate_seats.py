@@ -0,0 +1,49 @@
+# booking/management/commands/generate_seats.py
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.inventory import LayoutError, generate_event_seats, clone_event_seats
+from booking.models import Event
+from booking.services import seat_map_index
+
+
+class Command(BaseCommand):
+    help = '依場地佈局資料 (或另一場次) 批次產生場次的所有座位。佈局格式請見 booking/inventory.py。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_id', type=int, help='要產生座位的場次 ID')
+        parser.add_argument('--layout', help='佈局 JSON 檔案路徑 (預設使用場地的 layout_data)')
+        parser.add_argument('--clone-from', type=int, help='改為複製此場次 ID 的座位配置')
+        parser.add_argument('--replace', action='store_true', help='先刪除場次現有的座位')
+        parser.add_argument('--batch-size', type=int, default=2000, help='每次 bulk_create 的筆數 (預設 2000)')
+
+    def handle(self, *args, **options):
+        try:
+            event = Event.objects.select_related('venue').get(pk=options['event_id'])
+        except Event.DoesNotExist:
+            raise CommandError(f"Event {options['event_id']} does not exist.")
+
+        try:
+            if options['clone_from'] is not None:
+                try:
+                    source_event = Event.objects.get(pk=options['clone_from'])
+                except Event.DoesNotExist:
+                    raise CommandError(f"Event {options['clone_from']} does not exist.")
+                created = clone_event_seats(
+                    source_event, event, replace=options['replace'], batch_size=options['batch_size']
+                )
+            else:
+                layout = None
+                if options['layout']:
+                    with open(options['layout'], encoding='utf-8') as f:
+                        layout = json.load(f)
+                created = generate_event_seats(
+                    event, layout=layout, replace=options['replace'], batch_size=options['batch_size']
+                )
+        except LayoutError as e:
+            raise CommandError(str(e))
+
+        seat_map_index.invalidate(event.id)
+        self.stdout.write(self.style.SUCCESS(f"Created {created} seats for event {event.id}."))
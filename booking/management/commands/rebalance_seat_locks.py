@@ -0,0 +1,100 @@
+# booking/management/commands/rebalance_seat_locks.py
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.connections import lock_router, redis_client
+from booking.holds import hold_policy
+from booking.lockrouter import live_events, load_pins, pin_events, plan_pins, unpin_events
+from booking.models import Event
+
+
+class Command(BaseCommand):
+    help = (
+        '座位鎖節點的重新平衡 (見 booking/lockrouter.py)。'
+        'status 列出各節點的鎖；pin 在變更 REDIS_LOCK_NODES 前把仍有鎖、且會換節點的場次固定在目前的節點；'
+        'unpin 解除固定。'
+    )
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action', required=True)
+        subcommands.add_parser('status', help='列出各節點的鎖數量與被固定的場次')
+
+        pin = subcommands.add_parser('pin', help='依新的節點設定固定會換節點的場次')
+        pin.add_argument(
+            '--nodes', required=True,
+            help='新設定的節點名稱，以逗號分隔 (例如 a,b,c)；從單一節點改為分區時，'
+                 '目前的主連線在新設定中須命名為 default',
+        )
+        pin.add_argument('--draining', default='', help='新設定中準備移除的節點名稱，以逗號分隔')
+        pin.add_argument(
+            '--grace', type=int, default=300,
+            help='固定時間在場次保留上限秒數之外再加上的秒數 (預設 300，涵蓋部署所需時間)',
+        )
+        pin.add_argument('--dry-run', action='store_true', help='只列出會被固定的場次')
+
+        unpin = subcommands.add_parser('unpin', help='解除固定')
+        unpin.add_argument('event_ids', nargs='*', type=int, help='場次 ID (省略時解除全部)')
+
+    def handle(self, *args, **options):
+        if settings.REDIS_LOCK_CLUSTER_URL:
+            raise CommandError('Redis Cluster moves keys itself when slots are resharded; pins are not used.')
+        getattr(self, f"_{options['action']}")(options)
+
+    def _node_events(self):
+        return {name: live_events(client) for name, client in lock_router.nodes.items()}
+
+    def _status(self, options):
+        pins = load_pins(redis_client)
+        for name, events in self._node_events().items():
+            draining = ' (draining)' if name in lock_router.draining else ''
+            self.stdout.write(f"{name}{draining}: {sum(events.values())} keys across {len(events)} events")
+            for event_id, count in sorted(events.items()):
+                home = lock_router.home_node(event_id)
+                notes = []
+                if pins.get(event_id) == name:
+                    notes.append('pinned')
+                if home != name:
+                    notes.append(f'home: {home}')
+                suffix = f" [{', '.join(notes)}]" if notes else ''
+                self.stdout.write(f"  event {event_id}: {count} keys{suffix}")
+        if pins:
+            self.stdout.write(f"Pinned events: {', '.join(f'{e}->{n}' for e, n in sorted(pins.items()))}")
+
+    def _pin(self, options):
+        new_nodes = [name.strip() for name in options['nodes'].split(',') if name.strip()]
+        draining = {name.strip() for name in options['draining'].split(',') if name.strip()}
+        new_names = [name for name in new_nodes if name not in draining]
+        if not new_names:
+            raise CommandError('--nodes must list at least one node that is not draining.')
+
+        pins = plan_pins(self._node_events(), new_names)
+        missing = {node for node in pins.values() if node not in new_nodes}
+        if missing:
+            raise CommandError(
+                f"Events still hold locks on {', '.join(sorted(missing))}; keep those nodes in --nodes "
+                f"(and list them in --draining) until the locks expire."
+            )
+
+        now = time.time()
+        expires_at = {}
+        for event in Event.objects.filter(id__in=pins).only('id', 'hold_ttl_seconds', 'hold_max_seconds'):
+            _, max_seconds = hold_policy(event)
+            expires_at[event.id] = now + max_seconds + options['grace']
+        # 已刪除的場次不會再有新鎖，只需等待現有的鎖到期
+        default_max = settings.SEAT_HOLDS['MAX_SECONDS']
+        for event_id in pins:
+            expires_at.setdefault(event_id, now + default_max + options['grace'])
+
+        for event_id, node in sorted(pins.items()):
+            self.stdout.write(f"event {event_id} -> {node} for {int(expires_at[event_id] - now)}s")
+        if options['dry_run']:
+            return
+        pin_events(redis_client, pins, expires_at)
+        self.stdout.write(f"Pinned {len(pins)} events.")
+
+    def _unpin(self, options):
+        removed = unpin_events(redis_client, options['event_ids'] or None)
+        self.stdout.write(f"Removed {removed} pin entries.")
@@ -0,0 +1,25 @@
+# booking/management/commands/release_expired_locks.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from booking.reaper import run_once
+
+
+class Command(BaseCommand):
+    help = '持續回收 Redis 鎖已過期、但資料庫仍標記為 locked 的座位。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5.0, help='每輪掃描間隔秒數 (預設 5)')
+        parser.add_argument('--batch-size', type=int, default=500, help='每次 UPDATE 處理的座位數 (預設 500)')
+        parser.add_argument('--once', action='store_true', help='只執行一輪後結束')
+
+    def handle(self, *args, **options):
+        while True:
+            released = run_once(batch_size=options['batch_size'])
+            if released:
+                self.stdout.write(f"Released {released} expired seat locks.")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
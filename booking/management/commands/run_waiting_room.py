@@ -0,0 +1,31 @@
+# booking/management/commands/run_waiting_room.py
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from booking.services import waiting_room
+from booking.waiting_room import AdmissionScheduler
+
+
+class Command(BaseCommand):
+    help = '依各場次的 admission_rate 持續從虛擬排隊室放行排隊者。'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=settings.WAITING_ROOM['TICK_SECONDS'],
+            help='每輪放行間隔秒數 (預設為 settings.WAITING_ROOM 的 TICK_SECONDS)',
+        )
+        parser.add_argument('--once', action='store_true', help='只執行一輪後結束')
+
+    def handle(self, *args, **options):
+        scheduler = AdmissionScheduler(waiting_room)
+        while True:
+            admitted = scheduler.tick()
+            total = sum(admitted.values())
+            if total:
+                self.stdout.write(f"Admitted {total} users across {len(admitted)} events.")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-17 10:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0004_remove_order_buyer_email_remove_order_buyer_phone'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='seat',
+            index=models.Index(fields=['status', 'locked_until'], name='seat_status_locked_until_idx'),
+        ),
+    ]
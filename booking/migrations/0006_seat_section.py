@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 10:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0005_seat_status_locked_until_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seat',
+            name='section',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='區域'),
+        ),
+    ]
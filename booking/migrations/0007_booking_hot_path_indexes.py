@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-17 10:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0006_seat_section'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='seat',
+            options={'ordering': ['event_id', 'row', 'column'], 'verbose_name': '座位', 'verbose_name_plural': '座位'},
+        ),
+        migrations.RemoveIndex(
+            model_name='seat',
+            name='seat_status_locked_until_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at'], name='order_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['event', 'status', '-created_at'], name='order_event_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seat',
+            index=models.Index(fields=['event', 'status'], name='seat_event_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seat',
+            index=models.Index(condition=models.Q(('status__in', ['available', 'cancelled'])), fields=['event', 'row', 'column'], name='seat_available_by_event_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seat',
+            index=models.Index(condition=models.Q(('status', 'locked')), fields=['locked_until'], name='seat_locked_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='seat',
+            index=models.Index(condition=models.Q(('locked_by_session__isnull', False)), fields=['locked_by_session'], name='seat_locked_by_session_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-17 10:56
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0008_event_waiting_room'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='hold_max_seconds',
+            field=models.PositiveIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(30)], verbose_name='座位保留續期上限秒數'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='hold_ttl_seconds',
+            field=models.PositiveIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(30)], verbose_name='座位保留秒數'),
+        ),
+    ]
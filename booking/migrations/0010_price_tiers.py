@@ -0,0 +1,57 @@
+# Generated by Django 5.2.4 on 2026-10-17 11:17
+
+from collections import Counter
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_price_tiers(apps, schema_editor):
+    """為現有座位依 (場次, 區域, 價格) 建立票價等級；名稱規則與 booking.pricing.tier_names 相同。"""
+    Seat = apps.get_model('booking', 'Seat')
+    PriceTier = apps.get_model('booking', 'PriceTier')
+    groups = sorted(set(Seat.objects.values_list('event_id', 'section', 'price')))
+    section_prices = Counter((event_id, section) for event_id, section, _ in groups)
+    tiers = {}
+    for event_id, section, price in groups:
+        name = section or 'General'
+        existing = tiers.get((event_id, name))
+        if section_prices[(event_id, section)] > 1 or (existing is not None and existing.price != price):
+            name = f"{name} {price}"
+        tier = tiers.get((event_id, name))
+        if tier is None:
+            tier = tiers[(event_id, name)] = PriceTier.objects.create(event_id=event_id, name=name, price=price)
+        Seat.objects.filter(event_id=event_id, section=section, price=price).update(price_tier=tier)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0009_event_hold_policy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, verbose_name='等級名稱')),
+                ('price', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)], verbose_name='票價')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_tiers', to='booking.event', verbose_name='所屬場次')),
+            ],
+            options={
+                'verbose_name': '票價等級',
+                'verbose_name_plural': '票價等級',
+                'ordering': ['event_id', 'name'],
+                'unique_together': {('event', 'name')},
+            },
+        ),
+        migrations.AddField(
+            model_name='seat',
+            name='price_tier',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='seats', to='booking.pricetier', verbose_name='票價等級'),
+        ),
+        migrations.RunPython(create_price_tiers, migrations.RunPython.noop),
+    ]
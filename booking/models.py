@@ -40,6 +40,24 @@ class Event(models.Model):
         verbose_name="基本票價"
     )
     is_active = models.BooleanField(default=True, verbose_name="是否啟用")
+    # 熱門場次開賣時啟用虛擬排隊室，只有被放行的排隊憑證可以鎖定座位與下單 (見 booking/waiting_room.py)
+    waiting_room_enabled = models.BooleanField(default=False, verbose_name="啟用排隊室")
+    admission_rate = models.PositiveIntegerField(
+        default=50,
+        validators=[MinValueValidator(1)],
+        verbose_name="每秒放行人數"
+    )
+    # 座位保留 (hold) 的時間政策，未設定時使用 settings.SEAT_HOLDS 的預設值 (見 booking/holds.py)
+    hold_ttl_seconds = models.PositiveIntegerField(
+        null=True, blank=True,
+        validators=[MinValueValidator(30)],
+        verbose_name="座位保留秒數"
+    )
+    hold_max_seconds = models.PositiveIntegerField(
+        null=True, blank=True,
+        validators=[MinValueValidator(30)],
+        verbose_name="座位保留續期上限秒數"
+    )
 
     class Meta:
         verbose_name = "場次"
@@ -49,7 +67,32 @@ class Event(models.Model):
         ordering = ['event_date', 'event_time', 'venue__name']
 
     def __str__(self):
-        return f"{self.name} - {self.event_date} {self.event_time} ({self.venue.name})"
+        # 場地尚未載入時從快取讀取，避免每次顯示都查詢資料庫
+        if Event.venue.is_cached(self):
+            venue = self.venue
+        else:
+            from .cache import venue_cache
+            venue = venue_cache.get(self.venue_id)
+        return f"{self.name} - {self.event_date} {self.event_time} ({venue.name})"
+
+class PriceTier(models.Model):
+    """
+    場次的票價等級 (區域 / 分區)。座位參照票價等級取得價格，
+    調整整區的票價只需更新一列，不必修改每個座位。
+    """
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='price_tiers', verbose_name="所屬場次")
+    name = models.CharField(max_length=50, verbose_name="等級名稱")
+    price = models.IntegerField(validators=[MinValueValidator(0)], verbose_name="票價")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時間")
+
+    class Meta:
+        verbose_name = "票價等級"
+        verbose_name_plural = "票價等級"
+        unique_together = ('event', 'name')
+        ordering = ['event_id', 'name']
+
+    def __str__(self):
+        return f"{self.name} ({self.price})"
 
 class Seat(models.Model):
     """
@@ -64,6 +107,7 @@ class Seat(models.Model):
     ]
 
     event = models.ForeignKey(Event, on_delete=models.CASCADE, verbose_name="所屬場次")
+    section = models.CharField(max_length=50, blank=True, default='', verbose_name="區域") # 由座位佈局資料產生時填入
     row = models.CharField(max_length=10, verbose_name="行號")
     column = models.CharField(max_length=10, verbose_name="座位號")
     status = models.CharField(
@@ -77,6 +121,10 @@ class Seat(models.Model):
         default=0, # 增加預設值，避免 null 錯誤
         verbose_name="座位價格"
     )
+    # 有票價等級時以等級的價格為準 (見 booking/pricing.py)，price 只用於沒有等級的座位
+    price_tier = models.ForeignKey(
+        PriceTier, on_delete=models.RESTRICT, null=True, blank=True, related_name='seats', verbose_name="票價等級"
+    )
     # 用於鎖定追蹤 (在取消支付整合後，這些欄位可以根據需求決定保留或移除)
     locked_until = models.DateTimeField(null=True, blank=True, verbose_name="鎖定至")
     locked_by_session = models.CharField(max_length=255, null=True, blank=True, verbose_name="由會話鎖定")
@@ -86,10 +134,39 @@ class Seat(models.Model):
         verbose_name_plural = "座位"
         # 確保在同一場次下，行號和座位號是唯一的
         unique_together = ('event', 'row', 'column')
-        ordering = ['event', 'row', 'column']
+        # 以 event_id 排序可直接使用唯一索引，避免為了 Event 的預設排序而 JOIN 場次與場地
+        ordering = ['event_id', 'row', 'column']
+        indexes = [
+            # 依場次與狀態篩選座位 (例如統計或列出某場次的已登記座位)
+            models.Index(fields=['event', 'status'], name='seat_event_status_idx'),
+            # 部分索引：只收錄可選座位，供依場次找空位 (排、座位號順序) 使用
+            models.Index(
+                fields=['event', 'row', 'column'],
+                condition=models.Q(status__in=['available', 'cancelled']),
+                name='seat_available_by_event_idx',
+            ),
+            # 部分索引：只收錄鎖定中的座位，供過期鎖定回收程式依到期時間掃描
+            models.Index(
+                fields=['locked_until'],
+                condition=models.Q(status='locked'),
+                name='seat_locked_expiry_idx',
+            ),
+            # 部分索引：依會話查詢其鎖定的座位
+            models.Index(
+                fields=['locked_by_session'],
+                condition=models.Q(locked_by_session__isnull=False),
+                name='seat_locked_by_session_idx',
+            ),
+        ]
 
     def __str__(self):
-        return f"{self.event.name} - {self.row}{self.column} ({self.get_status_display()})"
+        # 場次尚未載入時從快取讀取，避免每次顯示都查詢資料庫
+        if Seat.event.is_cached(self):
+            event = self.event
+        else:
+            from .cache import event_cache
+            event = event_cache.get(self.event_id)
+        return f"{event.name} - {self.row}{self.column} ({self.get_status_display()})"
 
 class Order(models.Model):
     """
@@ -129,6 +206,12 @@ class Order(models.Model):
         verbose_name = "訂單"
         verbose_name_plural = "訂單"
         ordering = ['-created_at']
+        indexes = [
+            # 配合預設排序 -created_at 的訂單列表
+            models.Index(fields=['-created_at'], name='order_created_at_idx'),
+            # 依場次與狀態篩選並依建立時間排序的訂單列表
+            models.Index(fields=['event', 'status', '-created_at'], name='order_event_status_created_idx'),
+        ]
 
     def __str__(self):
         return f"訂單號: {self.order_number} ({self.get_status_display()})"
@@ -0,0 +1,26 @@
+# booking/pagination.py
+
+from rest_framework.pagination import CursorPagination
+
+
+class BookingCursorPagination(CursorPagination):
+    """
+    以游標 (keyset) 分頁：下一頁以上一頁最後一筆的排序鍵值做 WHERE 條件，
+    不使用 OFFSET，因此翻到再後面的頁數也只需走索引讀取一頁資料。
+
+    只用於資料量會隨銷售成長的列表 (座位、訂單)，由視圖集以 pagination_class 指定；
+    場地與場次列表維持不分頁的陣列格式。
+
+    排序預設為主鍵 id；視圖可用 cursor_ordering 指定其他排序 (第一個欄位須有索引)。
+    每頁預設 page_size 筆，?page_size= 可調整，上限為 max_page_size。
+    """
+    ordering = ('id',)
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering is None:
+            return super().get_ordering(request, queryset, view)
+        return tuple(ordering)
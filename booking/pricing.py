@@ -0,0 +1,99 @@
+# booking/pricing.py
+
+"""
+座位票價。
+
+座位的價格取自所屬的票價等級 (PriceTier)，沒有等級的座位使用 Seat.price：
+    - 查詢中以 CURRENT_PRICE (COALESCE(等級價格, 座位價格)) 取得目前價格，
+      例如下單時在 SELECT ... FOR UPDATE 中一併讀取
+    - 只需要價格時以 seat_price(seat, price_table_cache.get(event_id)) 從快取的等級表計算，不查詢資料庫
+    - reprice() 以一次 bulk_update 修改等級的價格，Seat 資料表不受影響
+
+調價後座位圖佈局與預先渲染的座位列表需要重建 (SeatMapIndex.invalidate)，由呼叫端處理。
+"""
+
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import invalidate_price_tables
+from .models import PriceTier
+
+# 沒有區域名稱的座位自動建立的票價等級名稱
+DEFAULT_TIER_NAME = 'General'
+
+CURRENT_PRICE = Coalesce(F('price_tier__price'), F('price'))
+
+
+def seat_price(seat, price_table):
+    """依場次的等級表 {tier_id: price} 計算座位目前的價格。"""
+    if seat.price_tier_id is not None and seat.price_tier_id in price_table:
+        return price_table[seat.price_tier_id]
+    return seat.price
+
+
+def tier_names(entries):
+    """
+    entries 為不重複的 (區域, 價格, 佈局指定的等級名稱或 None)，
+    回傳 ({entry: 等級名稱}, {等級名稱: 價格})。
+    佈局指定的等級直接使用；其餘依區域建立等級，同一區域有多種價格時名稱加上價格。
+    """
+    entries = set(entries)
+    names = {}
+    prices = {}
+    for entry in entries:
+        _, price, tier = entry
+        if tier is not None:
+            names[entry] = tier
+            prices[tier] = price
+    section_prices = Counter(section for section, _, tier in entries if tier is None)
+    for entry in sorted((entry for entry in entries if entry[2] is None), key=lambda entry: entry[:2]):
+        section, price, _ = entry
+        name = section or DEFAULT_TIER_NAME
+        if section_prices[section] > 1 or prices.get(name, price) != price:
+            name = f"{name} {price}"
+        names[entry] = name
+        prices[name] = price
+    return names, prices
+
+
+def ensure_tiers(event, prices):
+    """
+    建立或更新場次的票價等級 (須在交易中呼叫)，prices 為 {等級名稱: 價格}，回傳 {等級名稱: tier_id}。
+    """
+    existing = {tier.name: tier for tier in PriceTier.objects.filter(event=event, name__in=list(prices))}
+    changed = [tier for name, tier in existing.items() if tier.price != prices[name]]
+    for tier in changed:
+        tier.price = prices[tier.name]
+        tier.updated_at = timezone.now()
+    if changed:
+        PriceTier.objects.bulk_update(changed, ['price', 'updated_at'])
+        invalidate_price_tables(event.id)
+    created = PriceTier.objects.bulk_create([
+        PriceTier(event=event, name=name, price=price) for name, price in prices.items() if name not in existing
+    ])
+    if created:
+        invalidate_price_tables(event.id)
+    return {tier.name: tier.id for tier in [*existing.values(), *created]}
+
+
+def reprice(event_id, prices):
+    """
+    批次調整場次的票價等級，prices 為 {等級名稱: 價格}。
+    只更新 PriceTier (一次 bulk_update)，回傳更新的等級數；有不存在的等級名稱時拋出 PriceTier.DoesNotExist。
+    """
+    with transaction.atomic():
+        tiers = list(PriceTier.objects.select_for_update().filter(event_id=event_id, name__in=list(prices)))
+        missing = set(prices) - {tier.name for tier in tiers}
+        if missing:
+            raise PriceTier.DoesNotExist(f"Unknown price tier(s): {', '.join(sorted(missing))}.")
+        now = timezone.now()
+        for tier in tiers:
+            tier.price = prices[tier.name]
+            tier.updated_at = now
+        PriceTier.objects.bulk_update(tiers, ['price', 'updated_at'])
+        invalidate_price_tables(event_id)
+    return len(tiers)
@@ -0,0 +1,128 @@
+# booking/reaper.py
+
+"""
+過期座位鎖定回收。
+
+Redis 的座位鎖 (seat_lock:{event_id}:seat_id) 到期後，資料庫中的 Seat 仍停留在 status='locked'，
+lock_seats 因此不再接受這些座位。這裡依鎖定中座位的到期時間 (部分索引) 找出
+locked_until 已過期的座位，確認 Redis 鎖確實已不存在後，以批次 UPDATE 釋放，
+並同步更新 Redis 座位狀態位元圖。
+
+settings.SEAT_LOCK_STATE['MODE'] 為 'redis' 時資料庫不記錄鎖定中的狀態，
+另外從 lockstate:expiring 取出 Redis 鎖已到期的座位，把位元圖改回可選 (見 lockstate.py)。
+"""
+
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .lockstate import redis_authoritative
+from .models import Seat
+from .seatmap import STATE_AVAILABLE, STATE_LOCKED
+from .services import redis_client, lock_manager, lock_journal, seat_map_index
+
+logger = logging.getLogger(__name__)
+
+# 回收統計 (Redis 計數器，供監控讀取)
+RECLAIMED_COUNTER_KEY = 'metrics:reaper:reclaimed_total'
+LAST_RUN_KEY = 'metrics:reaper:last_run'
+
+
+def release_expired_locks(batch_size=500, now=None):
+    """
+    回收一批已過期的座位鎖定，回傳 (釋放數量, 延長 locked_until 的數量, 本批掃描數量)。
+    Redis 鎖仍存在 (例如結帳流程已續期) 的座位不會被釋放，只會把 locked_until 更新為 Redis 的到期時間。
+    """
+    now = now or timezone.now()
+    expired = list(
+        Seat.objects.filter(status='locked', locked_until__lt=now)
+        .order_by('locked_until')
+        .only('id', 'event_id', 'locked_until')[:batch_size]
+    )
+    if not expired:
+        return 0, 0, 0
+
+    locks = lock_manager.inspect_seats(expired)
+    reclaim = []
+    still_held = []
+    for seat in expired:
+        owner, ttl = locks[seat.id]
+        if owner is None:
+            reclaim.append(seat)
+        else:
+            seat.locked_until = now + timedelta(seconds=max(ttl, 1))
+            still_held.append(seat)
+
+    released = 0
+    if reclaim:
+        # 條件中再次限定狀態與到期時間，避免覆蓋在檢查之後才被重新鎖定 (或已下單) 的座位；
+        # 先鎖住仍符合條件的列，位元圖只標記實際釋放的座位
+        with transaction.atomic():
+            released_ids = set(
+                Seat.objects.select_for_update(skip_locked=True)
+                .filter(id__in=[seat.id for seat in reclaim], status='locked', locked_until__lt=now)
+                .values_list('id', flat=True)
+            )
+            released = Seat.objects.filter(id__in=released_ids).update(
+                status='available', locked_until=None, locked_by_session=None
+            )
+        seat_map_index.mark([seat for seat in reclaim if seat.id in released_ids], STATE_AVAILABLE)
+    if still_held:
+        Seat.objects.bulk_update(still_held, ['locked_until'])
+        # locked_until 會出現在座位列表中，遞增座位圖版本讓快取的 JSON 失效
+        seat_map_index.mark(still_held, STATE_LOCKED)
+
+    return released, len(still_held), len(expired)
+
+
+def release_expired_redis_locks(batch_size=500, now=None):
+    """
+    redis 模式：回收一批 Redis 鎖已到期的座位，回傳 (改回可選的數量, 本批取出數量)。
+    取出時已在 Redis 端確認鎖不存在；已登記 (下單後) 的座位不會被改回可選。
+    """
+    now = now or timezone.now()
+    expired, scanned = lock_journal.pop_expired(now, batch_size, lock_manager)
+    if not expired:
+        return 0, scanned
+
+    registered = set(
+        Seat.objects.filter(id__in=[seat_id for _, seat_id in expired], status='registered')
+        .values_list('id', flat=True)
+    )
+    reclaim = [Seat(id=seat_id, event_id=event_id) for event_id, seat_id in expired if seat_id not in registered]
+    seat_map_index.mark(reclaim, STATE_AVAILABLE)
+    # 資料庫中的鎖定鏡像交由寫回程式清除
+    lock_journal.mark_dirty(reclaim)
+    return len(reclaim), scanned
+
+
+def run_once(batch_size=500):
+    """持續處理直到沒有過期座位為止，回傳本輪釋放的座位總數並記錄統計。"""
+    now = timezone.now()
+    total_released = 0
+    total_extended = 0
+    while True:
+        released, extended, scanned = release_expired_locks(batch_size=batch_size, now=now)
+        total_released += released
+        total_extended += extended
+        if scanned < batch_size:
+            break
+    while redis_authoritative():
+        released, scanned = release_expired_redis_locks(batch_size=batch_size, now=now)
+        total_released += released
+        if scanned < batch_size:
+            break
+
+    pipe = redis_client.pipeline(transaction=False)
+    if total_released:
+        pipe.incrby(RECLAIMED_COUNTER_KEY, total_released)
+    pipe.set(LAST_RUN_KEY, now.isoformat())
+    pipe.execute()
+
+    logger.info(
+        "Released expired seat locks",
+        extra={'reclaimed_seats': total_released, 'extended_seats': total_extended},
+    )
+    return total_released
@@ -0,0 +1,390 @@
+# booking/seatmap.py
+
+"""
+場次座位狀態索引 (Redis 位元圖)。
+
+每個場次的座位依 (row, column, id) 排序後給予連續序號 (ordinal)，
+每個座位在位元圖中佔 2 bits，記錄可選 / 鎖定中 / 已登記三種狀態。
+鎖定、解鎖、下單與取消流程會以 Lua 腳本增量更新位元圖，
+讀取座位圖時只需從 Redis 取出位元圖，不必查詢資料庫。
+
+每次狀態變更也會遞增場次的座位圖版本號，並在變更紀錄中
+記下每個座位最後一次變更的版本，供 ETag 與 ?since= 增量查詢使用；
+同一個 Lua 腳本也會把變更發佈到場次的 Redis pub/sub 頻道，
+讓所有後端行程都能把座位狀態即時推送給瀏覽器。
+
+Redis 鍵：
+    seatmap:{event_id}:bits      2-bit 狀態陣列 (BITFIELD u2 #ordinal)
+    seatmap:{event_id}:ordinals  hash，seat_id -> ordinal
+    seatmap:{event_id}:layout    JSON，依 ordinal 排列的 [seat_id, row, column, price] (price 為票價等級的目前價格)
+    seatmap:{event_id}:version   單調遞增的座位圖版本號
+    seatmap:{event_id}:floor     可提供增量查詢的最小版本 (座位配置變動時重設)
+    seatmap:{event_id}:changes   sorted set，seat_id -> 最後變更的版本
+    seatmap:{event_id}:json      hash，快取某一版本預先渲染的完整座位列表 JSON
+
+重建索引時先寫入暫存鍵 (seatmap:{event_id}:bits:build:<token> 等)，
+只有讀取資料庫期間版本號沒有變動時才以 RENAME 取代索引，避免覆蓋期間增量更新的狀態。
+
+settings.SEAT_LOCK_STATE['MODE'] 為 'redis' 時資料庫不記錄鎖定中的狀態，
+重建位元圖時改以座位鎖判斷哪些座位鎖定中 (見 lockstate.py)。
+
+Pub/sub 頻道：
+    seatmap:{event_id}:events    {"version": v, "status": "locked", "seat_ids": [...]}
+                                 或座位配置變動時的 {"version": v, "reset": true}
+"""
+
+import json
+import uuid
+from collections import defaultdict
+
+from .lockstate import redis_authoritative
+from .locks import AsyncSeatLockManager, SeatLockManager
+from .models import Seat
+from .pricing import CURRENT_PRICE
+
+STATE_AVAILABLE = 0
+STATE_LOCKED = 1
+STATE_REGISTERED = 2
+
+# 位元圖狀態代碼對應的名稱 (索引即代碼)
+STATE_NAMES = ['available', 'locked', 'registered']
+
+# Seat.status -> 位元圖狀態代碼 ('cancelled' 的座位可再次選購，視為可選)
+STATUS_TO_STATE = {
+    'available': STATE_AVAILABLE,
+    'cancelled': STATE_AVAILABLE,
+    'locked': STATE_LOCKED,
+    'registered': STATE_REGISTERED,
+}
+
+# 預先渲染的完整座位列表快取時間 (秒)
+JSON_CACHE_SECONDS = 60
+
+# 重建索引期間座位狀態持續變動時，最多重新讀取資料庫的次數
+BUILD_ATTEMPTS = 3
+
+# KEYS[1]: bits, KEYS[2]: ordinals, KEYS[3]: version, KEYS[4]: changes
+# ARGV[1]: 狀態代碼, ARGV[2]: 狀態名稱, ARGV[3]: pub/sub 頻道, ARGV[4..]: 座位 ID
+# 位元圖索引尚未建立時只更新版本與變更紀錄，由下次讀取時從資料庫重建位元圖
+# 回傳新的版本號
+MARK_SCRIPT = """
+local version = redis.call('INCR', KEYS[3])
+local indexed = redis.call('EXISTS', KEYS[2]) == 1
+local state = tonumber(ARGV[1])
+local seat_ids = {}
+for i = 4, #ARGV do
+    redis.call('ZADD', KEYS[4], version, ARGV[i])
+    if indexed then
+        local ordinal = redis.call('HGET', KEYS[2], ARGV[i])
+        if ordinal then
+            redis.call('BITFIELD', KEYS[1], 'SET', 'u2', '#' .. ordinal, state)
+        end
+    end
+    seat_ids[#seat_ids + 1] = tonumber(ARGV[i])
+end
+redis.call('PUBLISH', ARGV[3], '{"version":' .. version .. ',"status":"' .. ARGV[2] ..
+    '","seat_ids":[' .. table.concat(seat_ids, ',') .. ']}')
+return version
+"""
+
+# KEYS[1..3]: 暫存的 bits, ordinals, layout, KEYS[4..6]: bits, ordinals, layout, KEYS[7]: version
+# ARGV[1]: 讀取資料庫前的版本號
+# 版本號未變 (期間沒有 mark / invalidate) 時以暫存鍵取代索引並回傳 1，否則捨棄暫存鍵並回傳 0
+BUILD_COMMIT_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[7]) or '0') ~= tonumber(ARGV[1]) then
+    redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+    return 0
+end
+redis.call('DEL', KEYS[4], KEYS[5], KEYS[6])
+for i = 1, 3 do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('RENAME', KEYS[i], KEYS[i + 3])
+    end
+end
+return 1
+"""
+
+# KEYS[1]: bits, KEYS[2]: ordinals, KEYS[3]: layout, KEYS[4]: version, KEYS[5]: floor,
+# KEYS[6]: changes, KEYS[7]: json；ARGV[1]: pub/sub 頻道
+# 座位配置變動時清除索引，並讓變動前的版本無法再做增量查詢
+INVALIDATE_SCRIPT = """
+local version = redis.call('INCR', KEYS[4])
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3], KEYS[6], KEYS[7])
+redis.call('SET', KEYS[5], version)
+redis.call('PUBLISH', ARGV[1], '{"version":' .. version .. ',"reset":true}')
+return version
+"""
+
+
+def _keys(event_id):
+    prefix = f"seatmap:{event_id}"
+    return f"{prefix}:bits", f"{prefix}:ordinals", f"{prefix}:layout"
+
+
+def _version_keys(event_id):
+    prefix = f"seatmap:{event_id}"
+    return f"{prefix}:version", f"{prefix}:floor", f"{prefix}:changes", f"{prefix}:json"
+
+
+def events_channel(event_id):
+    """場次座位狀態變更的 pub/sub 頻道名稱。"""
+    return f"seatmap:{event_id}:events"
+
+
+# 訂閱所有場次座位狀態變更的 PSUBSCRIBE 樣式
+EVENTS_CHANNEL_PATTERN = events_channel('*')
+
+
+def events_channel_event_id(channel):
+    """由頻道名稱取出場次 ID。"""
+    if isinstance(channel, bytes):
+        channel = channel.decode()
+    return int(channel.split(':')[1])
+
+
+def seat_map_version_key(event_id):
+    return _version_keys(event_id)[0]
+
+
+def encode_states(states):
+    """將狀態代碼列表打包成位元圖 (每 byte 4 個座位，高位在前，與 BITFIELD u2 相同)。"""
+    bits = bytearray((len(states) + 3) // 4)
+    for ordinal, state in enumerate(states):
+        bits[ordinal // 4] |= state << (6 - 2 * (ordinal % 4))
+    return bytes(bits)
+
+
+def decode_states(bits, seat_count):
+    """將位元圖還原成長度為 seat_count 的狀態代碼列表。"""
+    bits = bits.ljust((seat_count + 3) // 4, b'\x00')
+    return [(bits[ordinal // 4] >> (6 - 2 * (ordinal % 4))) & 0b11 for ordinal in range(seat_count)]
+
+
+def run_length_encode(states):
+    """以 [狀態代碼, 連續長度] 的列表壓縮狀態序列。"""
+    runs = []
+    for state in states:
+        if runs and runs[-1][0] == state:
+            runs[-1][1] += 1
+        else:
+            runs.append([state, 1])
+    return runs
+
+
+def _index_rows(event_id):
+    return Seat.objects.filter(event_id=event_id).annotate(current_price=CURRENT_PRICE).order_by(
+        'row', 'column', 'id'
+    ).values_list('id', 'row', 'column', 'current_price', 'status')
+
+
+def _lock_candidates(rows):
+    """redis 模式下需要以座位鎖判斷狀態的座位 (未登記的座位)。"""
+    return [row[0] for row in rows if row[4] != 'registered']
+
+
+def _build_index(rows, held_seat_ids=None):
+    """
+    由資料庫座位列依序號建立位元圖與佈局，回傳 (bits, layout)。
+    held_seat_ids 為 Redis 中持有鎖的座位 (redis 模式)，此時未登記座位的狀態只依座位鎖判斷。
+    """
+    layout = []
+    states = []
+    for seat_id, row, column, price, seat_status in rows:
+        layout.append([seat_id, row, column, price])
+        if held_seat_ids is None or seat_status == 'registered':
+            states.append(STATUS_TO_STATE.get(seat_status, STATE_AVAILABLE))
+        else:
+            states.append(STATE_LOCKED if seat_id in held_seat_ids else STATE_AVAILABLE)
+    return encode_states(states), layout
+
+
+def _stage_index(event_id, bits, layout, pipe):
+    """把索引寫入暫存鍵的指令排入 pipe，回傳 BUILD_COMMIT_SCRIPT 的 KEYS。"""
+    token = uuid.uuid4().hex
+    keys = _keys(event_id)
+    staging = [f"{key}:build:{token}" for key in keys]
+    if layout:
+        bits_key, ordinals_key, layout_key = staging
+        pipe.set(bits_key, bits)
+        pipe.hset(ordinals_key, mapping={seat[0]: ordinal for ordinal, seat in enumerate(layout)})
+        pipe.set(layout_key, json.dumps(layout))
+    return [*staging, *keys, seat_map_version_key(event_id)]
+
+
+def _mark_calls(seats, state):
+    """依場次分組，產生每個場次一次 MARK_SCRIPT 呼叫的 (keys, args)。"""
+    seat_ids_by_event = defaultdict(list)
+    for seat in seats:
+        seat_ids_by_event[seat.event_id].append(seat.id)
+    for event_id, seat_ids in seat_ids_by_event.items():
+        bits_key, ordinals_key, _ = _keys(event_id)
+        version_key, _, changes_key, _ = _version_keys(event_id)
+        yield (
+            [bits_key, ordinals_key, version_key, changes_key],
+            [state, STATE_NAMES[state], events_channel(event_id), *seat_ids],
+        )
+
+
+class SeatMapIndex:
+    """
+    每個場次一份的 Redis 座位狀態位元圖。
+    lock_manager 用於 redis 模式下重建時讀取座位鎖 (座位鎖可能分散在其他節點)，預設為同一個客戶端。
+    """
+
+    def __init__(self, client, lock_manager=None):
+        self.client = client
+        self.lock_manager = lock_manager or SeatLockManager(client)
+        self._mark = client.register_script(MARK_SCRIPT)
+        self._invalidate = client.register_script(INVALIDATE_SCRIPT)
+        self._commit_build = client.register_script(BUILD_COMMIT_SCRIPT)
+
+    def build(self, event_id):
+        """
+        從資料庫重建場次的位元圖與序號表，回傳 (bits, layout)。
+        讀取資料庫期間版本號有變動 (座位狀態被增量更新) 時重新讀取；
+        BUILD_ATTEMPTS 次後仍有變動時只回傳結果而不寫入，由下次讀取重建。
+        """
+        version_key = seat_map_version_key(event_id)
+        for _ in range(BUILD_ATTEMPTS):
+            version = int(self.client.get(version_key) or 0)
+            rows = list(_index_rows(event_id))
+            held_seat_ids = None
+            if redis_authoritative():
+                owners = self.lock_manager.owners_many(event_id, _lock_candidates(rows))
+                held_seat_ids = {seat_id for seat_id, owner in owners.items() if owner is not None}
+            bits, layout = _build_index(rows, held_seat_ids)
+            pipe = self.client.pipeline(transaction=False)
+            keys = _stage_index(event_id, bits, layout, pipe)
+            self._commit_build(keys=keys, args=[version], client=pipe)
+            if pipe.execute()[-1]:
+                break
+        return bits, layout
+
+    def get(self, event_id):
+        """
+        取得場次的 (bits, layout)。
+        索引存在時只讀 Redis；不存在時才從資料庫建立一次。
+        """
+        bits_key, _, layout_key = _keys(event_id)
+        bits, layout = self.client.mget([bits_key, layout_key])
+        if layout is None:
+            return self.build(event_id)
+        return bits or b'', json.loads(layout)
+
+    def mark(self, seats, state, pipeline=None):
+        """
+        增量更新多個座位的狀態代碼。
+        seats 為 Seat 實例 (可跨場次)，每個場次一次 Lua 呼叫，全部在同一 pipeline 送出。
+        傳入 pipeline 時只排入指令，由呼叫端執行。
+        """
+        calls = list(_mark_calls(seats, state))
+        if not calls:
+            return
+
+        pipe = pipeline if pipeline is not None else self.client.pipeline(transaction=False)
+        for keys, args in calls:
+            self._mark(keys=keys, args=args, client=pipe)
+        if pipeline is None:
+            pipe.execute()
+
+    def invalidate(self, event_id):
+        """座位新增或刪除後清除索引並遞增版本，下次讀取時重建。"""
+        self._invalidate(keys=[*_keys(event_id), *_version_keys(event_id)], args=[events_channel(event_id)])
+
+    def cached_json(self, event_id):
+        """
+        取得目前版本號，以及該版本預先渲染的完整座位列表 JSON。
+        快取不存在或已過期 (版本不符) 時 body 為 None。
+        """
+        version_key, _, _, json_key = _version_keys(event_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.get(version_key)
+        pipe.hmget(json_key, ['version', 'body'])
+        version, (cached_version, body) = pipe.execute()
+        version = int(version or 0)
+        if cached_version is None or int(cached_version) != version:
+            body = None
+        return version, body
+
+    def store_json(self, event_id, version, body):
+        """快取某一版本預先渲染的完整座位列表 JSON。"""
+        _, _, _, json_key = _version_keys(event_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(json_key, mapping={'version': version, 'body': body})
+        pipe.expire(json_key, JSON_CACHE_SECONDS)
+        pipe.execute()
+
+    def changes_since(self, event_id, since):
+        """
+        回傳 (目前版本號, 版本 since 之後有變更的座位 ID 列表)。
+        since 早於可增量查詢的最小版本或晚於目前版本時，座位列表為 None，呼叫端應改回傳完整資料。
+        """
+        version_key, floor_key, changes_key, _ = _version_keys(event_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.get(version_key)
+        pipe.get(floor_key)
+        pipe.zrangebyscore(changes_key, f'({since}', '+inf')
+        version, floor, seat_ids = pipe.execute()
+        version = int(version or 0)
+        if since < int(floor or 0) or since > version:
+            return version, None
+        return version, [int(seat_id) for seat_id in seat_ids]
+
+
+class AsyncSeatMapIndex:
+    """
+    SeatMapIndex 的 redis.asyncio 版本，供 async 視圖讀取與更新位元圖。
+    資料格式與 Lua 腳本皆與同步版本相同，兩者可混用。
+    """
+
+    def __init__(self, client, lock_manager=None):
+        self.client = client
+        self.lock_manager = lock_manager or AsyncSeatLockManager(client)
+        self._mark = client.register_script(MARK_SCRIPT)
+        self._commit_build = client.register_script(BUILD_COMMIT_SCRIPT)
+
+    async def build(self, event_id):
+        """以 async ORM 從資料庫重建場次的位元圖與序號表，回傳 (bits, layout)；版本檢查與同步版本相同。"""
+        version_key = seat_map_version_key(event_id)
+        for _ in range(BUILD_ATTEMPTS):
+            version = int(await self.client.get(version_key) or 0)
+            rows = [row async for row in _index_rows(event_id)]
+            held_seat_ids = None
+            if redis_authoritative():
+                owners = await self.lock_manager.owners_many(event_id, _lock_candidates(rows))
+                held_seat_ids = {seat_id for seat_id, owner in owners.items() if owner is not None}
+            bits, layout = _build_index(rows, held_seat_ids)
+            pipe = self.client.pipeline(transaction=False)
+            keys = _stage_index(event_id, bits, layout, pipe)
+            await self._commit_build(keys=keys, args=[version], client=pipe)
+            if (await pipe.execute())[-1]:
+                break
+        return bits, layout
+
+    async def get(self, event_id):
+        """取得場次的 (bits, layout)，索引不存在時才從資料庫建立。"""
+        bits_key, _, layout_key = _keys(event_id)
+        bits, layout = await self.client.mget([bits_key, layout_key])
+        if layout is None:
+            return await self.build(event_id)
+        return bits or b'', json.loads(layout)
+
+    async def bits_with_floor(self, event_id):
+        """
+        只讀取位元圖與座位配置的 floor 版本 (不讀取佈局)，回傳 (bits, floor)。
+        索引尚未建立時 bits 為 None。
+        """
+        bits_key, _, _ = _keys(event_id)
+        _, floor_key, _, _ = _version_keys(event_id)
+        bits, floor = await self.client.mget([bits_key, floor_key])
+        return bits, int(floor or 0)
+
+    async def mark(self, seats, state):
+        """增量更新多個座位的狀態代碼，每個場次一次 Lua 呼叫，全部在同一 pipeline 送出。"""
+        calls = list(_mark_calls(seats, state))
+        if not calls:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for keys, args in calls:
+            await self._mark(keys=keys, args=args, client=pipe)
+        await pipe.execute()
@@ -1,27 +1,43 @@
 # booking/serializers.py
 
 from rest_framework import serializers
-from .models import Venue, Event, Seat, Order, OrderItem
+from .models import Venue, Event, Seat, Order, OrderItem, PriceTier
+from .locks import LOCK_CONFLICT
+from .cache import event_cache, price_table_cache
+from .holds import hold_policy
+from .pricing import seat_price
 from decimal import Decimal
-from django.utils import timezone 
-from datetime import timedelta 
 import uuid 
 
-# 再次提醒：最佳實踐是通過 ViewSet 的 context 傳遞 redis_instance
-# 這裡繼續假設您可以從 views 導入，或者您已在 ViewSet 中通過 context 傳遞
-try:
-    from booking.views import redis_instance
-except ImportError:
-    import redis
-    redis_instance = redis.StrictRedis(host='localhost', port=6379, db=0)
 
+class SparseFieldsMixin:
+    """
+    讀取 (GET) 時支援 ?fields=id,status，只輸出指定的欄位。
+    指定了不存在的欄位時回傳 400。
+    """
 
-class VenueSerializer(serializers.ModelSerializer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        fields = request.query_params.get('fields')
+        if not fields:
+            return
+        requested = {name.strip() for name in fields.split(',') if name.strip()}
+        unknown = requested - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError({'fields': f"Unknown field(s): {', '.join(sorted(unknown))}."})
+        for name in set(self.fields) - requested:
+            self.fields.pop(name)
+
+
+class VenueSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Venue
         fields = '__all__'
 
-class EventSerializer(serializers.ModelSerializer):
+class EventSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     venue_name = serializers.CharField(source='venue.name', read_only=True)
 
     class Meta:
@@ -29,7 +45,13 @@ class EventSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('venue_name',)
 
-class SeatSerializer(serializers.ModelSerializer):
+class PriceTierSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PriceTier
+        fields = ['id', 'event', 'name', 'price', 'updated_at']
+        read_only_fields = ('updated_at',)
+
+class SeatSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     event_name = serializers.CharField(source='event.name', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
 
@@ -38,6 +60,25 @@ class SeatSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('event_name', 'status_display',)
 
+    def validate(self, data):
+        tier = data.get('price_tier', getattr(self.instance, 'price_tier', None))
+        event = data.get('event', getattr(self.instance, 'event', None))
+        if tier is not None and event is not None and tier.event_id != event.id:
+            raise serializers.ValidationError({'price_tier': 'Price tier must belong to the seat\'s event.'})
+        return data
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # 有票價等級的座位輸出等級的價格：列表查詢以 seats_for_serializer 一併取得 current_price，
+        # 其餘 (例如新增、修改後的回應) 從快取的等級表讀取
+        if 'price' in data:
+            current_price = getattr(instance, 'current_price', None)
+            if current_price is None and instance.price_tier_id is not None:
+                current_price = seat_price(instance, price_table_cache.get(instance.event_id))
+            if current_price is not None:
+                data['price'] = current_price
+        return data
+
 class OrderItemSerializer(serializers.ModelSerializer):
     seat_info = serializers.SerializerMethodField()
 
@@ -51,7 +92,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
             return f"{obj.seat.row}{obj.seat.column}"
         return None
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
 
     # 針對創建訂單的輸入字段
@@ -108,7 +149,7 @@ class OrderSerializer(serializers.ModelSerializer):
 
         # 1. 驗證 event_id 是否存在
         try:
-            event = Event.objects.get(id=event_id)
+            event = event_cache.get(event_id)
             data['event'] = event # <-- 重要：將 Event 實例儲存到 data 中，供 create 方法使用
         except Event.DoesNotExist:
             raise serializers.ValidationError({"event_id": "Event not found."})
@@ -123,54 +164,44 @@ class OrderSerializer(serializers.ModelSerializer):
             if not session_id:
                 session_id = str(uuid.uuid4()) 
 
-        # 3. 獲取 Redis 實例。從 context 中獲取是最佳實踐
-        redis_instance_from_context = self.context.get('redis_instance')
-        if not redis_instance_from_context:
-            redis_instance_from_context = globals().get('redis_instance') 
-            if not redis_instance_from_context:
-                raise serializers.ValidationError({"server_error": "Redis instance not available in serializer context."})
+        # 3. 鎖定管理器由 ViewSet 透過 context 傳入 (OrderViewSet.get_serializer_context)
+        lock_manager_from_context = self.context.get('lock_manager')
+        if lock_manager_from_context is None:
+            raise serializers.ValidationError({"server_error": "Lock manager not available in serializer context."})
 
         
         selected_seats = []
         total_amount = Decimal('0.00')
-        lock_duration_seconds = 60 * 5 
+        price_table = price_table_cache.get(event.id) # 場次的票價等級表，不查詢資料庫
+        lock_duration_seconds, _ = hold_policy(event) # 依場次的座位保留秒數續期
 
-        # 4. 遍歷 seat_ids，檢查座位狀態並進行初步鎖定檢查
+        # 4. 以單一查詢取得所有座位，並依請求順序檢查座位狀態
+        seat_ids = list(dict.fromkeys(seat_ids))
+        seats_by_id = {seat.id: seat for seat in Seat.objects.filter(id__in=seat_ids, event=event)}
         for seat_id in seat_ids:
-            try:
-                seat = Seat.objects.get(id=seat_id, event=event) 
-            except Seat.DoesNotExist:
+            seat = seats_by_id.get(seat_id)
+            if seat is None:
                 raise serializers.ValidationError({"seat_ids": f"Seat {seat_id} not found for this event."})
 
             if seat.price is None:
                 raise serializers.ValidationError({"seat_ids": f"Seat {seat.id} has no price defined."})
 
-            lock_key = f"seat_lock:{seat.id}"
-            current_locker_session = redis_instance_from_context.get(lock_key)
-
-            if seat.status not in ['available', 'cancelled']:
-                if seat.status == 'locked':
-                    if not current_locker_session or current_locker_session.decode('utf-8') != session_id:
-                        raise serializers.ValidationError({"seat_ids": f"Seat {seat.id} is locked by another user."})
-                    else:
-                        redis_instance_from_context.expire(lock_key, lock_duration_seconds)
-                        selected_seats.append(seat)
-                        total_amount += seat.price
-                        continue 
-                elif seat.status == 'registered':
-                    raise serializers.ValidationError({"seat_ids": f"Seat {seat.id} is already registered."})
-                else:
-                    raise serializers.ValidationError({"seat_ids": f"Seat {seat.id} is in an invalid state: {seat.get_status_display()}."})
-            
-            if seat.status in ['available', 'cancelled']:
-                if not redis_instance_from_context.set(lock_key, session_id, ex=lock_duration_seconds, nx=True):
-                    if current_locker_session and current_locker_session.decode('utf-8') != session_id:
-                         raise serializers.ValidationError({"seat_ids": f"Seat {seat.id} is already locked by another user in Redis."})
-                    else:
-                        redis_instance_from_context.expire(lock_key, lock_duration_seconds)
+            if seat.status == 'registered':
+                raise serializers.ValidationError({"seat_ids": f"Seat {seat.id} is already registered."})
+            elif seat.status not in ['available', 'cancelled', 'locked']:
+                raise serializers.ValidationError({"seat_ids": f"Seat {seat.id} is in an invalid state: {seat.get_status_display()}."})
                 
             selected_seats.append(seat)
-            total_amount += seat.price
+            total_amount += seat_price(seat, price_table)
+
+        # 5. 以單次原子操作鎖定或續期所有座位 (全有或全無)
+        # 已由本會話持有的鎖會被續期；任何一個座位被他人持有則全部不鎖定
+        results = lock_manager_from_context.acquire_many(
+            event.id, [seat.id for seat in selected_seats], session_id, lock_duration_seconds, all_or_nothing=True
+        )
+        for seat in selected_seats:
+            if results[seat.id] == LOCK_CONFLICT:
+                raise serializers.ValidationError({"seat_ids": f"Seat {seat.id} is locked by another user."})
         
         self._selected_seats = selected_seats
         self._total_amount = total_amount
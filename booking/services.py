@@ -0,0 +1,38 @@
+# booking/services.py
+
+"""
+booking 共用的服務實例 (每個行程各一份)。
+
+視圖、背景工作 (reaper.py、writebehind.py) 與管理指令都從這裡取得，
+不必為了這些實例匯入 views.py。Redis 連線參數見 settings.REDIS 與 connections.py。
+"""
+
+from .cancellation import OrderCanceller
+from .connections import redis_client, lock_router
+from .holds import HoldManager
+from .idempotency import IdempotencyStore
+from .locks import SeatLockManager
+from .lockstate import LockStateJournal
+from .seatmap import SeatMapIndex
+from .waiting_room import WaitingRoom
+
+# 座位鎖定一律透過 Lua 腳本批次操作，依場次分配到座位鎖節點 (見 lockrouter.py)
+lock_manager = SeatLockManager(lock_router)
+
+# 每個會話在每個場次一個座位保留，下單成功後從保留中移除
+hold_manager = HoldManager(lock_router)
+
+# SEAT_LOCK_STATE['MODE'] 為 'redis' 時記錄鎖的到期時間與待寫回資料庫的座位
+lock_journal = LockStateJournal(redis_client)
+
+# 每個場次的座位狀態位元圖，由鎖定 / 解鎖 / 下單 / 取消流程增量更新
+seat_map_index = SeatMapIndex(redis_client, lock_manager)
+
+# 以集合操作批次取消訂單 (單筆、多筆或整個場次)，見 booking/cancellation.py
+order_canceller = OrderCanceller(lock_manager, lock_journal, seat_map_index)
+
+# 熱門場次的虛擬排隊室，只有被放行的排隊憑證可以鎖定座位與下單
+waiting_room = WaitingRoom(redis_client)
+
+# 建立訂單的 Idempotency-Key 紀錄，吸收客戶端逾時後的重送
+idempotency_store = IdempotencyStore(redis_client, 'orders')
@@ -0,0 +1,170 @@
+# booking/streaming.py
+
+"""
+座位狀態即時推送 (Server-Sent Events)。
+
+瀏覽器以 EventSource 連線到 /api/events/{id}/stream/，
+後端訂閱該場次的 Redis pub/sub 頻道，把鎖定、解鎖、下單與取消造成的
+座位狀態變更即時轉送出去。多個後端行程共用同一個頻道，
+因此不論變更發生在哪個行程，所有連線都會收到。
+
+每個行程 (事件迴圈) 只有一個 pub/sub 訂閱 (SeatEventHub，以 PSUBSCRIBE 訂閱所有場次的頻道)，
+再分送到各 SSE 連線的 asyncio.Queue；SSE 連線數再多也只佔用共用連線池的一條連線，
+不會排擠座位鎖定等指令。
+
+此視圖為 async 視圖，需透過 asgi.py 以 ASGI 伺服器 (uvicorn) 提供服務。
+"""
+
+import asyncio
+import json
+import logging
+import weakref
+from collections import defaultdict
+
+import redis
+from django.http import JsonResponse, StreamingHttpResponse
+
+from .connections import get_async_redis
+from .models import Event
+from .seatmap import EVENTS_CHANNEL_PATTERN, events_channel_event_id, seat_map_version_key
+
+logger = logging.getLogger(__name__)
+
+# 沒有變更時每隔幾秒送出一次註解行，避免代理伺服器切斷閒置連線
+KEEPALIVE_SECONDS = 15
+# 每個 SSE 連線最多暫存的事件數；客戶端跟不上時改送一次 reset，讓其重新載入座位列表
+QUEUE_SIZE = 100
+# pub/sub 連線中斷後重新訂閱前等待的秒數
+RECONNECT_SECONDS = 1
+
+
+def _sse(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+
+class SeatEventHub:
+    """
+    事件迴圈內所有 SSE 連線共用的座位狀態訂閱。
+    第一個連線加入時開始訂閱，最後一個連線離開時取消訂閱並歸還連線。
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._queues = defaultdict(set)     # event_id -> {asyncio.Queue}
+        self._task = None
+
+    def listen(self, event_id):
+        """註冊一個 SSE 連線，回傳接收該場次訊息 (JSON 字串) 的 asyncio.Queue。"""
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._queues[event_id].add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return queue
+
+    def unlisten(self, event_id, queue):
+        queues = self._queues.get(event_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._queues[event_id]
+        if not self._queues and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _publish(self, event_id, payload):
+        for queue in self._queues.get(event_id, ()):
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # 客戶端跟不上：丟棄暫存的事件，改為通知重新載入完整座位列表
+                while not queue.empty():
+                    queue.get_nowait()
+                version = json.loads(payload).get('version')
+                queue.put_nowait(json.dumps({'version': version, 'reset': True}))
+
+    def _reset_all(self):
+        for event_id in list(self._queues):
+            self._publish(event_id, json.dumps({'version': None, 'reset': True}))
+
+    async def _run(self):
+        reconnected = False
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.psubscribe(EVENTS_CHANNEL_PATTERN)
+                if reconnected:
+                    # 斷線期間的變更已遺失，讓所有連線重新載入
+                    self._reset_all()
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=KEEPALIVE_SECONDS)
+                    if message is not None:
+                        self._publish(events_channel_event_id(message['channel']), message['data'].decode('utf-8'))
+            except (redis.ConnectionError, redis.TimeoutError, OSError):
+                logger.warning('Seat event subscription lost, resubscribing', exc_info=True)
+                reconnected = True
+            except Exception:
+                # 其他錯誤 (例如無法解析的訊息) 也不能讓共用訂閱停止，否則所有連線都不再收到變更
+                logger.exception('Seat event subscription failed, resubscribing')
+                reconnected = True
+            finally:
+                try:
+                    await pubsub.aclose()
+                except (redis.RedisError, OSError):
+                    pass
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_seat_event_hub():
+    """目前事件迴圈的 SeatEventHub (須在事件迴圈中呼叫)。"""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = SeatEventHub(get_async_redis())
+    return hub
+
+
+async def _seat_events(event_id):
+    hub = get_seat_event_hub()
+    queue = hub.listen(event_id)
+    try:
+        # 先告知目前版本，客戶端可用 /seats/?since=<version> 補齊斷線期間的變更
+        version = int(await hub.client.get(seat_map_version_key(event_id)) or 0)
+        yield _sse(json.dumps({'version': version}), event='hello', event_id=version)
+
+        while True:
+            try:
+                payload = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            version = json.loads(payload).get('version')
+            yield _sse(payload, event='seats', event_id=version)
+    finally:
+        # 客戶端斷線時 Django 會取消此產生器，在這裡取消註冊
+        hub.unlisten(event_id, queue)
+
+
+async def event_seat_stream(request, event_id):
+    """
+    以 text/event-stream 推送場次的座位狀態變更。
+    每則 'seats' 事件的資料格式與 Redis 頻道相同：
+    {"version": 12, "status": "locked", "seat_ids": [1, 2]}，
+    座位配置變動 (或連線跟不上、訂閱中斷) 時為 {"version": 13, "reset": true}，客戶端應重新載入完整座位列表。
+    場次不存在時回傳 404。
+    """
+    if not await Event.objects.filter(pk=event_id).aexists():
+        return JsonResponse({'detail': 'Event not found.'}, status=404)
+    response = StreamingHttpResponse(_seat_events(event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # 關閉 nginx 的回應緩衝，讓事件立即送達
+    response['X-Accel-Buffering'] = 'no'
+    return response
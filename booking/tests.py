@@ -1,3 +1,1887 @@
-from django.test import TestCase
+# booking/tests.py
+
+import datetime
+import json
+import time
+from unittest import mock, skipIf
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .cache import cache_stats, price_table_cache, reset_cache_stats, venue_cache
+from .inventory import generate_event_seats
+from .lockrouter import LockRouter, pin_events, plan_pins, rendezvous_node
+from .locks import SeatLockManager, seat_lock_key
+from .models import Venue, Event, PriceTier, Seat, Order, OrderItem
+from .pricing import CURRENT_PRICE, reprice, seat_price, tier_names
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+# 測試不連線 Redis：實體快取改用行程內快取
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BookingTestCase(TestCase):
+    def use_fake_redis(self):
+        """把 booking.services 與 views 中的服務實例換成同一個 fakeredis 上的新實例。"""
+        from .cancellation import OrderCanceller
+        from .holds import HoldManager
+        from .idempotency import IdempotencyStore
+        from .lockstate import LockStateJournal
+        from .seatmap import SeatMapIndex
+        from .waiting_room import WaitingRoom
+
+        self.redis_server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeStrictRedis(server=self.redis_server)
+        self.lock_manager = SeatLockManager(self.redis)
+        self.lock_journal = LockStateJournal(self.redis)
+        self.seat_map_index = SeatMapIndex(self.redis, self.lock_manager)
+        instances = {
+            'lock_manager': self.lock_manager,
+            'hold_manager': HoldManager(self.redis),
+            'lock_journal': self.lock_journal,
+            'seat_map_index': self.seat_map_index,
+            'order_canceller': OrderCanceller(self.lock_manager, self.lock_journal, self.seat_map_index),
+            'waiting_room': WaitingRoom(self.redis),
+            'idempotency_store': IdempotencyStore(self.redis, 'orders'),
+        }
+        targets = [('booking.views.redis_instance', self.redis), ('booking.services.redis_client', self.redis)]
+        for name, value in instances.items():
+            targets += [(f'booking.views.{name}', value), (f'booking.services.{name}', value)]
+        # async 視圖每個請求取得一個連到同一個 fakeredis 的 redis.asyncio 客戶端
+        targets += [
+            ('booking.async_views.get_async_redis', lambda: fakeredis.FakeAsyncRedis(server=self.redis_server)),
+            ('booking.async_views.get_async_lock_router', lambda default_client=None: default_client),
+        ]
+        for target, value in targets:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+def json_body(response):
+    return json.loads(response.content)
+
+
+class HotPathQueryPlanTests(BookingTestCase):
+    """
+    確認訂位熱點查詢在有一定資料量時使用索引，而不是全表掃描。
+    PostgreSQL 上關閉 enable_seqscan：只有在沒有可用索引時才會出現 Seq Scan。
+    """
+
+    EVENTS = 20
+    SEATS_PER_EVENT = 500
+    ORDERS_PER_EVENT = 25
+
+    @classmethod
+    def setUpTestData(cls):
+        venue = Venue.objects.create(name='Plan Arena', capacity=cls.SEATS_PER_EVENT)
+        now = timezone.now()
+        events = [
+            Event.objects.create(
+                venue=venue, name=f'Event {i}', event_date=datetime.date(2030, 1, 1),
+                event_time=datetime.time(i % 24), base_price=100,
+            )
+            for i in range(cls.EVENTS)
+        ]
+        seats = []
+        for event in events:
+            for n in range(cls.SEATS_PER_EVENT):
+                seat = Seat(event=event, row=f'R{n // 50}', column=str(n % 50), price=100)
+                if n % 10 == 0:
+                    seat.status = 'locked'
+                    seat.locked_until = now + datetime.timedelta(minutes=n % 7 - 3)
+                    seat.locked_by_session = f'session-{n}'
+                elif n % 10 == 1:
+                    seat.status = 'registered'
+                seats.append(seat)
+        Seat.objects.bulk_create(seats, batch_size=2000)
+        Order.objects.bulk_create([
+            Order(order_number=f'ORD-{event.id}-{n}', event=event, buyer_name='x',
+                  status='cancelled' if n % 5 == 0 else 'registered')
+            for event in events for n in range(cls.ORDERS_PER_EVENT)
+        ])
+        cls.event = events[len(events) // 2]
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, table):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+            try:
+                plan = queryset.explain()
+            finally:
+                with connection.cursor() as cursor:
+                    cursor.execute('SET enable_seqscan = on')
+            self.assertNotIn('Seq Scan', plan, plan)
+            self.assertIn('Index', plan, plan)
+        elif connection.vendor == 'sqlite':
+            plan = queryset.explain()
+            table_steps = [line for line in plan.splitlines() if f' {table}' in line]
+            self.assertTrue(table_steps, plan)
+            for line in table_steps:
+                self.assertIn('INDEX', line, plan)
+        else:
+            self.skipTest(f'No plan assertions for {connection.vendor}.')
+
+    def test_available_seats_for_event(self):
+        queryset = Seat.objects.filter(event=self.event, status__in=['available', 'cancelled']).order_by('row', 'column')
+        self.assertUsesIndex(queryset, 'booking_seat')
+
+    def test_seats_by_event_and_status(self):
+        self.assertUsesIndex(Seat.objects.filter(event=self.event, status='registered'), 'booking_seat')
+
+    def test_expired_locks(self):
+        queryset = Seat.objects.filter(status='locked', locked_until__lt=timezone.now()).order_by('locked_until')
+        self.assertUsesIndex(queryset, 'booking_seat')
+
+    def test_seats_locked_by_session(self):
+        self.assertUsesIndex(Seat.objects.filter(locked_by_session='session-10'), 'booking_seat')
+
+    def test_recent_orders(self):
+        self.assertUsesIndex(Order.objects.order_by('-created_at')[:50], 'booking_order')
+
+    def test_orders_by_event_and_status(self):
+        queryset = Order.objects.filter(event=self.event, status='registered').order_by('-created_at')
+        self.assertUsesIndex(queryset, 'booking_order')
+
+    def test_migrations_match_model_indexes(self):
+        from io import StringIO
+
+        from django.core.management import call_command
+
+        # 索引只在模型 Meta 定義一次，遷移沒有遺漏也沒有多餘的索引
+        call_command('makemigrations', 'booking', check=True, dry_run=True, stdout=StringIO())
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, 'booking_seat')
+        indexes = {name for name, info in constraints.items() if info['index'] and name.startswith('seat_')}
+        self.assertEqual(indexes, {index.name for index in Seat._meta.indexes})
+
+
+class SerializerQueryCountTests(BookingTestCase):
+    """
+    確認列表與明細 API 的查詢數不隨資料筆數增加 (沒有 N+1 查詢)。
+    每個測試先以少量資料量測查詢數，再加入更多資料後重新量測，兩者必須相同。
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.venue = Venue.objects.create(name='Count Hall', capacity=100)
+        self.event = self._add_event('Count Event')
+
+    def _add_event(self, name):
+        return Event.objects.create(
+            venue=self.venue, name=name, event_date=datetime.date(2030, 1, 1),
+            event_time=datetime.time(Event.objects.count() % 24), base_price=100,
+        )
+
+    def _add_seats(self, event, count):
+        start = Seat.objects.filter(event=event).count()
+        Seat.objects.bulk_create([
+            Seat(event=event, row='A', column=str(start + n), price=100) for n in range(count)
+        ])
+
+    def _add_order(self, event, seat_count):
+        self._add_seats(event, seat_count)
+        order = Order.objects.create(event=event, buyer_name='buyer')
+        seats = Seat.objects.filter(event=event, status='available')[:seat_count]
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, seat=seat, price_at_purchase=seat.price) for seat in seats
+        ])
+        Seat.objects.filter(id__in=[seat.id for seat in seats]).update(status='registered')
+        return order
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, getattr(response, 'data', None))
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url, grow):
+        before = self._count_queries(url)
+        grow()
+        with self.assertNumQueries(before):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_event_list(self):
+        def grow():
+            for n in range(5):
+                self._add_event(f'Extra {n}')
+        self.assertConstantQueries('/api/events/', grow)
+
+    def test_seat_list(self):
+        self._add_seats(self.event, 2)
+
+        def grow():
+            self._add_seats(self.event, 20)
+            self._add_seats(self._add_event('Other'), 20)
+        self.assertConstantQueries('/api/seats/', grow)
+
+    def test_order_list(self):
+        self._add_order(self.event, 1)
+
+        def grow():
+            for n in range(5):
+                self._add_order(self._add_event(f'Extra {n}'), 4)
+        self.assertConstantQueries('/api/orders/', grow)
+
+    def test_order_detail(self):
+        order = self._add_order(self.event, 1)
+
+        def grow():
+            self._add_seats(self.event, 10)
+            seats = Seat.objects.filter(event=self.event, status='available')
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, seat=seat, price_at_purchase=seat.price) for seat in seats
+            ])
+        self.assertConstantQueries(f'/api/orders/{order.id}/', grow)
+
+    @skipIf(fakeredis is None, 'fakeredis is not installed.')
+    def test_event_seats_delta(self):
+        from .seatmap import SeatMapIndex, STATE_LOCKED
+
+        index = SeatMapIndex(fakeredis.FakeStrictRedis())
+        self._add_seats(self.event, 2)
+        index.mark(Seat.objects.filter(event=self.event), STATE_LOCKED)
+
+        def grow():
+            self._add_seats(self.event, 20)
+            index.mark(Seat.objects.filter(event=self.event), STATE_LOCKED)
+        with mock.patch('booking.views.seat_map_index', index):
+            self.assertConstantQueries(f'/api/events/{self.event.id}/seats/?since=0', grow)
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+class BulkCancellationTests(BookingTestCase):
+    """批次取消的查詢數不隨訂單與座位數增加，且只取消仍為 registered 的訂單。"""
+
+    _add_event = SerializerQueryCountTests._add_event
+    _add_seats = SerializerQueryCountTests._add_seats
+    _add_order = SerializerQueryCountTests._add_order
+
+    def setUp(self):
+        self.venue = Venue.objects.create(name='Cancel Hall', capacity=100)
+        self.event = self._add_event('Cancel Event')
+        from .cancellation import OrderCanceller
+        from .lockstate import LockStateJournal
+        from .seatmap import SeatMapIndex
+
+        redis = fakeredis.FakeStrictRedis()
+        self.lock_manager = SeatLockManager(redis)
+        self.canceller = OrderCanceller(self.lock_manager, LockStateJournal(redis), SeatMapIndex(redis, self.lock_manager))
+
+    def _cancel_queries(self, orders):
+        with CaptureQueriesContext(connection) as context:
+            cancelled, seats = self.canceller.cancel_batch([order.id for order in orders])
+        self.assertEqual(len(cancelled), len(orders))
+        return len(context.captured_queries), len(seats)
+
+    def test_batch_queries_are_constant(self):
+        small, _ = self._cancel_queries([self._add_order(self.event, 1)])
+        large, released = self._cancel_queries([self._add_order(self.event, 5) for _ in range(10)])
+        self.assertEqual(small, large)
+        self.assertEqual(released, 50)
+
+    def test_cancel_event_releases_seats_and_locks(self):
+        orders = [self._add_order(self.event, 2) for _ in range(5)]
+        other = self._add_order(self._add_event('Other Event'), 2)
+        self.lock_manager.acquire_many(self.event.id, [item.seat_id for item in orders[0].items.all()], 'stale', 60)
+        progress = []
+
+        result = self.canceller.cancel(event_id=self.event.id, batch_size=2, progress=progress.append)
+        self.assertEqual((result.orders, result.seats, result.batches), (5, 10, 3))
+        self.assertEqual(len(progress), 3)
+        self.assertEqual(result.last_order_id, orders[-1].id)
+        self.assertFalse(Seat.objects.filter(event=self.event).exclude(status='available').exists())
+        self.assertFalse(OrderItem.objects.filter(order__event=self.event).exists())
+        self.assertEqual(set(Order.objects.filter(event=self.event).values_list('status', flat=True)), {'cancelled'})
+        self.assertEqual(Order.objects.get(pk=other.pk).status, 'registered')
+        self.assertEqual(set(self.lock_manager.owners_many(self.event.id, Seat.objects.filter(event=self.event).values_list('id', flat=True)).values()), {None})
+
+        # 再次執行時沒有可取消的訂單
+        self.assertEqual(self.canceller.cancel(event_id=self.event.id).orders, 0)
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+class LockRouterTests(BookingTestCase):
+    def _router(self, names, **kwargs):
+        nodes = {name: fakeredis.FakeStrictRedis(server=fakeredis.FakeServer()) for name in names}
+        return LockRouter(nodes, **kwargs)
+
+    def test_adding_a_node_moves_only_its_share(self):
+        before = {event_id: rendezvous_node(['a', 'b', 'c'], event_id) for event_id in range(1000)}
+        after = {event_id: rendezvous_node(['a', 'b', 'c', 'd'], event_id) for event_id in range(1000)}
+        moved = [event_id for event_id in before if before[event_id] != after[event_id]]
+        self.assertTrue(all(after[event_id] == 'd' for event_id in moved))
+        self.assertLess(abs(len(moved) - 250), 60)
+
+    def test_event_locks_stay_on_one_node(self):
+        router = self._router(['a', 'b', 'c'])
+        manager = SeatLockManager(router)
+        for event_id in range(1, 7):
+            manager.acquire_many(event_id, [1, 2, 3], 'owner', 60)
+            home = router.nodes[router.home_node(event_id)]
+            self.assertEqual(home.exists(*[seat_lock_key(event_id, seat_id) for seat_id in (1, 2, 3)]), 3)
+            self.assertEqual(manager.owners_many(event_id, [1, 2, 3, 4]), {1: 'owner', 2: 'owner', 3: 'owner', 4: None})
+        used = {router.home_node(event_id) for event_id in range(1, 7)}
+        self.assertGreater(len(used), 1)
+
+    def test_pin_overrides_home_node(self):
+        control = fakeredis.FakeStrictRedis()
+        router = self._router(['a', 'b'], control_client=control)
+        event_id = next(e for e in range(100) if router.home_node(e) == 'a')
+        pin_events(control, {event_id: 'b'}, {event_id: time.time() + 60})
+        self.assertEqual(router.node_for(event_id), 'b')
+
+        expired = self._router(['a', 'b'], control_client=control)
+        pin_events(control, {event_id: 'b'}, {event_id: time.time() - 1})
+        self.assertEqual(expired.node_for(event_id), 'a')
+
+    def test_plan_pins_keeps_moving_events_on_current_node(self):
+        node_events = {'a': {1: 3, 2: 1}, 'b': {3: 2}}
+        pins = plan_pins(node_events, ['a', 'b', 'c'])
+        for event_id, node in pins.items():
+            self.assertNotEqual(rendezvous_node(['a', 'b', 'c'], event_id), node)
+            self.assertIn(event_id, node_events[node])
+        for node, events in node_events.items():
+            for event_id in events:
+                if event_id not in pins:
+                    self.assertEqual(rendezvous_node(['a', 'b', 'c'], event_id), node)
+
+
+class PriceTierTests(BookingTestCase):
+    """座位以票價等級計價，調價只更新等級而不修改座位。"""
+
+    def setUp(self):
+        venue = Venue.objects.create(name='Tier Hall', capacity=100)
+        self.event = Event.objects.create(
+            venue=venue, name='Tier Event', event_date=datetime.date(2030, 1, 1),
+            event_time=datetime.time(20), base_price=1000,
+        )
+        self.layout = {
+            'price_tiers': {'VIP': 3000},
+            'sections': [
+                {'name': 'Floor', 'price_tier': 'VIP', 'rows': [{'label': '1', 'from': 1, 'to': 3}]},
+                {'name': 'Balcony', 'rows': [
+                    {'label': '2', 'from': 1, 'to': 3},
+                    {'label': '3', 'from': 1, 'to': 2, 'price': 500},
+                ]},
+            ],
+        }
+
+    def test_generated_seats_reference_tiers(self):
+        generate_event_seats(self.event, layout=self.layout)
+        tiers = dict(PriceTier.objects.filter(event=self.event).values_list('name', 'price'))
+        self.assertEqual(tiers, {'VIP': 3000, 'Balcony 1000': 1000, 'Balcony 500': 500})
+        self.assertFalse(Seat.objects.filter(event=self.event, price_tier__isnull=True).exists())
+
+    def test_reprice_updates_tiers_only(self):
+        generate_event_seats(self.event, layout=self.layout)
+        floor = list(Seat.objects.filter(event=self.event, row='1').values_list('id', flat=True))
+        with CaptureQueriesContext(connection) as context:
+            reprice(self.event.id, {'VIP': 3600})
+        self.assertFalse([query for query in context.captured_queries if 'booking_seat' in query['sql']])
+        prices = Seat.objects.filter(id__in=floor).annotate(current_price=CURRENT_PRICE).values_list('current_price', flat=True)
+        self.assertEqual(list(prices), [3600] * 3)
+        self.assertEqual(
+            seat_price(Seat.objects.get(pk=floor[0]), price_table_cache.get(self.event.id)), 3600,
+        )
+        with self.assertRaises(PriceTier.DoesNotExist):
+            reprice(self.event.id, {'Missing': 1})
+
+    def test_tier_names(self):
+        names, prices = tier_names([('A', 100, None), ('A', 200, None), ('', 100, None), ('B', 300, 'VIP')])
+        self.assertEqual(names[('A', 100, None)], 'A 100')
+        self.assertEqual(names[('', 100, None)], 'General')
+        self.assertEqual(names[('B', 300, 'VIP')], 'VIP')
+        self.assertEqual(prices, {'A 100': 100, 'A 200': 200, 'General': 100, 'VIP': 300})
+
+
+class SeatGenerationTests(BookingTestCase):
+    """依佈局產生座位、複製其他場次的座位，以及 generate-seats 端點。"""
+
+    LAYOUT = {'sections': [{'name': 'Floor', 'rows': [{'labels': ['A', 'B'], 'from': 1, 'to': 4, 'skip': [3]}]}]}
+
+    def setUp(self):
+        self.venue = Venue.objects.create(name='Layout Hall', capacity=100, layout_data=self.LAYOUT)
+        self.event = self._add_event('Layout Event')
+
+    _add_event = SerializerQueryCountTests._add_event
+
+    def test_layout_errors(self):
+        from .inventory import LayoutError
+
+        invalid = [
+            [],
+            {'sections': [{'name': 'Floor'}]},
+            {'sections': [{'rows': [{'from': 1, 'to': 2}]}]},
+            {'sections': [{'rows': [{'label': 'A', 'from': 3, 'to': 1}]}]},
+            {'sections': [{'rows': [{'label': 'A', 'from': 1, 'to': 2, 'price_tier': 'VIP'}]}]},
+            {'sections': [{'rows': [{'label': 'A', 'from': 1, 'to': 2, 'price': -1}]}]},
+            {'sections': [{'rows': [{'label': 'A', 'from': 1, 'to': 2}, {'label': 'A', 'from': 2, 'to': 3}]}]},
+            {'sections': [{'rows': [{'label': 'A' * 11, 'from': 1, 'to': 2}]}]},
+            {'sections': []},
+        ]
+        for layout in invalid:
+            with self.subTest(layout=layout), self.assertRaises(LayoutError):
+                generate_event_seats(self.event, layout=layout)
+        self.assertFalse(Seat.objects.filter(event=self.event).exists())
+
+    def test_generate_and_replace(self):
+        from .inventory import LayoutError
+
+        self.assertEqual(generate_event_seats(self.event), 6)
+        self.assertEqual(
+            sorted(Seat.objects.filter(event=self.event).values_list('row', 'column')),
+            [('A', '1'), ('A', '2'), ('A', '4'), ('B', '1'), ('B', '2'), ('B', '4')],
+        )
+        with self.assertRaises(LayoutError):
+            generate_event_seats(self.event)
+        layout = {'sections': [{'name': 'Floor', 'rows': [{'label': 'A', 'from': 1, 'to': 2}]}]}
+        self.assertEqual(generate_event_seats(self.event, layout=layout, replace=True), 2)
+        self.assertEqual(Seat.objects.filter(event=self.event).count(), 2)
+
+    def test_replace_refuses_locked_or_registered_seats(self):
+        from .inventory import LayoutError
+
+        generate_event_seats(self.event)
+        for seat_status in ('locked', 'registered'):
+            seat = Seat.objects.filter(event=self.event).first()
+            Seat.objects.filter(pk=seat.pk).update(status=seat_status)
+            with self.subTest(status=seat_status), self.assertRaises(LayoutError):
+                generate_event_seats(self.event, replace=True)
+            self.assertEqual(Seat.objects.filter(event=self.event).count(), 6)
+            Seat.objects.filter(pk=seat.pk).update(status='available')
+
+    def test_clone_from(self):
+        from .inventory import LayoutError, clone_event_seats
+
+        layout = {
+            'price_tiers': {'VIP': 3000},
+            'sections': [{'name': 'Floor', 'price_tier': 'VIP', 'rows': [{'label': 'A', 'from': 1, 'to': 3}]}],
+        }
+        generate_event_seats(self.event, layout=layout)
+        Seat.objects.filter(event=self.event, column='1').update(status='registered')
+        target = self._add_event('Clone Target')
+
+        self.assertEqual(clone_event_seats(self.event, target), 3)
+        cloned = Seat.objects.filter(event=target)
+        self.assertEqual(
+            sorted(cloned.values_list('section', 'row', 'column', 'price', 'price_tier__name', 'status')),
+            [('Floor', 'A', str(n), 3000, 'VIP', 'available') for n in range(1, 4)],
+        )
+        # 目標場次的票價等級是獨立的一份
+        self.assertFalse(cloned.filter(price_tier__event=self.event).exists())
+
+        with self.assertRaises(LayoutError):
+            clone_event_seats(self.event, target)
+        with self.assertRaises(LayoutError):
+            clone_event_seats(self.event, self.event)
+        with self.assertRaises(LayoutError):
+            clone_event_seats(self._add_event('Empty Source'), self._add_event('Empty Target'))
+
+    @skipIf(fakeredis is None, 'fakeredis is not installed.')
+    def test_generate_seats_endpoint_requires_admin(self):
+        from django.contrib.auth.models import User
+
+        self.use_fake_redis()
+        client = APIClient()
+        url = f'/api/events/{self.event.id}/generate-seats/'
+        self.assertIn(client.post(url, {}, format='json').status_code, (401, 403))
+        self.assertFalse(Seat.objects.filter(event=self.event).exists())
+
+        client.force_authenticate(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        response = client.post(url, {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 6)
+        invalid = client.post(url, {'replace': True, 'layout': {'sections': []}}, format='json')
+        self.assertEqual((invalid.status_code, 'detail' in invalid.data), (400, True))
+        cloned = client.post(
+            f'/api/events/{self._add_event("Endpoint Clone").id}/generate-seats/', {'clone_from': self.event.id},
+            format='json',
+        )
+        self.assertEqual((cloned.status_code, cloned.data['created']), (201, 6))
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+class PaginationAndFieldsTests(BookingTestCase):
+    """座位與訂單列表的游標分頁、不分頁的場地 / 場次列表，以及 ?fields= 稀疏欄位。"""
+
+    _add_event = SerializerQueryCountTests._add_event
+
+    def setUp(self):
+        self.use_fake_redis()
+        self.client = APIClient()
+        self.venue = Venue.objects.create(name='Page Hall', capacity=10)
+        self.event = self._add_event('Page Event')
+        self.seats = Seat.objects.bulk_create([
+            Seat(event=self.event, row='A', column=str(n), price=100) for n in range(5)
+        ])
+
+    def _follow(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(set(response.data), {'next', 'previous', 'results'})
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_seat_and_order_lists_use_cursor_pages(self):
+        self.assertEqual(self._follow('/api/seats/?page_size=2'), [seat.id for seat in self.seats])
+        first = self.client.get('/api/seats/').data
+        self.assertEqual((len(first['results']), first['next']), (5, None))
+
+        orders = []
+        for seat in self.seats[:3]:
+            order = Order.objects.create(event=self.event, buyer_name='Buyer', total_amount=100)
+            OrderItem.objects.create(order=order, seat=seat, price_at_purchase=100)
+            orders.append(order)
+        # 訂單依建立時間由新到舊
+        self.assertEqual(self._follow('/api/orders/?page_size=2'), [order.id for order in reversed(orders)])
+
+    def test_venue_and_event_lists_are_not_paginated(self):
+        for url in ('/api/venues/', '/api/events/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIsInstance(response.data, list)
+        self.assertEqual([event['id'] for event in self.client.get('/api/events/').data], [self.event.id])
+
+    def test_event_seats_cursor_mode(self):
+        url = f'/api/events/{self.event.id}/seats/'
+        self.assertIsInstance(json_body(self.client.get(url)), list)
+        self.assertEqual(self._follow(url + '?page_size=2'), [seat.id for seat in self.seats])
+        self.assertEqual(self.client.get('/api/events/9999/seats/?page_size=2').status_code, 404)
+
+    def test_fields(self):
+        seats = self.client.get('/api/seats/?fields=id,status').data['results']
+        self.assertEqual(seats[0], {'id': self.seats[0].id, 'status': 'available'})
+        event = self.client.get(f'/api/events/{self.event.id}/?fields=name').data
+        self.assertEqual(event, {'name': 'Page Event'})
+        sparse = json_body(self.client.get(f'/api/events/{self.event.id}/seats/?fields=id,row'))
+        self.assertEqual(sparse[0], {'id': self.seats[0].id, 'row': 'A'})
+        paged = self.client.get(f'/api/events/{self.event.id}/seats/?page_size=1&fields=column').data
+        self.assertEqual(paged['results'], [{'column': '0'}])
+        # 未知的欄位回傳 400
+        self.assertEqual(self.client.get('/api/seats/?fields=id,nope').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/events/{self.event.id}/seats/?fields=nope').status_code, 400)
+
+
+class EntityCacheMetricsTests(BookingTestCase):
+    def setUp(self):
+        reset_cache_stats()
+
+    def test_metrics_export_cache_counters(self):
+        venue = Venue.objects.create(name='Metrics Hall', capacity=10)
+        venue_cache.invalidate(venue.id)
+        venue_cache.get(venue.id)
+        venue_cache.get(venue.id)
+        self.assertEqual(cache_stats(), {'local_hits': 1, 'shared_hits': 0, 'misses': 1, 'errors': 0})
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE booking_entity_cache_lookups_total counter', body)
+        self.assertIn('booking_entity_cache_lookups_total{result="misses"} 1', body)
+        self.assertIn('booking_entity_cache_lookups_total{result="local_hits"} 1', body)
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+class ReaperTests(BookingTestCase):
+    """過期座位鎖定的回收 (database 與 redis 兩種鎖定狀態模式)。"""
+
+    def setUp(self):
+        from .lockstate import LockStateJournal
+        from .seatmap import SeatMapIndex
+
+        venue = Venue.objects.create(name='Reaper Hall', capacity=10)
+        self.event = Event.objects.create(
+            venue=venue, name='Reaper Event', event_date=datetime.date(2030, 1, 1),
+            event_time=datetime.time(20), base_price=100,
+        )
+        self.seats = Seat.objects.bulk_create([
+            Seat(event=self.event, row='A', column=str(n), price=100) for n in range(4)
+        ])
+        self.redis = fakeredis.FakeStrictRedis()
+        self.lock_manager = SeatLockManager(self.redis)
+        self.journal = LockStateJournal(self.redis)
+        self.index = SeatMapIndex(self.redis, self.lock_manager)
+        for name, value in (('redis_client', self.redis), ('lock_manager', self.lock_manager),
+                            ('lock_journal', self.journal), ('seat_map_index', self.index)):
+            patcher = mock.patch(f'booking.reaper.{name}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _states(self):
+        from .seatmap import decode_states
+
+        bits, layout = self.index.get(self.event.id)
+        return dict(zip([seat[0] for seat in layout], decode_states(bits, len(layout))))
+
+    def test_database_mode_releases_only_expired_unheld_locks(self):
+        from .reaper import RECLAIMED_COUNTER_KEY, run_once
+        from .seatmap import STATE_AVAILABLE, STATE_LOCKED
+
+        now = timezone.now()
+        expired, renewed, active, _ = self.seats
+        for seat, delta in ((expired, -60), (renewed, -60), (active, 60)):
+            seat.status = 'locked'
+            seat.locked_by_session = 'buyer'
+            seat.locked_until = now + datetime.timedelta(seconds=delta)
+        Seat.objects.bulk_update([expired, renewed, active], ['status', 'locked_by_session', 'locked_until'])
+        # renewed 的 Redis 鎖已被結帳流程續期，active 尚未到期
+        self.lock_manager.acquire_many(self.event.id, [renewed.id, active.id], 'buyer', 120)
+        self.index.build(self.event.id)
+
+        self.assertEqual(run_once(), 1)
+        statuses = dict(Seat.objects.filter(event=self.event).values_list('id', 'status'))
+        self.assertEqual(statuses[expired.id], 'available')
+        self.assertEqual(statuses[renewed.id], 'locked')
+        self.assertEqual(statuses[active.id], 'locked')
+        self.assertGreater(Seat.objects.get(pk=renewed.id).locked_until, now)
+        self.assertEqual(self._states()[expired.id], STATE_AVAILABLE)
+        self.assertEqual(self._states()[renewed.id], STATE_LOCKED)
+        self.assertEqual(int(self.redis.get(RECLAIMED_COUNTER_KEY)), 1)
+
+    def test_database_mode_marks_only_seats_it_released(self):
+        from .reaper import release_expired_locks
+        from .seatmap import STATE_AVAILABLE, STATE_REGISTERED
+
+        now = timezone.now()
+        expired, registered = self.seats[:2]
+        for seat in (expired, registered):
+            seat.status = 'locked'
+            seat.locked_by_session = 'buyer'
+            seat.locked_until = now - datetime.timedelta(seconds=60)
+        Seat.objects.bulk_update([expired, registered], ['status', 'locked_by_session', 'locked_until'])
+        self.index.build(self.event.id)
+
+        inspect_seats = self.lock_manager.inspect_seats
+
+        def order_placed_during_check(seats):
+            # 檢查 Redis 鎖之後、UPDATE 之前，registered 已被下單
+            Seat.objects.filter(pk=registered.pk).update(status='registered', locked_until=None)
+            self.index.mark([registered], STATE_REGISTERED)
+            return inspect_seats(seats)
+
+        with mock.patch.object(self.lock_manager, 'inspect_seats', side_effect=order_placed_during_check):
+            released, extended, scanned = release_expired_locks(now=now)
+        self.assertEqual((released, extended, scanned), (1, 0, 2))
+        self.assertEqual(self._states()[expired.id], STATE_AVAILABLE)
+        self.assertEqual(self._states()[registered.id], STATE_REGISTERED)
+
+    def test_redis_mode_releases_seats_whose_lock_expired(self):
+        from .lockstate import DIRTY_KEY, EXPIRING_KEY, member
+        from .reaper import run_once
+        from .seatmap import STATE_AVAILABLE, STATE_LOCKED, STATE_REGISTERED
+
+        past = timezone.now() - datetime.timedelta(seconds=30)
+        expired, renewed, registered, free = self.seats
+        registered.status = 'registered'
+        registered.save(update_fields=['status'])
+        with self.settings(SEAT_LOCK_STATE={'MODE': 'redis', 'WRITE_BEHIND': True}):
+            self.lock_manager.acquire_many(self.event.id, [expired.id, renewed.id], 'buyer', 120)
+            self.index.build(self.event.id)
+            for seat in (expired, renewed, registered):
+                seat.locked_until = past
+            self.journal.locked([expired, renewed, registered])
+            # expired 的鎖到期 (以刪除模擬)，renewed 的鎖仍存在
+            self.lock_manager.clear_many(self.event.id, [expired.id])
+            self.redis.delete(DIRTY_KEY)
+
+            self.assertEqual(run_once(), 1)
+            states = self._states()
+
+        self.assertEqual(states[expired.id], STATE_AVAILABLE)
+        self.assertEqual(states[renewed.id], STATE_LOCKED)
+        self.assertEqual(states[registered.id], STATE_REGISTERED)
+        self.assertEqual(states[free.id], STATE_AVAILABLE)
+        # 到期的座位交由寫回程式清除資料庫鏡像；仍持有鎖的座位依剩餘秒數重新排程
+        self.assertEqual(self.redis.smembers(DIRTY_KEY), {member(self.event.id, expired.id).encode()})
+        self.assertIsNone(self.redis.zscore(EXPIRING_KEY, member(self.event.id, expired.id)))
+        self.assertGreater(self.redis.zscore(EXPIRING_KEY, member(self.event.id, renewed.id)), past.timestamp() + 60)
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+@override_settings(SEAT_LOCK_STATE={'MODE': 'redis', 'WRITE_BEHIND': True})
+class WriteBehindTests(BookingTestCase):
+    """redis 模式下的鎖定狀態紀錄 (lockstate.py) 與批次寫回資料庫 (writebehind.py)。"""
+
+    def setUp(self):
+        from .lockstate import LockStateJournal
+
+        venue = Venue.objects.create(name='Write Hall', capacity=10)
+        self.event = Event.objects.create(
+            venue=venue, name='Write Event', event_date=datetime.date(2030, 1, 1),
+            event_time=datetime.time(20), base_price=100,
+        )
+        self.seats = Seat.objects.bulk_create([
+            Seat(event=self.event, row='A', column=str(n), price=100) for n in range(4)
+        ])
+        self.redis = fakeredis.FakeStrictRedis()
+        self.lock_manager = SeatLockManager(self.redis)
+        self.journal = LockStateJournal(self.redis)
+        for name, value in (('lock_manager', self.lock_manager), ('lock_journal', self.journal)):
+            patcher = mock.patch(f'booking.writebehind.{name}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _lock(self, seats, owner='buyer', ttl=60):
+        self.lock_manager.acquire_many(self.event.id, [seat.id for seat in seats], owner, ttl)
+        for seat in seats:
+            seat.locked_until = timezone.now() + datetime.timedelta(seconds=ttl)
+        self.journal.locked(seats)
+
+    def test_journal_records_expiry_and_dirty_seats(self):
+        from .lockstate import DIRTY_KEY, EXPIRING_KEY, member
+
+        locked, released, _, _ = self.seats
+        self._lock([locked, released])
+        self.assertEqual(
+            self.redis.smembers(DIRTY_KEY),
+            {member(self.event.id, seat.id).encode() for seat in (locked, released)},
+        )
+        self.assertAlmostEqual(
+            self.redis.zscore(EXPIRING_KEY, member(self.event.id, locked.id)), locked.locked_until.timestamp(),
+        )
+        self.journal.released([released])
+        self.assertIsNone(self.redis.zscore(EXPIRING_KEY, member(self.event.id, released.id)))
+        # 同一座位多次變動只記錄一次
+        self.assertEqual(self.redis.scard(DIRTY_KEY), 2)
+        self.assertEqual(sorted(self.journal.pop_dirty(10)), [(self.event.id, locked.id), (self.event.id, released.id)])
+        self.assertEqual(self.journal.pop_dirty(10), [])
+
+        with self.settings(SEAT_LOCK_STATE={'MODE': 'redis', 'WRITE_BEHIND': False}):
+            self._lock([locked])
+        self.assertEqual(self.redis.scard(DIRTY_KEY), 0)
+        with self.settings(SEAT_LOCK_STATE={'MODE': 'database', 'WRITE_BEHIND': True}):
+            self.redis.delete(EXPIRING_KEY)
+            self._lock([released], owner='other')
+        self.assertFalse(self.redis.exists(DIRTY_KEY) or self.redis.exists(EXPIRING_KEY))
+
+    def test_flush_round_trip(self):
+        from .lockstate import DIRTY_KEY
+        from .writebehind import flush_lock_state, run_once
+
+        locked, unlocked, registered, untouched = self.seats
+        Seat.objects.filter(pk=registered.pk).update(status='registered')
+        self._lock([locked, unlocked, registered])
+        self.lock_manager.release_many(self.event.id, [unlocked.id], 'buyer')
+        self.journal.released([unlocked])
+
+        # 每批最多取出 batch_size 個座位，run_once 持續寫回直到 dirty 集合清空
+        changed, popped = flush_lock_state(batch_size=2)
+        self.assertEqual(popped, 2)
+        self.assertEqual(changed + run_once(batch_size=2), 1)
+        self.assertEqual(self.redis.scard(DIRTY_KEY), 0)
+        seats = {seat.id: seat for seat in Seat.objects.filter(event=self.event)}
+        self.assertEqual(
+            (seats[locked.id].status, seats[locked.id].locked_by_session), ('locked', 'buyer'),
+        )
+        self.assertAlmostEqual(
+            seats[locked.id].locked_until.timestamp(), (timezone.now() + datetime.timedelta(seconds=60)).timestamp(),
+            delta=5,
+        )
+        self.assertEqual(seats[unlocked.id].status, 'available')
+        # 下單與取消寫入的持久狀態不受影響，沒有變動的座位不會被寫入
+        self.assertEqual(seats[registered.id].status, 'registered')
+        self.assertEqual(seats[untouched.id].status, 'available')
+
+        # 鎖釋放後再寫回一次，資料庫鏡像改回可選
+        self.lock_manager.release_many(self.event.id, [locked.id], 'buyer')
+        self.journal.released([locked])
+        self.assertEqual(run_once(), 1)
+        locked.refresh_from_db()
+        self.assertEqual((locked.status, locked.locked_by_session, locked.locked_until), ('available', None, None))
+        self.assertEqual(flush_lock_state(), (0, 0))
+
+    def test_flush_command_requires_write_behind(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        self._lock(self.seats[:1])
+        call_command('flush_seat_locks', once=True, stdout=mock.Mock())
+        self.assertEqual(Seat.objects.get(pk=self.seats[0].pk).status, 'locked')
+        with self.settings(SEAT_LOCK_STATE={'MODE': 'database', 'WRITE_BEHIND': True}):
+            with self.assertRaises(CommandError):
+                call_command('flush_seat_locks', once=True)
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+class WaitingRoomTests(BookingTestCase):
+    """排隊室：先進先出、放行速率、受保護端點的憑證檢查，以及未啟用時不需排隊。"""
+
+    _add_event = SerializerQueryCountTests._add_event
+
+    def setUp(self):
+        from . import views
+
+        self.use_fake_redis()
+        self.room = views.waiting_room
+        self.client = APIClient()
+        self.venue = Venue.objects.create(name='Queue Hall', capacity=10)
+        self.event = self._add_event('Queue Event')
+        Event.objects.filter(pk=self.event.pk).update(waiting_room_enabled=True, admission_rate=2)
+        self.event.refresh_from_db()
+        self.seats = Seat.objects.bulk_create([
+            Seat(event=self.event, row='A', column=str(n), price=100) for n in range(4)
+        ])
+        self.queue_url = f'/api/events/{self.event.id}/queue/'
+
+    def _join(self):
+        response = self.client.post(self.queue_url)
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def _order(self, seat, token=None, session_id='buyer'):
+        headers = {'HTTP_X_QUEUE_TOKEN': token} if token else {}
+        return self.client.post('/api/orders/', {
+            'event_id': self.event.id, 'seat_ids': [seat.id], 'buyer_name': 'Buyer', 'session_id': session_id,
+        }, format='json', **headers)
+
+    def test_fifo_order_and_status(self):
+        joined = [self._join() for _ in range(3)]
+        self.assertEqual([data['position'] for data in joined], [1, 2, 3])
+        self.assertEqual([data['estimated_wait_seconds'] for data in joined], [1, 1, 2])
+        tokens = [data['token'] for data in joined]
+
+        self.assertEqual(self.room.admit(self.event.id, 1), 1)
+        first = self.client.get(self.queue_url, {'token': tokens[0]}).data
+        self.assertEqual((first['admitted'], first['position']), (True, 0))
+        self.assertEqual([self.client.get(self.queue_url, {'token': token}).data['position'] for token in tokens[1:]], [1, 2])
+        self.assertEqual(self.room.admit(self.event.id, 5), 2)
+        self.assertTrue(all(self.room.is_admitted(self.event.id, token) for token in tokens))
+
+        self.assertEqual(self.client.get(self.queue_url).status_code, 400)
+        self.assertEqual(self.client.get(self.queue_url, {'token': 'unknown'}).status_code, 404)
+        stats = self.room.stats(self.event.id)
+        self.assertEqual((stats['waiting'], stats['joined_total'], stats['admitted_total']), (0, 3, 3))
+
+    def test_admission_expires(self):
+        from .waiting_room import admission_ttl
+
+        token, _ = self.room.join(self.event.id)
+        now = time.time()
+        self.room.admit(self.event.id, 1, now=now)
+        ttl = admission_ttl()
+        self.assertTrue(self.room.is_admitted(self.event.id, token, now=now + ttl - 1))
+        self.assertFalse(self.room.is_admitted(self.event.id, token, now=now + ttl + 1))
+        self.assertIsNone(self.room.status(self.event.id, token, 2, now=now + ttl + 1))
+        # 下一次放行時清除過期的憑證
+        self.room.admit(self.event.id, 1, now=now + ttl + 1)
+        self.assertEqual(self.room.stats(self.event.id, now=now)['admitted_active'], 0)
+
+    def test_scheduler_admits_at_rate(self):
+        from .waiting_room import AdmissionScheduler
+
+        tokens = [self.room.join(self.event.id)[0] for _ in range(10)]
+        scheduler = AdmissionScheduler(self.room)
+        # 第一次 tick 以 TICK_SECONDS 計算：每秒 2 人
+        self.assertEqual(scheduler.tick(now=100.0)[self.event.id], 2)
+        # 不足一人的配額留到下一次
+        self.assertEqual(scheduler.tick(now=100.75)[self.event.id], 1)
+        self.assertEqual(scheduler.tick(now=101.0)[self.event.id], 1)
+        # 經過時間上限為 max_elapsed_seconds，長時間停頓後不會一次放行所有人
+        self.assertEqual(scheduler.tick(now=200.0)[self.event.id], 6)
+        admitted = [token for token in tokens if self.room.is_admitted(self.event.id, token)]
+        self.assertEqual(admitted, tokens)
+
+        # 隊伍清空時不累積配額
+        self.assertEqual(scheduler.tick(now=210.0)[self.event.id], 0)
+        late = self.room.join(self.event.id)[0]
+        self.assertEqual(scheduler.tick(now=210.5)[self.event.id], 1)
+        self.assertTrue(self.room.is_admitted(self.event.id, late))
+        self.assertEqual(self.room.stats(self.event.id)['waiting'], 0)
+
+        # 停用排隊室的場次不再放行
+        Event.objects.filter(pk=self.event.pk).update(waiting_room_enabled=False)
+        self.room.join(self.event.id)
+        self.assertEqual(scheduler.tick(now=211.5), {})
+
+    def test_order_requires_admitted_token(self):
+        self.assertEqual(self._order(self.seats[0]).status_code, 403)
+        token = self._join()['token']
+        self.assertEqual(self._order(self.seats[0], token=token).status_code, 403)
+        self.assertEqual(self._order(self.seats[0], token='forged').status_code, 403)
+        self.room.admit(self.event.id, 1)
+        self.assertEqual(self._order(self.seats[0], token=token).status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+
+    async def test_lock_requires_admitted_token(self):
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncClient
+
+        client = AsyncClient()
+        body = {'seat_ids': [self.seats[1].id], 'session_id': 'buyer'}
+        response = await client.post('/api/seats/lock/', body, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        token, _ = await sync_to_async(self.room.join)(self.event.id)
+        response = await client.post('/api/seats/lock/', body, content_type='application/json', headers={'X-Queue-Token': token})
+        self.assertEqual(response.status_code, 403)
+        best = await client.post(
+            f'/api/events/{self.event.id}/best-available/', {'session_id': 'buyer', 'quantity': 1},
+            content_type='application/json', headers={'X-Queue-Token': token},
+        )
+        self.assertEqual(best.status_code, 403)
+
+        await sync_to_async(self.room.admit)(self.event.id, 1)
+        response = await client.post('/api/seats/lock/', body, content_type='application/json', headers={'X-Queue-Token': token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json_body(response)['locked_seats'], [self.seats[1].id])
+
+    async def test_disabled_waiting_room_bypasses_queue(self):
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncClient
+
+        await Event.objects.filter(pk=self.event.pk).aupdate(waiting_room_enabled=False)
+        joined = await sync_to_async(self.client.post)(self.queue_url)
+        self.assertEqual(joined.status_code, 200)
+        self.assertEqual((joined.data['token'], joined.data['admitted']), (None, True))
+        self.assertEqual((await sync_to_async(self.room.stats)(self.event.id))['joined_total'], 0)
+
+        response = await AsyncClient().post(
+            '/api/seats/lock/', {'seat_ids': [self.seats[2].id], 'session_id': 'buyer'}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((await sync_to_async(self._order)(self.seats[3])).status_code, 201)
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+class OrderCreationTests(BookingTestCase):
+    """POST /api/orders/：OrderSerializer.validate 與 OrderViewSet._create_order。"""
+
+    _add_event = SerializerQueryCountTests._add_event
+
+    def setUp(self):
+        self.use_fake_redis()
+        self.client = APIClient()
+        self.venue = Venue.objects.create(name='Order Hall', capacity=100)
+        self.event = self._add_event('Order Event')
+        self.seats = Seat.objects.bulk_create([
+            Seat(event=self.event, row='A', column=str(n), price=100 + n) for n in range(10)
+        ])
+
+    def _order(self, seats, session_id='buyer-session'):
+        return self.client.post('/api/orders/', {
+            'event_id': self.event.id, 'seat_ids': [seat.id for seat in seats],
+            'buyer_name': 'Buyer', 'session_id': session_id,
+        }, format='json')
+
+    def test_creates_order_and_registers_seats(self):
+        from .seatmap import STATE_REGISTERED, decode_states
+
+        seats = self.seats[:2]
+        self.lock_manager.acquire_many(self.event.id, [seats[0].id], 'buyer-session', 60)
+        response = self._order(seats)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['total_amount'], '201.00')
+        self.assertEqual(len(response.data['items']), 2)
+        self.assertEqual(set(Seat.objects.filter(id__in=[seat.id for seat in seats]).values_list('status', flat=True)), {'registered'})
+        # 交易提交後釋放本會話的座位鎖並更新位元圖
+        self.assertEqual(set(self.lock_manager.owners_many(self.event.id, [seat.id for seat in seats]).values()), {None})
+        bits, layout = self.seat_map_index.get(self.event.id)
+        states = dict(zip([seat[0] for seat in layout], decode_states(bits, len(layout))))
+        self.assertEqual(states[seats[0].id], STATE_REGISTERED)
+
+    def test_query_count_does_not_grow_with_seats(self):
+        # 第一筆訂單讓場次與票價等級表進入快取
+        self.assertEqual(self._order(self.seats[:1]).status_code, 201)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self._order(self.seats[1:2]).status_code, 201)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self._order(self.seats[2:10]).status_code, 201)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_rejects_seat_locked_by_another_session(self):
+        taken, free = self.seats[:2]
+        self.lock_manager.acquire_many(self.event.id, [taken.id], 'someone-else', 60)
+        response = self._order([free, taken])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f'Seat {taken.id} is locked by another user.', str(response.data))
+        self.assertFalse(Order.objects.exists())
+        # 全有或全無：沒有衝突的座位也不會被鎖定
+        self.assertIsNone(self.lock_manager.owners_many(self.event.id, [free.id])[free.id])
+
+    def test_rejects_registered_seat(self):
+        Seat.objects.filter(pk=self.seats[0].pk).update(status='registered')
+        response = self._order(self.seats[:2])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f'Seat {self.seats[0].id} is already registered.', str(response.data))
+        self.assertFalse(Order.objects.exists())
+
+    def test_duplicate_seat_ids_are_ordered_once(self):
+        seat = self.seats[0]
+        response = self._order([seat, seat])
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data['items']), 1)
+        self.assertEqual(response.data['total_amount'], '100.00')
+        self.assertEqual(OrderItem.objects.filter(seat=seat).count(), 1)
+
+    def test_validate_requires_lock_manager_in_context(self):
+        from rest_framework import serializers as drf_serializers
+        from .serializers import OrderSerializer
+
+        request = mock.Mock(data={'session_id': 'buyer-session'}, session=mock.Mock(session_key=None))
+        serializer = OrderSerializer(context={'request': request})
+        with self.assertRaises(drf_serializers.ValidationError):
+            serializer.validate({'event_id': self.event.id, 'seat_ids': [self.seats[0].id]})
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+class SeatLockManagerTests(BookingTestCase):
+    """SeatLockManager / AsyncSeatLockManager 的 Lua 腳本 (同步與 async 版本操作同一組鎖)。"""
+
+    EVENT_ID = 7
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeStrictRedis(server=self.server)
+        self.locks = SeatLockManager(self.redis)
+
+    def test_acquire_conflicts_with_other_owner(self):
+        from .locks import LOCK_ACQUIRED, LOCK_CONFLICT
+
+        self.assertEqual(self.locks.acquire_many(self.EVENT_ID, [1, 2], 'alice', 60), {1: LOCK_ACQUIRED, 2: LOCK_ACQUIRED})
+        self.assertEqual(self.locks.acquire_many(self.EVENT_ID, [2, 3], 'bob', 60), {2: LOCK_CONFLICT, 3: LOCK_ACQUIRED})
+        self.assertEqual(self.locks.owners_many(self.EVENT_ID, [1, 2, 3]), {1: 'alice', 2: 'alice', 3: 'bob'})
+
+    def test_same_owner_reacquire_renews_ttl(self):
+        from .locks import LOCK_ACQUIRED, LOCK_RENEWED
+
+        self.locks.acquire_many(self.EVENT_ID, [1], 'alice', 10)
+        self.assertEqual(self.locks.acquire_many(self.EVENT_ID, [1, 2], 'alice', 300), {1: LOCK_RENEWED, 2: LOCK_ACQUIRED})
+        owner, ttl = self.locks.inspect_many(self.EVENT_ID, [1])[1]
+        self.assertEqual(owner, 'alice')
+        self.assertGreater(ttl, 10)
+
+    def test_all_or_nothing_locks_nothing_on_conflict(self):
+        from .locks import LOCK_CONFLICT, LOCK_SKIPPED
+
+        self.locks.acquire_many(self.EVENT_ID, [2], 'alice', 60)
+        result = self.locks.acquire_many(self.EVENT_ID, [1, 2, 3], 'bob', 60, all_or_nothing=True)
+        self.assertEqual(result, {1: LOCK_SKIPPED, 2: LOCK_CONFLICT, 3: LOCK_SKIPPED})
+        self.assertEqual(self.locks.owners_many(self.EVENT_ID, [1, 2, 3]), {1: None, 2: 'alice', 3: None})
+
+    def test_release_only_by_owner(self):
+        self.locks.acquire_many(self.EVENT_ID, [1, 2], 'alice', 60)
+        self.assertEqual(self.locks.release_many(self.EVENT_ID, [1, 2], 'bob'), [])
+        self.assertEqual(self.locks.release_many(self.EVENT_ID, [1], 'alice'), [1])
+        self.assertEqual(self.locks.owners_many(self.EVENT_ID, [1, 2]), {1: None, 2: 'alice'})
+
+    def test_renew_only_by_owner(self):
+        self.locks.acquire_many(self.EVENT_ID, [1, 2], 'alice', 10)
+        self.locks.acquire_many(self.EVENT_ID, [3], 'bob', 10)
+        self.assertEqual(self.locks.renew_many(self.EVENT_ID, [1, 2, 3, 4], 'alice', 300), [1, 2])
+        ttls = {seat_id: ttl for seat_id, (_, ttl) in self.locks.inspect_many(self.EVENT_ID, [1, 2, 3]).items()}
+        self.assertGreater(ttls[1], 10)
+        self.assertGreater(ttls[2], 10)
+        self.assertLessEqual(ttls[3], 10)
+        self.assertEqual(self.locks.owners_many(self.EVENT_ID, [4]), {4: None})
+
+    def test_expired_lock_can_be_taken_by_another_owner(self):
+        from .locks import LOCK_ACQUIRED, LOCK_CONFLICT
+
+        self.locks.acquire_many(self.EVENT_ID, [1], 'alice', 60)
+        self.assertLessEqual(self.redis.ttl(seat_lock_key(self.EVENT_ID, 1)), 60)
+        self.assertEqual(self.locks.acquire_many(self.EVENT_ID, [1], 'bob', 60), {1: LOCK_CONFLICT})
+        self.redis.pexpire(seat_lock_key(self.EVENT_ID, 1), 1)
+        time.sleep(0.01)
+        self.assertEqual(self.locks.acquire_many(self.EVENT_ID, [1], 'bob', 60), {1: LOCK_ACQUIRED})
+
+    def test_async_manager_shares_locks_with_sync_manager(self):
+        import asyncio
+        from .locks import AsyncSeatLockManager, LOCK_ACQUIRED, LOCK_CONFLICT, LOCK_SKIPPED
+
+        self.locks.acquire_many(self.EVENT_ID, [2], 'alice', 60)
+
+        async def scenario():
+            client = fakeredis.FakeAsyncRedis(server=self.server)
+            locks = AsyncSeatLockManager(client)
+            results = [
+                await locks.acquire_many(self.EVENT_ID, [1, 2], 'bob', 60, all_or_nothing=True),
+                await locks.acquire_many(self.EVENT_ID, [1], 'bob', 60),
+                await locks.renew_many(self.EVENT_ID, [1, 2], 'bob', 120),
+                await locks.release_many(self.EVENT_ID, [1, 2], 'bob'),
+                await locks.owners_many(self.EVENT_ID, [1, 2]),
+            ]
+            await client.aclose()
+            return results
+
+        skipped, acquired, renewed, released, owners = asyncio.run(scenario())
+        self.assertEqual(skipped, {1: LOCK_SKIPPED, 2: LOCK_CONFLICT})
+        self.assertEqual(acquired, {1: LOCK_ACQUIRED})
+        self.assertEqual(renewed, [1])
+        self.assertEqual(released, [1])
+        self.assertEqual(owners, {1: None, 2: 'alice'})
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+class HoldManagerTests(BookingTestCase):
+    """座位保留的續期與釋放：不論座位數都只需一次腳本呼叫。"""
+
+    EVENT_ID = 9
+
+    def setUp(self):
+        from .holds import HoldManager
+
+        self.redis = fakeredis.FakeStrictRedis()
+        self.holds = HoldManager(self.redis)
+        self.locks = SeatLockManager(self.redis)
+        self.seat_ids = list(range(1, 21))
+
+    def _ttls(self, seat_ids):
+        return [self.redis.ttl(seat_lock_key(self.EVENT_ID, seat_id)) for seat_id in seat_ids]
+
+    def test_renew_extends_every_seat(self):
+        now = time.time()
+        self.holds.acquire(self.EVENT_ID, 'alice', self.seat_ids, 30, 3600, now=now)
+        # 其中一個座位的鎖已被清除 (例如到期後被其他會話取得)
+        self.locks.clear_many(self.EVENT_ID, [20])
+        self.locks.acquire_many(self.EVENT_ID, [20], 'bob', 30)
+
+        expires_in, renewed, lost = self.holds.renew(self.EVENT_ID, 'alice', 300, 3600, now=now)
+        self.assertEqual(renewed, self.seat_ids[:-1])
+        self.assertEqual(lost, [20])
+        self.assertGreater(expires_in, 30)
+        self.assertTrue(all(ttl > 30 for ttl in self._ttls(self.seat_ids[:-1])))
+        self.assertEqual(self.holds.get(self.EVENT_ID, 'alice')['seat_ids'], self.seat_ids[:-1])
+        self.assertEqual(self.locks.owners_many(self.EVENT_ID, [20]), {20: 'bob'})
+
+    def test_renew_is_capped_at_hold_max_seconds(self):
+        created = time.time()
+        self.holds.acquire(self.EVENT_ID, 'alice', self.seat_ids, 30, 600, now=created)
+        # 建立後 590 秒續期，上限 600 秒：只剩 10 秒
+        expires_in, renewed, _ = self.holds.renew(self.EVENT_ID, 'alice', 300, 600, now=created + 590)
+        self.assertEqual(len(renewed), len(self.seat_ids))
+        self.assertLessEqual(expires_in, 10)
+        self.assertTrue(all(ttl <= 10 for ttl in self._ttls(self.seat_ids)))
+
+    def test_relock_after_max_seconds_does_not_extend(self):
+        from .holds import hold_key
+        from .locks import LOCK_CONFLICT, LOCK_RENEWED
+
+        created = time.time()
+        self.holds.acquire(self.EVENT_ID, 'alice', self.seat_ids[:3], 30, 600, now=created)
+        self.redis.expire(seat_lock_key(self.EVENT_ID, 1), 5)
+        self.redis.expire(hold_key(self.EVENT_ID, 'alice'), 5)
+
+        # 重新鎖定受同一個上限限制：建立後 595 秒只能延長到 5 秒，超過上限則完全不延長
+        results = self.holds.acquire(self.EVENT_ID, 'alice', [1], 300, 600, now=created + 595)
+        self.assertEqual(results, {1: LOCK_RENEWED})
+        self.assertLessEqual(self._ttls([1])[0], 5)
+        results = self.holds.acquire(self.EVENT_ID, 'alice', [1, 4], 300, 600, now=created + 700)
+        self.assertEqual(results, {1: LOCK_RENEWED, 4: LOCK_CONFLICT})
+        self.assertLessEqual(self._ttls([1])[0], 5)
+        self.assertLessEqual(self.redis.ttl(hold_key(self.EVENT_ID, 'alice')), 5)
+        self.assertEqual(self.locks.owners_many(self.EVENT_ID, [4]), {4: None})
+
+    def test_renew_missing_hold(self):
+        self.assertIsNone(self.holds.renew(self.EVENT_ID, 'nobody', 300, 600))
+
+    def test_release_frees_every_seat_in_one_script_call(self):
+        self.holds.acquire(self.EVENT_ID, 'alice', self.seat_ids, 30, 600)
+        self.locks.acquire_many(self.EVENT_ID, [21], 'bob', 30)
+
+        with mock.patch.object(self.holds, '_release', wraps=self.holds._release) as release_script:
+            released = self.holds.release(self.EVENT_ID, 'alice')
+        self.assertEqual(release_script.call_count, 1)
+        self.assertEqual(sorted(released), self.seat_ids)
+        self.assertEqual(set(self.locks.owners_many(self.EVENT_ID, self.seat_ids).values()), {None})
+        self.assertIsNone(self.holds.get(self.EVENT_ID, 'alice'))
+        self.assertEqual(self.locks.owners_many(self.EVENT_ID, [21]), {21: 'bob'})
+
+    def test_release_selected_seats_keeps_the_rest(self):
+        self.holds.acquire(self.EVENT_ID, 'alice', self.seat_ids[:3], 30, 600)
+        self.assertEqual(self.holds.release(self.EVENT_ID, 'bob', [1]), [])
+        self.assertEqual(self.holds.release(self.EVENT_ID, 'alice', [1]), [1])
+        self.assertEqual(self.holds.get(self.EVENT_ID, 'alice')['seat_ids'], [2, 3])
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+class SeatMapIndexTests(BookingTestCase):
+    """座位狀態位元圖的建立、增量更新與解碼。"""
+
+    def setUp(self):
+        from .seatmap import SeatMapIndex
+
+        venue = Venue.objects.create(name='Map Hall', capacity=10)
+        self.event = Event.objects.create(
+            venue=venue, name='Map Event', event_date=datetime.date(2030, 1, 1),
+            event_time=datetime.time(20), base_price=100,
+        )
+        self.seats = Seat.objects.bulk_create([
+            Seat(event=self.event, row=row, column=str(n), price=100) for row in 'BA' for n in range(3)
+        ])
+        self.redis = fakeredis.FakeStrictRedis()
+        self.index = SeatMapIndex(self.redis)
+
+    def _states(self):
+        from .seatmap import decode_states
+
+        bits, layout = self.index.get(self.event.id)
+        return {seat[0]: state for seat, state in zip(layout, decode_states(bits, len(layout)))}
+
+    def test_encode_decode_round_trip(self):
+        from .seatmap import decode_states, encode_states, run_length_encode
+
+        states = [0, 1, 2, 2, 0, 1, 0]
+        bits = encode_states(states)
+        self.assertEqual(len(bits), 2)
+        self.assertEqual(decode_states(bits, len(states)), states)
+        # 尾端缺少的 byte 視為可選
+        self.assertEqual(decode_states(bits[:1], 6), [0, 1, 2, 2, 0, 0])
+        self.assertEqual(run_length_encode(states), [[0, 1], [1, 1], [2, 2], [0, 1], [1, 1], [0, 1]])
+
+    def test_build_orders_seats_and_maps_statuses(self):
+        from .seatmap import STATE_AVAILABLE, STATE_LOCKED, STATE_REGISTERED
+
+        Seat.objects.filter(pk=self.seats[0].pk).update(status='registered')
+        Seat.objects.filter(pk=self.seats[1].pk).update(status='locked')
+        Seat.objects.filter(pk=self.seats[2].pk).update(status='cancelled')
+        bits, layout = self.index.build(self.event.id)
+        self.assertEqual([(seat[1], seat[2]) for seat in layout], [('A', '0'), ('A', '1'), ('A', '2'), ('B', '0'), ('B', '1'), ('B', '2')])
+        states = self._states()
+        self.assertEqual(
+            [states[seat.id] for seat in self.seats[:3]], [STATE_REGISTERED, STATE_LOCKED, STATE_AVAILABLE],
+        )
+        self.assertEqual(self.redis.keys('seatmap:*:build:*'), [])
+
+    def test_mark_updates_bits_version_and_changes(self):
+        from .seatmap import STATE_LOCKED, STATE_REGISTERED
+
+        self.index.build(self.event.id)
+        self.index.mark(self.seats[:2], STATE_LOCKED)
+        self.index.mark(self.seats[1:2], STATE_REGISTERED)
+        states = self._states()
+        self.assertEqual((states[self.seats[0].id], states[self.seats[1].id]), (STATE_LOCKED, STATE_REGISTERED))
+        self.assertEqual(self.index.changes_since(self.event.id, 0), (2, [self.seats[0].id, self.seats[1].id]))
+        self.assertEqual(self.index.changes_since(self.event.id, 1), (2, [self.seats[1].id]))
+
+    def test_build_does_not_overwrite_marks_made_while_reading(self):
+        from . import seatmap
+        from .seatmap import STATE_LOCKED
+
+        read_rows = seatmap._index_rows
+        seat = self.seats[0]
+
+        def rows_then_concurrent_lock(event_id):
+            rows = list(read_rows(event_id))
+            if rows_then_concurrent_lock.calls == 0:
+                # 讀取資料庫之後、寫入索引之前，另一個請求鎖定了座位
+                Seat.objects.filter(pk=seat.pk).update(status='locked')
+                self.index.mark([seat], STATE_LOCKED)
+            rows_then_concurrent_lock.calls += 1
+            return rows
+        rows_then_concurrent_lock.calls = 0
+
+        with mock.patch('booking.seatmap._index_rows', side_effect=rows_then_concurrent_lock):
+            self.index.build(self.event.id)
+        self.assertEqual(rows_then_concurrent_lock.calls, 2)
+        self.assertEqual(self._states()[seat.id], STATE_LOCKED)
+        self.assertEqual(self.redis.keys('seatmap:*:build:*'), [])
+
+    def test_async_build_matches_sync_build(self):
+        import asyncio
+        from .seatmap import AsyncSeatMapIndex, _index_rows as seatmap_index_rows
+
+        Seat.objects.filter(pk=self.seats[3].pk).update(status='registered')
+        expected = self.index.build(self.event.id)
+        self.redis.flushall()
+
+        async def build():
+            client = fakeredis.FakeAsyncRedis()
+            try:
+                return await AsyncSeatMapIndex(client).build(self.event.id)
+            finally:
+                await client.aclose()
+
+        rows = list(seatmap_index_rows(self.event.id))
+        with mock.patch('booking.seatmap._index_rows', return_value=_AsyncRows(rows)):
+            self.assertEqual(asyncio.run(build()), expected)
+
+
+class _AsyncRows:
+    """把已讀出的列包成 async iterable (測試中以同步查詢代替 async ORM)。"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def __aiter__(self):
+        for row in self.rows:
+            yield row
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+class EventSeatsETagTests(BookingTestCase):
+    """GET /api/events/{id}/seats/ 的 ETag / 304 與 ?since= 增量模式。"""
+
+    def setUp(self):
+        self.use_fake_redis()
+        self.client = APIClient()
+        venue = Venue.objects.create(name='ETag Hall', capacity=10)
+        self.event = Event.objects.create(
+            venue=venue, name='ETag Event', event_date=datetime.date(2030, 1, 1),
+            event_time=datetime.time(20), base_price=100,
+        )
+        self.seats = Seat.objects.bulk_create([
+            Seat(event=self.event, row='A', column=str(n), price=100) for n in range(4)
+        ])
+        self.url = f'/api/events/{self.event.id}/seats/'
+
+    def _get(self, url=None, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url or self.url, **headers)
+
+    def test_etag_and_not_modified(self):
+        from .seatmap import STATE_LOCKED
+
+        first = self._get()
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertEqual(self._get(etag=etag).status_code, 304)
+
+        self.seat_map_index.mark(self.seats[:1], STATE_LOCKED)
+        changed = self._get(etag=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        # ?fields= 是不同的表示，ETag 也不同
+        self.assertNotEqual(self._get(self.url + '?fields=id,status')['ETag'], changed['ETag'])
+
+    def test_since_returns_only_changed_seats(self):
+        from .seatmap import STATE_LOCKED
+
+        self.seat_map_index.mark(self.seats[:1], STATE_LOCKED)
+        self.seat_map_index.mark(self.seats[2:3], STATE_LOCKED)
+        response = self._get(self.url + '?since=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['version'], response.data['full']), (2, False))
+        self.assertEqual([seat['id'] for seat in response.data['seats']], [self.seats[2].id])
+        self.assertEqual(self._get(self.url + '?since=1', etag=response['ETag']).status_code, 304)
+        self.assertEqual(self._get(self.url + '?since=x').status_code, 400)
+
+        # 座位配置變動後，舊版本無法增量查詢，改回完整列表
+        self.seat_map_index.invalidate(self.event.id)
+        full = json_body(self._get(self.url + '?since=1'))
+        self.assertEqual((full['full'], len(full['seats'])), (True, 4))
+
+    async def test_renew_invalidates_etag_and_cached_list(self):
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncClient
+        from .holds import HoldManager
+
+        seat = self.seats[0]
+        locked_until = timezone.now() + datetime.timedelta(seconds=30)
+        await Seat.objects.filter(pk=seat.pk).aupdate(status='locked', locked_by_session='buyer', locked_until=locked_until)
+        HoldManager(self.redis).acquire(self.event.id, 'buyer', [seat.id], 30, 600)
+        before = await sync_to_async(self._get)()
+
+        response = await AsyncClient().post(
+            f'/api/events/{self.event.id}/hold/renew/', {'session_id': 'buyer'}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+
+        after = await sync_to_async(self._get)(etag=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        renewed = next(item for item in json_body(after) if item['id'] == seat.id)
+        self.assertNotEqual(renewed['locked_until'], next(item for item in json_body(before) if item['id'] == seat.id)['locked_until'])
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+class SeatEventStreamTests(BookingTestCase):
+    """SSE 連線共用每個事件迴圈一個的 pub/sub 訂閱。"""
+
+    def test_streams_share_one_subscription(self):
+        import asyncio
+        from . import streaming
+        from .seatmap import SeatMapIndex, STATE_LOCKED
+
+        server = fakeredis.FakeServer()
+        index = SeatMapIndex(fakeredis.FakeStrictRedis(server=server))
+
+        async def scenario():
+            client = fakeredis.FakeAsyncRedis(server=server)
+            with mock.patch.object(streaming, 'get_async_redis', return_value=client), \
+                    mock.patch.object(client, 'pubsub', wraps=client.pubsub) as pubsub:
+                watchers = [streaming._seat_events(1), streaming._seat_events(1), streaming._seat_events(2)]
+                hellos = [await anext(watcher) for watcher in watchers]
+                await asyncio.sleep(0.05)   # 等待訂閱建立
+                index.mark([Seat(id=5, event_id=1)], STATE_LOCKED)
+                index.mark([Seat(id=6, event_id=2)], STATE_LOCKED)
+                events = [await asyncio.wait_for(anext(watcher), 2) for watcher in watchers]
+                hub = streaming.get_seat_event_hub()
+                for watcher in watchers:
+                    await watcher.aclose()
+                subscriptions = pubsub.call_count
+                stopped = hub._task is None and not hub._queues
+            await client.aclose()
+            return hellos, events, subscriptions, stopped
+
+        hellos, events, subscriptions, stopped = asyncio.run(scenario())
+        self.assertEqual(hellos[0], 'id: 0\nevent: hello\ndata: {"version": 0}\n\n')
+        self.assertEqual(subscriptions, 1)
+        self.assertTrue(stopped)
+        payloads = [json.loads(event.split('data: ')[1]) for event in events]
+        self.assertEqual(payloads[0], {'version': 1, 'status': 'locked', 'seat_ids': [5]})
+        self.assertEqual(payloads[1], payloads[0])
+        self.assertEqual(payloads[2]['seat_ids'], [6])
+
+    def test_slow_client_gets_reset(self):
+        import asyncio
+        from . import streaming
+
+        async def scenario():
+            hub = streaming.SeatEventHub(mock.Mock())
+            hub._task = mock.Mock(done=lambda: False)
+            queue = hub.listen(1)
+            for version in range(streaming.QUEUE_SIZE + 1):
+                hub._publish(1, json.dumps({'version': version, 'status': 'locked', 'seat_ids': [1]}))
+            return [queue.get_nowait() for _ in range(queue.qsize())]
+
+        self.assertEqual(asyncio.run(scenario()), [json.dumps({'version': streaming.QUEUE_SIZE, 'reset': True})])
+
+    def test_unexpected_error_resets_listeners_and_resubscribes(self):
+        import asyncio
+        from . import streaming
+        from .seatmap import SeatMapIndex, STATE_LOCKED, events_channel
+
+        server = fakeredis.FakeServer()
+        index = SeatMapIndex(fakeredis.FakeStrictRedis(server=server))
+
+        async def scenario():
+            client = fakeredis.FakeAsyncRedis(server=server)
+            hub = streaming.SeatEventHub(client)
+            with mock.patch.object(streaming, 'RECONNECT_SECONDS', 0), \
+                    mock.patch.object(client, 'pubsub', wraps=client.pubsub) as pubsub, \
+                    self.assertLogs('booking.streaming', 'ERROR'):
+                queue = hub.listen(1)
+                await asyncio.sleep(0.05)   # 等待訂閱建立
+                # 無法解碼的訊息會讓訂閱迴圈拋出例外
+                await client.publish(events_channel(1), b'\xff')
+                reset = await asyncio.wait_for(queue.get(), 2)
+                index.mark([Seat(id=5, event_id=1)], STATE_LOCKED)
+                event = await asyncio.wait_for(queue.get(), 2)
+                subscriptions = pubsub.call_count
+                hub.unlisten(1, queue)
+            await client.aclose()
+            return reset, event, subscriptions
+
+        reset, event, subscriptions = asyncio.run(scenario())
+        self.assertEqual(json.loads(reset), {'version': None, 'reset': True})
+        self.assertEqual(json.loads(event)['seat_ids'], [5])
+        self.assertEqual(subscriptions, 2)
+
+    def test_missing_event_is_404(self):
+        response = self.client.get('/api/events/999999/stream/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'detail': 'Event not found.'})
+
+
+class ExportStreamingTests(BookingTestCase):
+    """匯出在 ASGI 下逐塊送出，而不是先把整個匯出內容讀進記憶體。"""
+
+    ORDERS = 300
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+
+        User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        venue = Venue.objects.create(name='Export Hall', capacity=10)
+        event = Event.objects.create(
+            venue=venue, name='Export Event', event_date=datetime.date(2030, 1, 1),
+            event_time=datetime.time(20), base_price=100,
+        )
+        Order.objects.bulk_create([
+            Order(order_number=f'EXP-{n}', event=event, buyer_name=f'buyer {n}') for n in range(self.ORDERS)
+        ])
+
+    async def _asgi_get(self, path, query_string):
+        import asyncio
+        import base64
+        from django.core.handlers.asgi import ASGIHandler
+
+        received = []
+
+        async def receive():
+            if not received:
+                received.append(True)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await asyncio.Event().wait()
+
+        sent = []
+
+        async def send(message):
+            sent.append((message, self.rows_read))
+
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'query_string': query_string, 'server': ('testserver', 80), 'client': ('127.0.0.1', 1),
+            'headers': [(b'host', b'testserver'), (b'authorization', b'Basic ' + base64.b64encode(b'admin:secret'))],
+        }
+        await ASGIHandler()(scope, receive, send)
+        return sent
+
+    async def test_orders_export_streams_lazily_under_asgi(self):
+        from . import exports
+
+        self.rows_read = 0
+        export_rows = exports.export_rows
+
+        def counted_rows(*args, **kwargs):
+            for row in export_rows(*args, **kwargs):
+                self.rows_read += 1
+                yield row
+
+        with mock.patch('booking.exports.export_rows', counted_rows), \
+                mock.patch('booking.views.encoded_chunks', lambda lines: exports.encoded_chunks(lines, chunk_bytes=512)):
+            sent = await self._asgi_get('/api/orders/export/', b'output=ndjson')
+
+        self.assertEqual(sent[0][0]['status'], 200)
+        bodies = [(message['body'], rows_read) for message, rows_read in sent if message.get('body')]
+        self.assertGreater(len(bodies), 2)
+        # 第一個區塊送出時只讀了一小部分的列
+        self.assertLess(bodies[0][1], self.ORDERS // 4)
+        lines = b''.join(body for body, _ in bodies).decode().splitlines()
+        self.assertEqual(len(lines), self.ORDERS)
+        self.assertEqual(json.loads(lines[0])['order_number'], 'EXP-0')
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+class IdempotencyTests(BookingTestCase):
+    """建立訂單的 Idempotency-Key：重送、不同內容、處理中與失敗後釋放。"""
+
+    _add_event = SerializerQueryCountTests._add_event
+
+    def setUp(self):
+        from . import views
+
+        self.use_fake_redis()
+        self.store = views.idempotency_store
+        self.client = APIClient()
+        self.venue = Venue.objects.create(name='Idem Hall', capacity=10)
+        self.event = self._add_event('Idem Event')
+        self.seats = Seat.objects.bulk_create([
+            Seat(event=self.event, row='A', column=str(n), price=100) for n in range(3)
+        ])
+
+    def _order(self, seat, key='key-1', session_id='buyer'):
+        return self.client.post('/api/orders/', {
+            'event_id': self.event.id, 'seat_ids': [seat.id], 'buyer_name': 'Buyer', 'session_id': session_id,
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_first_response(self):
+        first = self._order(self.seats[0])
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(0):
+            replay = self._order(self.seats[0])
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay.data['order_number'], first.data['order_number'])
+        self.assertEqual(Order.objects.count(), 1)
+        # 其他會話的相同鍵互不影響
+        self.assertEqual(self._order(self.seats[1], session_id='other').status_code, 201)
+
+    def test_conflicting_fingerprint(self):
+        self.assertEqual(self._order(self.seats[0]).status_code, 201)
+        self.assertEqual(self._order(self.seats[1]).status_code, 422)
+
+    def test_in_flight_request_conflicts(self):
+        from .idempotency import request_fingerprint
+
+        body = {'event_id': self.event.id, 'seat_ids': [self.seats[0].id], 'buyer_name': 'Buyer', 'session_id': 'buyer'}
+        token, _ = self.store.begin('buyer', 'key-1', request_fingerprint(body))
+        self.assertIsNotNone(token)
+        response = self._order(self.seats[0])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(Order.objects.exists())
+
+    def test_failure_releases_key_for_retry(self):
+        Seat.objects.filter(pk=self.seats[0].pk).update(status='registered')
+        self.assertEqual(self._order(self.seats[0]).status_code, 400)
+        Seat.objects.filter(pk=self.seats[0].pk).update(status='available')
+        self.assertEqual(self._order(self.seats[0]).status_code, 201)
+
+    def test_release_only_deletes_own_marker(self):
+        stale, _ = self.store.begin('buyer', 'key-2', 'fingerprint')
+        # 標記過期後被另一個請求取得處理權
+        self.redis.delete('idempotency:orders:buyer:key-2')
+        current, _ = self.store.begin('buyer', 'key-2', 'fingerprint')
+        self.assertFalse(self.store.release('buyer', 'key-2', stale))
+        self.assertFalse(self.store.complete('buyer', 'key-2', stale, 'fingerprint', 201, {}))
+        token, record = self.store.begin('buyer', 'key-2', 'fingerprint')
+        self.assertIsNone(token)
+        self.assertEqual(record['state'], 'in_flight')
+        self.assertTrue(self.store.release('buyer', 'key-2', current))
+        self.assertIsNone(self.redis.get('idempotency:orders:buyer:key-2'))
+
+    def test_empty_session_uses_server_session(self):
+        with self.assertRaises(ValueError):
+            self.store.begin('', 'key-3', 'fingerprint')
+        first = self._order(self.seats[0], key='key-3', session_id='')
+        self.assertEqual(first.status_code, 201, first.data)
+        session_key = self.client.session.session_key
+        self.assertTrue(self.redis.exists(f'idempotency:orders:{session_key}:key-3'))
+        self.assertFalse(self.redis.keys('idempotency:orders::*'))
+        # 其他沒有 session_id 的客戶端使用自己的 session，不會拿到這份回應
+        other = APIClient().post('/api/orders/', {
+            'event_id': self.event.id, 'seat_ids': [self.seats[0].id], 'buyer_name': 'Buyer', 'session_id': '',
+        }, format='json', HTTP_IDEMPOTENCY_KEY='key-3')
+        self.assertEqual(other.status_code, 400)
+
+
+class BestAvailableTests(BookingTestCase):
+    """SeatRowIndex.find_best 的相鄰判斷、票價上限、區域、略過序號與空位區間快取。"""
+
+    def _index(self, seats, sections=None):
+        from .best_available import SeatRowIndex
+
+        # seats 為 (row, column, price)，依序號排列 (與 seatmap 的 row, column 排序相同)
+        layout = [[n + 1, row, column, price] for n, (row, column, price) in enumerate(seats)]
+        return SeatRowIndex(layout, sections or {})
+
+    def _bits(self, count, locked=()):
+        from .seatmap import STATE_AVAILABLE, STATE_LOCKED, encode_states
+
+        return encode_states([STATE_LOCKED if n in locked else STATE_AVAILABLE for n in range(count)])
+
+    def _ids(self, slots):
+        return None if slots is None else [slot.seat_id for slot in slots]
+
+    def test_prefers_front_row_and_center(self):
+        index = self._index([('A', str(n), 100) for n in range(1, 8)] + [('B', str(n), 100) for n in range(1, 8)])
+        self.assertEqual(self._ids(index.find_best(self._bits(14), 3)), [3, 4, 5])
+        # A 排沒有連續 3 個空位時改選 B 排
+        self.assertEqual(self._ids(index.find_best(self._bits(14, locked={1, 4}), 3)), [10, 11, 12])
+
+    def test_aisle_breaks_adjacency(self):
+        # 座位號 3 與 5 之間是走道，不視為相鄰
+        index = self._index([('A', str(n), 100) for n in (1, 2, 3, 5, 6)])
+        self.assertIsNone(index.find_best(self._bits(5), 4))
+        self.assertEqual(self._ids(index.find_best(self._bits(5), 3)), [1, 2, 3])
+        self.assertEqual(self._ids(index.find_best(self._bits(5, locked={1}), 2)), [4, 5])
+
+    def test_max_price(self):
+        index = self._index(
+            [('A', str(n), 300) for n in range(1, 5)] + [('B', str(n), 100) for n in range(1, 5)] + [('C', '1', None)]
+        )
+        self.assertEqual(self._ids(index.find_best(self._bits(9), 2, max_price=200)), [6, 7])
+        self.assertIsNone(index.find_best(self._bits(9), 2, max_price=50))
+        # 沒有票價的座位不會被選中
+        self.assertIsNone(index.find_best(self._bits(9, locked=set(range(8))), 1))
+
+    def test_section(self):
+        index = self._index(
+            [('A', str(n), 100) for n in range(1, 5)],
+            sections={1: 'Left', 2: 'Left', 3: 'Right', 4: 'Right'},
+        )
+        self.assertEqual(self._ids(index.find_best(self._bits(4), 2, section='Right')), [3, 4])
+        self.assertEqual(self._ids(index.find_best(self._bits(4), 2, section='Left')), [1, 2])
+        self.assertIsNone(index.find_best(self._bits(4), 3, section='Left'))
+        self.assertIsNone(index.find_best(self._bits(4), 1, section='Balcony'))
+
+    def test_exclude(self):
+        index = self._index([('A', str(n), 100) for n in range(1, 6)])
+        self.assertEqual(self._ids(index.find_best(self._bits(5), 2, exclude={1})), [3, 4])
+        self.assertIsNone(index.find_best(self._bits(5), 3, exclude={2}))
+
+    def test_free_runs_follow_bitmap_changes(self):
+        index = self._index([('A', str(n), 100) for n in range(1, 5)] + [('B', str(n), 100) for n in range(1, 5)])
+        self.assertEqual(self._ids(index.find_best(self._bits(8, locked={1}), 4)), [5, 6, 7, 8])
+        row_b = index._free_runs[1]
+        # 只改動 A 排的位元組：A 排重新解碼，B 排沿用快取的空位區間
+        self.assertEqual(self._ids(index.find_best(self._bits(8, locked={1, 2}), 4)), [5, 6, 7, 8])
+        self.assertIs(index._free_runs[1], row_b)
+        self.assertEqual(self._ids(index.find_best(self._bits(8), 4)), [1, 2, 3, 4])
+        self.assertEqual(self._ids(index.find_best(self._bits(8, locked={6}), 4)), [1, 2, 3, 4])
+        # 位元圖比座位數短 (尾端未寫入) 時視為可選
+        self.assertEqual(self._ids(index.find_best(b'', 4)), [1, 2, 3, 4])
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+class BestAvailableViewTests(BookingTestCase):
+    """POST /api/events/{id}/best-available/ 鎖定選中的座位，略過已被鎖定的座位。"""
+
+    _add_event = SerializerQueryCountTests._add_event
+
+    def setUp(self):
+        self.use_fake_redis()
+        self.venue = Venue.objects.create(name='Best Hall', capacity=10)
+        self.event = self._add_event('Best Event')
+        self.seats = Seat.objects.bulk_create([
+            Seat(event=self.event, row='A', column=str(n), price=100) for n in range(1, 6)
+        ])
+
+    async def test_locks_best_seats_and_skips_taken_ones(self):
+        from django.test import AsyncClient
+
+        url = f'/api/events/{self.event.id}/best-available/'
+        first = await AsyncClient().post(url, {'session_id': 'one', 'quantity': 2}, content_type='application/json')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(json_body(first)['locked_seats'], [self.seats[1].id, self.seats[2].id])
+        locked = [seat async for seat in Seat.objects.filter(status='locked').order_by('id')]
+        self.assertEqual([seat.id for seat in locked], json_body(first)['locked_seats'])
+
+        second = await AsyncClient().post(url, {'session_id': 'two', 'quantity': 2}, content_type='application/json')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(json_body(second)['locked_seats'], [self.seats[3].id, self.seats[4].id])
+        third = await AsyncClient().post(url, {'session_id': 'three', 'quantity': 2}, content_type='application/json')
+        self.assertEqual(third.status_code, 409)
+
+
+@skipIf(fakeredis is None, 'fakeredis is not installed.')
+class AsyncSeatViewTests(BookingTestCase):
+    """async 的鎖定 / 解鎖 / 座位圖端點與同步的 DRF 視圖有相同的解析、認證、CSRF 與錯誤格式。"""
+
+    def setUp(self):
+        self.use_fake_redis()
+        venue = Venue.objects.create(name='Async Hall', capacity=10)
+        self.event = Event.objects.create(
+            venue=venue, name='Async Event', event_date=datetime.date(2030, 1, 1),
+            event_time=datetime.time(20), base_price=100,
+        )
+        self.seats = Seat.objects.bulk_create([
+            Seat(event=self.event, row='A', column=str(n), price=100) for n in range(3)
+        ])
+
+    def _post(self, client, path, data, **kwargs):
+        return client.post(path, data, content_type='application/json', **kwargs)
+
+    async def test_lock_and_unlock(self):
+        from django.test import AsyncClient
+
+        client = AsyncClient()
+        first, second, registered = self.seats
+        await Seat.objects.filter(pk=registered.pk).aupdate(status='registered')
+        response = await self._post(client, '/api/seats/lock/', {
+            'seat_ids': [first.id, first.id, registered.id, 9999], 'session_id': 'buyer',
+        })
+        self.assertEqual(response.status_code, 207)
+        data = json_body(response)
+        self.assertEqual(data['locked_seats'], [first.id])
+        self.assertEqual(
+            data['failed_seats'],
+            [{'id': registered.id, 'reason': 'status: registered'}, {'id': 9999, 'reason': 'not found'}],
+        )
+        self.assertEqual(await Seat.objects.filter(status='locked').acount(), 1)
+
+        other = await self._post(client, '/api/seats/lock/', {'seat_ids': [first.id, second.id], 'session_id': 'other'})
+        self.assertEqual(json_body(other)['failed_seats'], [{'id': first.id, 'reason': 'status: locked'}])
+
+        # 表單格式的請求內容與 DRF 視圖一樣可以解析
+        response = await client.post('/api/seats/unlock/', {'seat_ids': [first.id], 'session_id': 'buyer'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json_body(response), {'unlocked_seats': [first.id], 'failed_seats': []})
+        refused = await self._post(client, '/api/seats/unlock/', {'seat_ids': [second.id], 'session_id': 'buyer'})
+        self.assertEqual(refused.status_code, 207)
+
+    async def test_lock_does_not_overwrite_seat_ordered_after_read(self):
+        from django.test import AsyncClient
+        from .holds import AsyncHoldManager
+
+        first, ordered, _ = self.seats
+        acquire = AsyncHoldManager.acquire
+
+        async def order_placed_during_acquire(holds, *args, **kwargs):
+            # 讀取座位之後、寫回之前，另一個會話完成下單
+            results = await acquire(holds, *args, **kwargs)
+            await Seat.objects.filter(pk=ordered.pk).aupdate(status='registered')
+            return results
+
+        with mock.patch.object(AsyncHoldManager, 'acquire', order_placed_during_acquire):
+            response = await self._post(AsyncClient(), '/api/seats/lock/', {
+                'seat_ids': [first.id, ordered.id], 'session_id': 'buyer',
+            })
+        self.assertEqual(response.status_code, 207)
+        data = json_body(response)
+        self.assertEqual(data['locked_seats'], [first.id])
+        self.assertEqual(data['failed_seats'], [{'id': ordered.id, 'reason': 'status changed'}])
+        statuses = {seat_id: state async for seat_id, state in Seat.objects.values_list('id', 'status')}
+        self.assertEqual((statuses[first.id], statuses[ordered.id]), ('locked', 'registered'))
+        self.assertEqual(self.lock_manager.owners_many(self.event.id, [first.id, ordered.id]), {first.id: 'buyer', ordered.id: None})
+
+    async def test_validation_matches_drf_views(self):
+        from django.test import AsyncClient
+
+        client = AsyncClient()
+        for body, detail in (
+            ({'session_id': 'buyer'}, 'seat_ids and session_id are required.'),
+            ({'seat_ids': ['x'], 'session_id': 'buyer'}, 'seat_ids must be a list of integers.'),
+            ([1, 2], 'seat_ids and session_id are required.'),
+        ):
+            with self.subTest(body=body):
+                response = await self._post(client, '/api/seats/lock/', body)
+                self.assertEqual((response.status_code, json_body(response)), (400, {'detail': detail}))
+
+        # 無法解析的內容、不支援的方法與不存在的場次使用與 DRF 視圖相同的錯誤格式
+        malformed = await client.post('/api/seats/lock/', '{', content_type='application/json')
+        drf_malformed = await client.post('/api/orders/', '{', content_type='application/json')
+        self.assertEqual(malformed.status_code, 400)
+        self.assertEqual(json_body(malformed), json_body(drf_malformed))
+        not_allowed = await client.get('/api/seats/lock/')
+        self.assertEqual((not_allowed.status_code, json_body(not_allowed)['code']), (405, 'client_error'))
+        missing = await client.get('/api/events/9999/seat-map/')
+        self.assertEqual((missing.status_code, json_body(missing)), (404, {'detail': 'Event not found.'}))
+        self.assertEqual((await client.post('/api/events/9999/hold/renew/', {'session_id': 'buyer'})).status_code, 404)
+        self.assertEqual(
+            json_body(await client.post(f'/api/events/{self.event.id}/hold/release/', {})),
+            {'detail': 'session_id is required.'},
+        )
+
+    async def test_authentication_and_csrf(self):
+        import base64
+
+        from django.contrib.auth.models import User
+        from django.test import AsyncClient
+
+        user = await User.objects.acreate_user('buyer', password='secret')
+        body = {'seat_ids': [self.seats[0].id], 'session_id': 'buyer'}
+        # 錯誤的 Basic 認證與 DRF 視圖一樣被拒絕
+        credentials = base64.b64encode(b'buyer:wrong').decode()
+        rejected = await self._post(AsyncClient(), '/api/seats/lock/', body, headers={'Authorization': f'Basic {credentials}'})
+        self.assertEqual((rejected.status_code, json_body(rejected)['code']), (403, 'permission_denied'))
+
+        # 以 session 登入的使用者必須帶 CSRF token
+        client = AsyncClient(enforce_csrf_checks=True)
+        await client.aforce_login(user)
+        forbidden = await self._post(client, '/api/seats/lock/', body)
+        self.assertEqual(forbidden.status_code, 403)
+        self.assertIn('CSRF', json_body(forbidden)['message'])
+        self.assertEqual(await Seat.objects.filter(status='locked').acount(), 0)
+
+        # 匿名請求 (DEFAULT_PERMISSION_CLASSES 為 AllowAny) 與有效的 Basic 認證都可以鎖定
+        credentials = base64.b64encode(b'buyer:secret').decode()
+        allowed = await self._post(AsyncClient(), '/api/seats/lock/', body, headers={'Authorization': f'Basic {credentials}'})
+        self.assertEqual(allowed.status_code, 200)
+
+    async def test_seat_map(self):
+        from django.test import AsyncClient
+
+        client = AsyncClient()
+        response = await client.get(f'/api/events/{self.event.id}/seat-map/', {'layout': '1'})
+        self.assertEqual(response.status_code, 200)
+        data = json_body(response)
+        self.assertEqual((data['seat_count'], data['runs']), (3, [[0, 3]]))
+        self.assertEqual([seat[0] for seat in data['layout']], [seat.id for seat in self.seats])
+        binary = await client.get(f'/api/events/{self.event.id}/seat-map/', {'encoding': 'binary'})
+        self.assertEqual((binary['Content-Type'], binary['X-Seat-Count']), ('application/octet-stream', '3'))
+        self.assertEqual((await client.get(f'/api/events/{self.event.id}/seat-map/', {'encoding': 'x'})).status_code, 400)
+
+    def test_routes_do_not_shadow_router(self):
+        from django.urls import resolve
+
+        self.assertEqual(resolve('/api/seats/lock/').url_name, 'seat-lock')
+        self.assertEqual(resolve(f'/api/seats/{self.seats[0].id}/').url_name, 'seat-detail')
+        self.assertEqual(resolve(f'/api/events/{self.event.id}/seat-map/').url_name, 'event-seat-map')
+        self.assertEqual(resolve(f'/api/events/{self.event.id}/').url_name, 'event-detail')
+        self.assertEqual(APIClient().get(f'/api/seats/{self.seats[0].id}/').status_code, 200)
 
-# Create your tests here.
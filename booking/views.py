@@ -1,128 +1,434 @@
 # booking/views.py
 
-from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework import viewsets, status, serializers, permissions
+from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
-from django.utils import timezone
-from datetime import timedelta
 import uuid
-import redis
+import zlib
 from decimal import Decimal
 from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404 # 引入 get_object_or_404
+from django.http import HttpResponse, HttpResponseNotModified, Http404, StreamingHttpResponse
+from django.utils.http import parse_etags
+from django.core.handlers.asgi import ASGIRequest
+from django.views.decorators.http import require_GET
+from rest_framework.renderers import JSONRenderer
+
+# 共用連線池的 Redis 客戶端，連線參數見 settings.REDIS
+from .connections import redis_client as redis_instance, health_check
+from .instrumentation import render_metrics
+
+from .locks import LOCK_CONFLICT
+from .holds import hold_policy
+from .lockstate import apply_redis_locks
+from .seatmap import STATE_REGISTERED
+from .waiting_room import queue_token_from_request
+from .idempotency import REPLAYED_HEADER, STATE_DONE, idempotency_key_from_request, request_fingerprint
+# 各服務實例 (座位鎖、保留、位元圖、排隊室...) 見 services.py
+from .services import (
+    lock_manager, hold_manager, lock_journal, seat_map_index, order_canceller, waiting_room, idempotency_store,
+)
+from .models import Venue, Event, Seat, Order, OrderItem, PriceTier
+from .pricing import CURRENT_PRICE, reprice
+from .inventory import LayoutError, generate_event_seats, clone_event_seats
+from .cache import venue_cache, event_cache
+from .pagination import BookingCursorPagination
+from .exports import FORMATS as EXPORT_FORMATS, async_chunks, encoded_chunks, export_filename, export_lines
+from .serializers import (
+    VenueSerializer, EventSerializer, SeatSerializer, OrderSerializer, PriceTierSerializer,
+)
+
+# 每次 bulk-cancel 請求最多可指定的訂單數
+MAX_BULK_CANCEL_ORDERS = 1000
+
+
+def _seat_map_etag(event_id, version, fields=''):
+    # 只輸出部分欄位 (?fields=) 的回應是不同的表示，ETag 需要區分
+    if fields:
+        return f'"seats-{event_id}-{version}-{zlib.crc32(fields.encode()):08x}"'
+    return f'"seats-{event_id}-{version}"'
+
+
+def _etag_matches(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags
+
+
+def _with_etag(response, etag):
+    response['ETag'] = etag
+    # 要求瀏覽器每次都帶 If-None-Match 重新驗證，未變更時只需一個 304
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+# SeatSerializer 需要的欄位：座位本身所有欄位加上場次名稱
+SEAT_SERIALIZER_FIELDS = (
+    'id', 'event', 'section', 'row', 'column', 'status', 'price', 'price_tier',
+    'locked_until', 'locked_by_session', 'event__name',
+)
+
+
+def seats_for_serializer(queryset):
+    """
+    讓座位查詢一併取得 event.name 與目前票價 (票價等級的價格)，
+    避免 SeatSerializer 逐筆查詢場次與票價等級。
+    """
+    return queryset.select_related('event').only(*SEAT_SERIALIZER_FIELDS).annotate(current_price=CURRENT_PRICE)
+
+
+def orders_for_serializer(queryset):
+    """預先載入訂單項與座位，讓 OrderSerializer 的查詢數不隨訂單項數量增加。"""
+    items = (
+        OrderItem.objects.select_related('seat')
+        .only('id', 'order', 'seat', 'quantity', 'price_at_purchase', 'seat__row', 'seat__column')
+        .order_by('seat__row', 'seat__column')
+    )
+    return queryset.prefetch_related(Prefetch('items', queryset=items))
+
+
+def _export_response(request, kind, event_id=None):
+    """
+    以 StreamingHttpResponse 逐行輸出匯出內容 (?output=csv|ndjson，預設 csv；?status= 篩選狀態)。
+    """
+    output_format = request.query_params.get('output', 'csv')
+    if output_format not in EXPORT_FORMATS:
+        return Response({'detail': 'output must be "csv" or "ndjson".'}, status=status.HTTP_400_BAD_REQUEST)
+    if event_id is None and request.query_params.get('event_id'):
+        try:
+            event_id = int(request.query_params['event_id'])
+        except ValueError:
+            return Response({'detail': 'event_id must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    lines = export_lines(kind, output_format, event_id=event_id, status=request.query_params.get('status'))
+    chunks = encoded_chunks(lines)
+    if isinstance(request._request, ASGIRequest):
+        # ASGI 下同步產生器會被整個讀完才送出，改以 async iterator 逐塊讀取與送出
+        chunks = async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=EXPORT_FORMATS[output_format])
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(kind, output_format, event_id)}"'
+    return response
+
+
+def _cancellation_response(progress):
+    return Response({
+        'cancelled_orders': progress.orders,
+        'released_seats': progress.seats,
+        'batches': progress.batches,
+        'last_order_id': progress.last_order_id,
+    })
+
+
+class CachedObjectMixin:
+    """
+    讀取 (GET) 單一物件時經由 object_cache 取得，不查詢資料庫；
+    修改與刪除仍以 queryset 從資料庫讀取最新資料。
+    """
+    object_cache = None
+
+    def get_object(self):
+        if self.request.method not in permissions.SAFE_METHODS:
+            return super().get_object()
+        try:
+            obj = self.object_cache.get(int(self.kwargs[self.lookup_url_kwarg or self.lookup_field]))
+        except (TypeError, ValueError, self.queryset.model.DoesNotExist):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
 
-# 確保您的 Redis 伺服器已啟動，並在 settings.py 中配置
-redis_instance = redis.StrictRedis(host='localhost', port=6379, db=0)
-
-from .models import Venue, Event, Seat, Order, OrderItem
-from .serializers import VenueSerializer, EventSerializer, SeatSerializer, OrderSerializer, OrderItemSerializer
 
-class VenueViewSet(viewsets.ModelViewSet):
+class VenueViewSet(CachedObjectMixin, viewsets.ModelViewSet):
     queryset = Venue.objects.all()
     serializer_class = VenueSerializer
+    object_cache = venue_cache
 
-class EventViewSet(viewsets.ModelViewSet):
-    queryset = Event.objects.all()
+class EventViewSet(CachedObjectMixin, viewsets.ModelViewSet):
+    queryset = Event.objects.select_related('venue')
     serializer_class = EventSerializer
+    object_cache = event_cache
+    # 主鍵只接受數字，/api/events/{id}/seat-map/ 等 async 端點 (async_views.py) 不會與路由器的路由重疊
+    lookup_value_regex = r'\d+'
 
-    @action(detail=True, methods=['get'], url_path='seats')
+    @action(detail=True, methods=['get'], url_path='seats', pagination_class=BookingCursorPagination)
     def get_event_seats(self, request, pk=None):
-        try:
-            event = self.get_object()
-        except Event.DoesNotExist:
-            return Response({'detail': 'Event not found.'}, status=status.HTTP_404_NOT_FOUND)
-
-        seats = event.seat_set.all().order_by('row', 'column')
-        serializer = SeatSerializer(seats, many=True)
-        return Response(serializer.data)
-
-class SeatViewSet(viewsets.ModelViewSet):
-    queryset = Seat.objects.all()
-    serializer_class = SeatSerializer
-
-
-    @action(detail=False, methods=['post'], url_path='lock')
-    def lock_seats(self, request):
         """
-        批次鎖定多個座位
+        回傳場次的完整座位列表，並以座位圖版本號作為 ETag。
+        If-None-Match 符合目前版本時回傳 304；每個版本的 JSON 只渲染一次並快取於 Redis。
+        ?since=<version> 時改為增量模式，只回傳該版本之後有變更的座位。
+        帶有 ?cursor= 或 ?page_size= 時改為依座位 id 游標分頁；?fields= 可只輸出指定欄位。
         """
-        seat_ids = request.data.get('seat_ids', [])
-        session_id = request.data.get('session_id', None)
-        if not seat_ids or not session_id:
-            return Response({'detail': 'seat_ids and session_id are required.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        locked_seats = []
-        failed_seats = []
-        lock_duration_seconds = 60 * 3 # 3分鐘鎖定時間
-
-        for seat_id in seat_ids:
+        try:
+            event_id = int(pk)
+        except (TypeError, ValueError):
+            raise Http404
+
+        # 分頁模式直接查詢資料庫，不經過完整列表快取
+        if request.query_params.get('cursor') or request.query_params.get('page_size'):
+            self.get_object()
+            page = self.paginate_queryset(seats_for_serializer(Seat.objects.filter(event_id=event_id)))
+            apply_redis_locks(page, lock_manager)
+            serializer = SeatSerializer(page, many=True, context=self.get_serializer_context())
+            return self.get_paginated_response(serializer.data)
+        # 只輸出部分欄位時不使用也不寫入完整列表快取
+        fields = request.query_params.get('fields', '')
+        sparse = bool(fields)
+
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return Response({'detail': 'since must be an integer version.'}, status=status.HTTP_400_BAD_REQUEST)
+
+            version, changed_seat_ids = seat_map_index.changes_since(event_id, since)
+            etag = _seat_map_etag(event_id, version, fields)
+            if _etag_matches(request, etag):
+                return _with_etag(HttpResponseNotModified(), etag)
+            if changed_seat_ids is not None:
+                seats = apply_redis_locks(list(seats_for_serializer(
+                    Seat.objects.filter(event_id=event_id, id__in=changed_seat_ids).order_by('row', 'column')
+                )), lock_manager)
+                return _with_etag(Response({
+                    'version': version,
+                    'since': since,
+                    'full': False,
+                    'seats': SeatSerializer(seats, many=True, context=self.get_serializer_context()).data,
+                }), etag)
+            # since 太舊 (或座位配置已變動) 時退回完整列表，包在同樣的增量格式中
+
+        version, body = seat_map_index.cached_json(event_id)
+        etag = _seat_map_etag(event_id, version, fields)
+        if since is None and _etag_matches(request, etag):
+            return _with_etag(HttpResponseNotModified(), etag)
+
+        if body is None or sparse:
             try:
-                seat = Seat.objects.get(id=seat_id)
-                lock_key = f"seat_lock:{seat.id}"
-                if seat.status in ['available', 'cancelled']:
-                    if redis_instance.set(lock_key, session_id, ex=lock_duration_seconds, nx=True):
-                        seat.status = 'locked'
-                        seat.locked_until = timezone.now() + timedelta(seconds=lock_duration_seconds)
-                        seat.locked_by_session = session_id
-                        seat.save()
-                        locked_seats.append(seat.id)
-                    else:
-                        failed_seats.append({'id': seat.id, 'reason': 'locked by another user'})
-                else:
-                    failed_seats.append({'id': seat.id, 'reason': f'status: {seat.status}'})
-            except Seat.DoesNotExist:
-                failed_seats.append({'id': seat_id, 'reason': 'not found'})
+                event = self.get_object()
+            except Event.DoesNotExist:
+                return Response({'detail': 'Event not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+            # redis 模式下鎖定中的狀態只存在 Redis，序列化前以座位鎖補上
+            seats = apply_redis_locks(
+                list(seats_for_serializer(event.seat_set.all().order_by('row', 'column'))), lock_manager,
+            )
+            serializer = SeatSerializer(seats, many=True, context=self.get_serializer_context())
+            body = JSONRenderer().render(serializer.data)
+            if not sparse:
+                seat_map_index.store_json(event_id, version, body)
+
+        if since is not None:
+            body = b'{"version":%d,"since":%d,"full":true,"seats":%s}' % (version, since, body)
+        return _with_etag(HttpResponse(body, content_type='application/json'), etag)
+
+    @action(detail=True, methods=['get'], url_path='manifest', permission_classes=[permissions.IsAdminUser])
+    def manifest(self, request, pk=None):
+        """
+        串流匯出場次的座位名冊 (每個座位一列，已售出的座位附上訂單號與購買者)，僅限管理員。
+        """
+        event = self.get_object()
+        return _export_response(request, 'seats', event_id=event.id)
 
+    @action(detail=True, methods=['get', 'post'], url_path='queue')
+    def queue(self, request, pk=None):
+        """
+        虛擬排隊室。
+        POST 加入排隊並取得排隊憑證 (token)；GET ?token= 查詢名次、預估等待秒數與是否已放行。
+        場次未啟用排隊室時 POST 直接回傳 admitted: true，不需要憑證。
+        """
+        # 開賣瞬間大量加入與輪詢，場次一律由快取讀取
+        try:
+            event = event_cache.get(int(pk))
+        except (TypeError, ValueError, Event.DoesNotExist):
+            raise Http404
+        if request.method == 'POST':
+            if not event.waiting_room_enabled:
+                return Response({'token': None, 'admitted': True, 'position': 0, 'estimated_wait_seconds': 0})
+            token, _ = waiting_room.join(event.id)
+            data = waiting_room.status(event.id, token, event.admission_rate)
+            return Response({'token': token, **data}, status=status.HTTP_201_CREATED)
+
+        token = request.query_params.get('token') or queue_token_from_request(request)
+        if not token:
+            return Response({'detail': 'token is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        data = waiting_room.status(event.id, token, event.admission_rate)
+        if data is None:
+            return Response({'detail': 'Queue token not found or admission expired. Join the queue again.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'token': token, **data})
+
+    @action(detail=True, methods=['get'], url_path='queue/stats')
+    def queue_stats(self, request, pk=None):
+        """排隊室統計：排隊人數、有效放行人數與實際放行速率。"""
+        event = self.get_object()
         return Response({
-            'locked_seats': locked_seats,
-            'failed_seats': failed_seats
-        }, status=status.HTTP_200_OK if not failed_seats else status.HTTP_207_MULTI_STATUS)
-
-    @action(detail=False, methods=['post'], url_path='unlock')
-    def unlock_seats(self, request):
+            'event_id': event.id,
+            'enabled': event.waiting_room_enabled,
+            'admission_rate': event.admission_rate,
+            **waiting_room.stats(event.id),
+        })
+
+    @action(detail=True, methods=['post'], url_path='generate-seats', permission_classes=[permissions.IsAdminUser])
+    def generate_seats(self, request, pk=None):
         """
-        批次解鎖多個座位
+        批次產生場次的所有座位，僅限管理員。
+        預設依場地的 layout_data 產生；可傳入 layout 覆寫佈局，或以 clone_from 複製另一場次的座位。
+        replace 為 true 時會先刪除現有座位 (僅限沒有鎖定或已登記座位的場次)。
         """
-        seat_ids = request.data.get('seat_ids', [])
-        session_id = request.data.get('session_id', None)
-        if not seat_ids or not session_id:
-            return Response({'detail': 'seat_ids and session_id are required.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        unlocked_seats = []
-        failed_seats = []
+        event = self.get_object()
+        replace = bool(request.data.get('replace', False))
+        clone_from = request.data.get('clone_from')
 
-        for seat_id in seat_ids:
-            try:
-                seat = Seat.objects.get(id=seat_id)
-                lock_key = f"seat_lock:{seat.id}"
-                current_locker_session = redis_instance.get(lock_key)
-                if seat.status == 'locked' and current_locker_session and current_locker_session.decode('utf-8') == session_id:
-                    redis_instance.delete(lock_key)
-                    seat.status = 'available'
-                    seat.locked_until = None
-                    seat.locked_by_session = None
-                    seat.save()
-                    unlocked_seats.append(seat.id)
-                elif seat.status != 'locked':
-                    failed_seats.append({'id': seat.id, 'reason': 'not locked'})
-                else:
-                    failed_seats.append({'id': seat.id, 'reason': 'locked by another session or lock expired'})
-            except Seat.DoesNotExist:
-                failed_seats.append({'id': seat_id, 'reason': 'not found'})
+        try:
+            if clone_from is not None:
+                source_event = get_object_or_404(Event, pk=clone_from)
+                created = clone_event_seats(source_event, event, replace=replace)
+            else:
+                created = generate_event_seats(event, layout=request.data.get('layout'), replace=replace)
+        except LayoutError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        seat_map_index.invalidate(event.id)
+        return Response({'event_id': event.id, 'created': created}, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'], url_path='price-tiers')
+    def price_tiers(self, request, pk=None):
+        """列出場次的票價等級。"""
+        event = self.get_object()
+        return Response(PriceTierSerializer(PriceTier.objects.filter(event_id=event.id), many=True).data)
+
+    @action(detail=True, methods=['post'], url_path='reprice', permission_classes=[permissions.IsAdminUser])
+    def reprice(self, request, pk=None):
+        """
+        批次調整票價等級的價格 (request body: {"prices": {"VIP": 3200, "A": 2100}})，僅限管理員。
+        只更新 PriceTier，不修改座位；已成立訂單的 price_at_purchase 不受影響。
+        """
+        event = self.get_object()
+        prices = request.data.get('prices')
+        if not isinstance(prices, dict) or not prices:
+            return Response({'detail': 'prices must be a non-empty object of tier name to price.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            prices = {str(name): int(price) for name, price in prices.items()}
+        except (TypeError, ValueError):
+            return Response({'detail': 'Prices must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        if any(price < 0 for price in prices.values()):
+            return Response({'detail': 'Prices must not be negative.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            reprice(event.id, prices)
+        except PriceTier.DoesNotExist as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        # 座位圖佈局與預先渲染的座位列表含有票價，讓其重建
+        seat_map_index.invalidate(event.id)
+        return Response(PriceTierSerializer(PriceTier.objects.filter(event=event), many=True).data)
+
+    @action(detail=True, methods=['post'], url_path='cancel-orders', permission_classes=[permissions.IsAdminUser])
+    def cancel_orders(self, request, pk=None):
+        """
+        取消場次的所有訂單並釋放座位 (例如整場活動取消)，僅限管理員。
+        分批提交，可傳入 after_id (上次回應的 last_order_id) 從中斷處繼續；
+        大型場次建議改用 manage.py cancel_orders --event，可在批次之間暫停。
+        """
+        event = self.get_object()
+        try:
+            after_id = int(request.data.get('after_id', 0))
+        except (TypeError, ValueError):
+            return Response({'detail': 'after_id must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        return _cancellation_response(order_canceller.cancel(event_id=event.id, after_id=after_id))
 
-        return Response({
-            'unlocked_seats': unlocked_seats,
-            'failed_seats': failed_seats
-        }, status=status.HTTP_200_OK if not failed_seats else status.HTTP_207_MULTI_STATUS)
+class SeatViewSet(viewsets.ModelViewSet):
+    queryset = seats_for_serializer(Seat.objects.all())
+    serializer_class = SeatSerializer
+    # 座位數隨場次成長，列表以游標分頁 ({next, previous, results})
+    pagination_class = BookingCursorPagination
+    # 主鍵只接受數字，/api/seats/lock/ 與 /api/seats/unlock/ (async_views.py) 不會被當成座位詳細頁
+    lookup_value_regex = r'\d+'
+
+    # 座位的新增、修改與刪除會改變序號配置，清除該場次的位元圖讓其重建
+    def perform_create(self, serializer):
+        seat = serializer.save()
+        seat_map_index.invalidate(seat.event_id)
+
+    def perform_update(self, serializer):
+        old_event_id = serializer.instance.event_id
+        seat = serializer.save()
+        seat_map_index.invalidate(old_event_id)
+        if seat.event_id != old_event_id:
+            seat_map_index.invalidate(seat.event_id)
+
+    def perform_destroy(self, instance):
+        event_id = instance.event_id
+        instance.delete()
+        seat_map_index.invalidate(event_id)
 
 class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
+    queryset = orders_for_serializer(Order.objects.all())
+    # 訂單列表以游標分頁，沿用訂單的預設排序 (由 order_created_at_idx 索引支援)
+    pagination_class = BookingCursorPagination
+    cursor_ordering = ('-created_at', '-id')
     serializer_class = OrderSerializer
 
+    def get_serializer_context(self):
+        # OrderSerializer.validate 透過 context 取得座位鎖管理器，serializers.py 不匯入 views / services
+        context = super().get_serializer_context()
+        context['lock_manager'] = lock_manager
+        return context
+
     def create(self, request, *args, **kwargs):
-        # 傳遞 request 和 redis_instance 到 serializer 的 context
-        # 這是 DRF 的標準做法，讓 serializer 能訪問 request 資訊和外部依賴
-        serializer = self.get_serializer(data=request.data, context={'request': request, 'redis_instance': redis_instance})
+        """
+        建立訂單。帶有 Idempotency-Key 標頭時，同一個鍵的重送只會建立一次訂單，
+        之後的重送直接回傳第一次成功的回應 (見 booking/idempotency.py)。
+        """
+        try:
+            key = idempotency_key_from_request(request)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if key is None:
+            return self._create_order(request)
+
+        # 與 OrderSerializer 相同：未提供 session_id 時使用伺服器端的 session，鍵不會落在共用的空白範圍
+        session_id = str(request.data.get('session_id') or '')
+        if not session_id:
+            if not request.session.session_key:
+                request.session.save()
+            session_id = request.session.session_key
+        fingerprint = request_fingerprint(request.data)
+        token, record = idempotency_store.begin(session_id, key, fingerprint)
+        if token is None:
+            if record['fingerprint'] != fingerprint:
+                return Response(
+                    {'detail': 'Idempotency-Key was already used with a different request.'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if record['state'] == STATE_DONE:
+                return Response(record['body'], status=record['status'], headers={REPLAYED_HEADER: 'true'})
+            return Response(
+                {'detail': 'A request with this Idempotency-Key is still being processed.'},
+                status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'},
+            )
+
+        try:
+            response = self._create_order(request)
+        except Exception:
+            idempotency_store.release(session_id, key, token)
+            raise
+        if status.is_success(response.status_code):
+            idempotency_store.complete(session_id, key, token, fingerprint, response.status_code, response.data)
+        else:
+            idempotency_store.release(session_id, key, token)
+        return response
+
+    def _create_order(self, request):
+        # 啟用排隊室的場次只接受已放行的排隊憑證，在驗證與鎖定座位之前先擋下
+        try:
+            event = event_cache.get(int(request.data.get('event_id')))
+        except (TypeError, ValueError, Event.DoesNotExist):
+            event = None
+        if event is not None and event.waiting_room_enabled:
+            if not waiting_room.is_admitted(event.id, queue_token_from_request(request)):
+                return Response({'detail': 'Waiting room admission required.', 'event_id': event.id}, status=status.HTTP_403_FORBIDDEN)
+
+        # request 與 lock_manager 由 get_serializer_context 傳入 serializer 的 context
+        serializer = self.get_serializer(data=request.data)
         
         # 執行驗證，如果驗證失敗會自動拋出 ValidationError，並由我們自定義的異常處理器捕獲
         serializer.is_valid(raise_exception=True) 
@@ -130,63 +436,54 @@ class OrderViewSet(viewsets.ModelViewSet):
         # 從 serializer 中獲取驗證後並預處理的數據
         # 這些是我們在 serializer 的 validate 方法中添加到 self._xxx 的數據
         selected_seats = serializer._selected_seats
-        total_amount = serializer._total_amount
         session_id = serializer._session_id
 
-        seats_to_unlock_redis = [] # 追蹤成功 Redis 鎖定的座位
-        lock_duration_seconds = 60 * 5 # 5分鐘
+        seats_to_unlock_redis = [] # 追蹤成功 Redis 鎖定的座位 ID
+        event = serializer.validated_data['event'] # 從 serializer 獲取 Event 實例
+        lock_duration_seconds, _ = hold_policy(event) # 依場次的座位保留秒數續期
+        seat_ids = [seat.id for seat in selected_seats]
 
         try:
             with transaction.atomic():
                 # 重新獲取座位並鎖定數據庫行，這是防止併發問題的關鍵步驟
                 # 因為 serializer 的驗證階段無法保證原子性，且無法鎖定 DB 行
-                # 這裡我們利用了 select_for_update 在事務中確保數據一致性
-                for seat in selected_seats:
-                    # 再次從 DB 獲取最新狀態並鎖定
-                    # 這裡可以省略 get_object_or_404，因為座位 ID 在 serializer 中已經驗證過存在
-                    seat_from_db = Seat.objects.select_for_update().get(id=seat.id) 
-
-                    lock_key = f"seat_lock:{seat_from_db.id}"
-                    current_locker_session = redis_instance.get(lock_key)
-
-                    # 再次檢查座位狀態，防止在驗證和執行之間狀態改變
-                    if seat_from_db.status not in ['available', 'cancelled']:
-                        if seat_from_db.status == 'locked':
-                            if not current_locker_session or current_locker_session.decode('utf-8') != session_id:
-                                # 被其他人鎖定
-                                raise serializers.ValidationError({'detail': f'Seat {seat_from_db.id} is locked by another user during final transaction.'})
-                            else:
-                                # 是自己的鎖定，續期 Redis 鎖
-                                redis_instance.expire(lock_key, lock_duration_seconds)
-                        elif seat_from_db.status == 'registered':
-                            raise serializers.ValidationError({'detail': f'Seat {seat_from_db.id} is already registered during final transaction.'})
-                        else:
-                            raise serializers.ValidationError({'detail': f'Seat {seat_from_db.id} is in an invalid state during final transaction: {seat_from_db.get_status_display()}.'})
-                    
-                    # 確保在 Redis 中進行原子性鎖定，防止併發操作
-                    if not redis_instance.set(lock_key, session_id, ex=lock_duration_seconds, nx=True):
-                        # 如果鎖定失敗，且不是自己的鎖，則報錯
-                        if current_locker_session and current_locker_session.decode('utf-8') != session_id:
-                             raise serializers.ValidationError({'detail': f'Seat {seat_from_db.id} is already locked by another user in Redis during final transaction.'})
-                        else:
-                            # 是自己的鎖，續期
-                            redis_instance.expire(lock_key, lock_duration_seconds)
-                    
-                    seats_to_unlock_redis.append(lock_key) # 成功鎖定或續期後加入列表
-
-
-                    # 更新座位狀態為 'locked'，並保存到資料庫
-                    seat_from_db.status = 'locked' 
-                    seat_from_db.locked_until = timezone.now() + timedelta(seconds=lock_duration_seconds)
-                    seat_from_db.locked_by_session = session_id
-                    seat_from_db.save()
-                
+                # 以單一 SELECT ... FOR UPDATE 依 id 順序鎖定所有座位，
+                # 所有交易都以相同順序取得行鎖，避免死結
+                # 一併讀取目前票價 (只鎖定座位列，調整票價等級不會與下單互相等待)
+                seats_from_db = list(
+                    Seat.objects.select_for_update(of=('self',)).filter(id__in=seat_ids, event=event)
+                    .annotate(current_price=CURRENT_PRICE).order_by('id')
+                )
+                if len(seats_from_db) != len(seat_ids):
+                    missing = sorted(set(seat_ids) - {seat.id for seat in seats_from_db})
+                    raise serializers.ValidationError({'detail': f'Seat {missing[0]} no longer exists.'})
+
+                # 再次檢查座位狀態，防止在驗證和執行之間狀態改變
+                # ('locked' 是否屬於本會話由下方的 Redis 鎖定結果判斷)
+                for seat_from_db in seats_from_db:
+                    if seat_from_db.status == 'registered':
+                        raise serializers.ValidationError({'detail': f'Seat {seat_from_db.id} is already registered during final transaction.'})
+                    elif seat_from_db.status not in ['available', 'cancelled', 'locked']:
+                        raise serializers.ValidationError({'detail': f'Seat {seat_from_db.id} is in an invalid state during final transaction: {seat_from_db.get_status_display()}.'})
+
+                # 以單次原子操作取得或續期所有座位的 Redis 鎖 (全有或全無)
+                results = lock_manager.acquire_many(
+                    event.id, seat_ids, session_id, lock_duration_seconds, all_or_nothing=True,
+                )
+                conflicts = [seat_id for seat_id, code in results.items() if code == LOCK_CONFLICT]
+                if conflicts:
+                    raise serializers.ValidationError({'detail': f'Seat {conflicts[0]} is locked by another user during final transaction.'})
+                seats_to_unlock_redis = seat_ids # 成功鎖定或續期後加入列表
+
+                # 以交易中讀到的票價等級價格計算總金額
+                total_amount = sum((Decimal(seat.current_price) for seat in seats_from_db), Decimal('0.00'))
+
                 # 準備訂單數據，使用 serializer.validated_data 確保數據已驗證
                 order_number = f"ORD-{uuid.uuid4().hex[:10].upper()}"
                 order_data = {
                     'order_number': order_number,
-                    'event': serializer.validated_data['event'], # 從 serializer 獲取 Event 實例
-                    'total_amount': total_amount, # 使用 serializer 計算的總金額
+                    'event': event,
+                    'total_amount': total_amount,
                     'status': 'registered',
                     'buyer_name': serializer.validated_data['buyer_name'],
                     # 'user': request.user if request.user.is_authenticated else None # 如果有用戶認證
@@ -195,26 +492,26 @@ class OrderViewSet(viewsets.ModelViewSet):
                 # 創建 Order 實例
                 order = Order.objects.create(**order_data)
 
-                # 創建 OrderItem 並更新 Seat 狀態為 'registered'
-                for seat in selected_seats: # 這裡的 seat 是從 serializer 獲取，需要用 ID 再次確保與 DB 狀態同步
-                    # 再次從 DB 獲取最新狀態（已在 select_for_update 中處理）
-                    current_seat = Seat.objects.select_for_update().get(id=seat.id)
-                    OrderItem.objects.create(
-                        order=order,
-                        seat=current_seat, # 使用從 DB 獲取的最新座位實例
-                        quantity=1,
-                        price_at_purchase=current_seat.price
-                    )
-                    current_seat.status = 'registered'
-                    current_seat.locked_until = None
-                    current_seat.locked_by_session = None
-                    current_seat.save()
-
-            # 交易成功提交後，安全地從 Redis 刪除鎖定
-            for lock_key in seats_to_unlock_redis:
-                redis_instance.delete(lock_key)
-
-            # 返回響應
+                # 以一次 bulk_create 建立所有 OrderItem，一次 UPDATE 將座位改為 'registered'
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, seat=seat, quantity=1, price_at_purchase=seat.current_price)
+                    for seat in seats_from_db
+                ])
+                Seat.objects.filter(id__in=seat_ids).update(
+                    status='registered', locked_until=None, locked_by_session=None
+                )
+
+            # 交易成功提交後，以單一 pipeline 釋放本會話的 Redis 鎖並更新座位狀態位元圖
+            # (座位鎖在其他節點時另外執行一次釋放)
+            pipe = redis_instance.pipeline(transaction=False)
+            same_node = hold_manager.client_for(event.id) is redis_instance
+            hold_manager.release(event.id, session_id, seats_to_unlock_redis, pipeline=pipe if same_node else None)
+            lock_journal.released(seats_from_db, pipeline=pipe)
+            seat_map_index.mark(seats_from_db, STATE_REGISTERED, pipeline=pipe)
+            pipe.execute()
+
+            # 返回響應 (重新以預先載入的查詢取得訂單，避免逐筆查詢座位)
+            order = self.get_queryset().get(pk=order.pk)
             response_serializer = self.get_serializer(order)
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
@@ -224,21 +521,31 @@ class OrderViewSet(viewsets.ModelViewSet):
         except Exception as e:
             # 任何在 transaction.atomic() 區塊內發生的錯誤都會觸發回滾
             # 手動處理 Redis 的解鎖 (對於那些在交易開始前就成功鎖定的)
-            for lock_key in seats_to_unlock_redis:
-                current_locker_session = redis_instance.get(lock_key)
-                if current_locker_session and current_locker_session.decode('utf-8') == session_id:
-                    redis_instance.delete(lock_key)
+            # release_many 在 Redis 端原子地比對持有者後才刪除
+            lock_manager.release_many(event.id, seats_to_unlock_redis, session_id)
             
             # 重新拋出異常，讓 custom_exception_handler 處理
             raise e
 
+    @action(detail=False, methods=['get'], url_path='export', permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        """
+        串流匯出訂單，不經過 OrderSerializer 也不分頁，僅限管理員。
+        可用 ?event_id= 與 ?status= 篩選。
+        """
+        return _export_response(request, 'orders')
+
+    @action(detail=False, methods=['get'], url_path='export/items', permission_classes=[permissions.IsAdminUser])
+    def export_items(self, request):
+        """串流匯出訂單項 (每個座位一列，附上訂單與座位資訊)，僅限管理員。"""
+        return _export_response(request, 'order-items')
+
     @action(detail=True, methods=['post'], url_path='cancel')
     def cancel_order(self, request, pk=None):
         """
         取消訂單的 API 動作。
-        將訂單狀態改為 'cancelled'，並釋放所有相關座位。
+        將訂單狀態改為 'cancelled'，並以批次 UPDATE 釋放所有相關座位。
         """
-
         try:
             with transaction.atomic():
                 # 獲取訂單並鎖定，防止併發取消，現在在交易內部
@@ -247,29 +554,52 @@ class OrderViewSet(viewsets.ModelViewSet):
                 # 只有 'registered' 狀態的訂單才能被取消
                 if order.status != 'registered':
                     return Response({'detail': f'Order cannot be cancelled. Current status: {order.get_status_display()}.'}, status=status.HTTP_400_BAD_REQUEST)
-                
-                order.status = 'cancelled'
-                order.save()
-
-                # 釋放訂單中的所有座位
-                for order_item in list(order.items.all()): # <-- 注意這裡，使用 list() 避免在迭代時修改 QuerySet
-                    seat = order_item.seat
-                    if seat: # 確保座位存在
-                        # 只有當座位是 'registered' 時才改為 'available'
-                        # 如果座位是 'locked' 狀態，則確保解鎖並改為 'available'
-                        if seat.status in ['registered', 'locked']:
-                            seat.status = 'available'
-                            seat.locked_until = None
-                            seat.locked_by_session = None
-                            seat.save()
-                            # 確保 Redis 鎖定也清除 (以防萬一)
-                            redis_instance.delete(f"seat_lock:{seat.id}")
-                        # 如果座位已經是 'available' 或其他狀態，則不做改變
-                        # 如果座位是 'cancelled' (表示已被取消過)，也可以讓它保持 'available'
-                    order_item.delete() 
 
+                released_seats = order_canceller.cancel_rows([order.id])
+
+            # 交易提交後清除 Redis 鎖定並更新座位狀態位元圖
+            order_canceller.release(released_seats)
+
+            order = self.get_queryset().get(pk=order.pk)
             response_serializer = self.get_serializer(order)
             return Response({'detail': 'Order successfully cancelled.', 'order': response_serializer.data}, status=status.HTTP_200_OK)
 
+        except Http404:
+            raise
         except Exception as e:
-            return Response({'detail': f'Failed to cancel order: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'detail': f'Failed to cancel order: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['post'], url_path='bulk-cancel', permission_classes=[permissions.IsAdminUser])
+    def bulk_cancel(self, request):
+        """
+        批次取消多筆訂單 (request body: order_ids)，僅限管理員。
+        已取消或不存在的訂單會被略過；整個場次請使用 /api/events/{id}/cancel-orders/。
+        """
+        order_ids = request.data.get('order_ids')
+        if not isinstance(order_ids, list) or not order_ids:
+            return Response({'detail': 'order_ids must be a non-empty list.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(order_ids) > MAX_BULK_CANCEL_ORDERS:
+            return Response({'detail': f'At most {MAX_BULK_CANCEL_ORDERS} orders can be cancelled per request.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            order_ids = [int(order_id) for order_id in order_ids]
+        except (TypeError, ValueError):
+            return Response({'detail': 'order_ids must be integers.'}, status=status.HTTP_400_BAD_REQUEST)
+        return _cancellation_response(order_canceller.cancel(order_ids=order_ids))
+
+@api_view(['GET'])
+def health(request):
+    """
+    檢查資料庫與 Redis 連線並回報 Redis 連線池使用狀況。
+    全部正常時回傳 200，否則回傳 503，可供負載平衡器或容器健康檢查使用。
+    """
+    healthy, details = health_check()
+    details['status'] = 'ok' if healthy else 'unavailable'
+    return Response(details, status=status.HTTP_200_OK if healthy else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@require_GET
+def metrics(request):
+    """
+    以 Prometheus 文字格式輸出本行程各視圖的延遲直方圖與資料庫 / Redis 呼叫計數。
+    """
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,220 @@
+# booking/waiting_room.py
+
+"""
+熱門場次開賣時的虛擬排隊室 (以 Redis 實作的入場控制)。
+
+場次啟用排隊室 (Event.waiting_room_enabled) 後，客戶端必須先加入排隊取得排隊憑證 (token)，
+排程程式 (manage.py run_waiting_room) 每秒依 Event.admission_rate 從隊首放行固定人數，
+被放行的憑證在 ADMISSION_TTL 秒內可以呼叫鎖定座位與建立訂單的端點。
+這樣同時進入選座與結帳流程的人數維持在系統可承受的速度，
+不會因為所有人同時搶 select_for_update 而讓資料庫效能崩潰。
+
+Redis 鍵：
+    waitingroom:{event_id}:queue           sorted set，token -> 加入順序 (排隊中)
+    waitingroom:{event_id}:seq             加入順序計數器
+    waitingroom:{event_id}:admitted        sorted set，token -> 放行時間 (unix 秒)
+    waitingroom:{event_id}:joined_total    累計加入人數
+    waitingroom:{event_id}:admitted_total  累計放行人數
+"""
+
+import logging
+import time
+import uuid
+
+from django.conf import settings
+
+from .models import Event
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1]: queue, KEYS[2]: seq, KEYS[3]: joined_total；ARGV[1]: token
+# 回傳加入後的名次 (0 起算)
+JOIN_SCRIPT = """
+local seq = redis.call('INCR', KEYS[2])
+redis.call('ZADD', KEYS[1], 'NX', seq, ARGV[1])
+redis.call('INCR', KEYS[3])
+return redis.call('ZRANK', KEYS[1], ARGV[1])
+"""
+
+# KEYS[1]: queue, KEYS[2]: admitted, KEYS[3]: admitted_total
+# ARGV[1]: 放行人數上限, ARGV[2]: 現在時間, ARGV[3]: 放行有效秒數
+# 先清除已過期的放行憑證，再從隊首取出憑證移入已放行集合，回傳實際放行人數
+ADMIT_SCRIPT = """
+local now = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - tonumber(ARGV[3]))
+local count = tonumber(ARGV[1])
+if count <= 0 then
+    return 0
+end
+local popped = redis.call('ZPOPMIN', KEYS[1], count)
+local admitted = 0
+for i = 1, #popped, 2 do
+    redis.call('ZADD', KEYS[2], now, popped[i])
+    admitted = admitted + 1
+end
+if admitted > 0 then
+    redis.call('INCRBY', KEYS[3], admitted)
+end
+return admitted
+"""
+
+
+def _keys(event_id):
+    prefix = f"waitingroom:{event_id}"
+    return {
+        'queue': f"{prefix}:queue",
+        'seq': f"{prefix}:seq",
+        'admitted': f"{prefix}:admitted",
+        'joined_total': f"{prefix}:joined_total",
+        'admitted_total': f"{prefix}:admitted_total",
+    }
+
+
+def admission_ttl():
+    """放行憑證的有效秒數 (選座到完成訂單的時間)。"""
+    return settings.WAITING_ROOM['ADMISSION_TTL']
+
+
+def queue_token_from_request(request):
+    """從 X-Queue-Token 標頭取得排隊憑證。"""
+    return request.headers.get('X-Queue-Token') or None
+
+
+def _estimated_wait(position, rate):
+    if position is None or not rate:
+        return None
+    return (position + rate - 1) // rate
+
+
+class WaitingRoom:
+    """每個場次一條的 Redis 排隊佇列。"""
+
+    def __init__(self, client):
+        self.client = client
+        self._join = client.register_script(JOIN_SCRIPT)
+        self._admit = client.register_script(ADMIT_SCRIPT)
+
+    def join(self, event_id):
+        """加入排隊，回傳 (token, 名次，0 起算)。"""
+        token = uuid.uuid4().hex
+        keys = _keys(event_id)
+        position = self._join(keys=[keys['queue'], keys['seq'], keys['joined_total']], args=[token])
+        return token, int(position)
+
+    def status(self, event_id, token, rate, now=None):
+        """
+        查詢排隊憑證的狀態：
+        {'admitted': bool, 'position': 目前名次 (1 起算，已放行為 0), 'estimated_wait_seconds': ...}。
+        憑證不存在 (未加入或放行已過期) 時回傳 None。
+        """
+        now = time.time() if now is None else now
+        keys = _keys(event_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zscore(keys['admitted'], token)
+        pipe.zrank(keys['queue'], token)
+        admitted_at, rank = pipe.execute()
+        if admitted_at is not None and admitted_at + admission_ttl() > now:
+            return {
+                'admitted': True,
+                'position': 0,
+                'estimated_wait_seconds': 0,
+                'expires_in': int(admitted_at + admission_ttl() - now),
+            }
+        if rank is None:
+            return None
+        return {
+            'admitted': False,
+            'position': int(rank) + 1,
+            'estimated_wait_seconds': _estimated_wait(int(rank) + 1, rate),
+        }
+
+    def is_admitted(self, event_id, token, now=None):
+        if not token:
+            return False
+        now = time.time() if now is None else now
+        admitted_at = self.client.zscore(_keys(event_id)['admitted'], token)
+        return admitted_at is not None and admitted_at + admission_ttl() > now
+
+    def admit(self, event_id, count, now=None):
+        """從隊首放行最多 count 人並清除過期的放行憑證，回傳實際放行人數。"""
+        now = time.time() if now is None else now
+        keys = _keys(event_id)
+        return int(self._admit(
+            keys=[keys['queue'], keys['admitted'], keys['admitted_total']],
+            args=[int(count), now, admission_ttl()],
+        ))
+
+    def stats(self, event_id, now=None):
+        """排隊與放行統計：排隊人數、有效放行人數、最近一分鐘放行人數 (實際放行速率) 與累計數字。"""
+        now = time.time() if now is None else now
+        keys = _keys(event_id)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zcard(keys['queue'])
+        pipe.zcount(keys['admitted'], now - admission_ttl(), '+inf')
+        pipe.zcount(keys['admitted'], now - 60, '+inf')
+        pipe.get(keys['joined_total'])
+        pipe.get(keys['admitted_total'])
+        waiting, active, last_minute, joined_total, admitted_total = pipe.execute()
+        return {
+            'waiting': waiting,
+            'admitted_active': active,
+            'admitted_last_minute': last_minute,
+            'admitted_per_second': round(last_minute / 60, 2),
+            'joined_total': int(joined_total or 0),
+            'admitted_total': int(admitted_total or 0),
+        }
+
+
+class AsyncWaitingRoom:
+    """WaitingRoom 的 redis.asyncio 版本，只提供 async 視圖需要的放行檢查。"""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def is_admitted(self, event_id, token, now=None):
+        if not token:
+            return False
+        now = time.time() if now is None else now
+        admitted_at = await self.client.zscore(_keys(event_id)['admitted'], token)
+        return admitted_at is not None and admitted_at + admission_ttl() > now
+
+
+class AdmissionScheduler:
+    """
+    依各場次的 admission_rate 定期放行排隊者。
+    每次 tick 依經過時間累積放行配額 (不足一人的部分留到下一次)，
+    隊伍已清空時不累積配額，避免之後瞬間放行大量新加入者。
+    """
+
+    def __init__(self, room, max_elapsed_seconds=5):
+        self.room = room
+        self.max_elapsed_seconds = max_elapsed_seconds
+        self._allowance = {}
+        self._last_tick = None
+
+    def tick(self, now=None):
+        """放行一輪，回傳 {event_id: 放行人數}。"""
+        now = time.monotonic() if now is None else now
+        if self._last_tick is None:
+            elapsed = settings.WAITING_ROOM['TICK_SECONDS']
+        else:
+            elapsed = min(now - self._last_tick, self.max_elapsed_seconds)
+        self._last_tick = now
+
+        admitted_by_event = {}
+        events = Event.objects.filter(waiting_room_enabled=True, is_active=True).values_list('id', 'admission_rate')
+        for event_id, rate in events:
+            allowance = self._allowance.get(event_id, 0) + rate * elapsed
+            count = int(allowance)
+            admitted = self.room.admit(event_id, count)
+            self._allowance[event_id] = allowance - count if admitted == count else 0
+            admitted_by_event[event_id] = admitted
+            if admitted:
+                logger.info(
+                    "Admitted users from waiting room",
+                    extra={'event_id': event_id, 'admitted': admitted, 'admission_rate': rate},
+                )
+        # 停用排隊室的場次不再保留配額
+        for event_id in set(self._allowance) - set(admitted_by_event):
+            del self._allowance[event_id]
+        return admitted_by_event
@@ -0,0 +1,67 @@
+# booking/writebehind.py
+
+"""
+redis 模式下把座位鎖定狀態批次寫回資料庫 (write-behind)。
+
+選座流程只把鎖定狀態有變動的座位記入 lockstate:dirty (見 lockstate.py)，
+這裡每次取出一批，以一次 SELECT ... FOR UPDATE 與一次 bulk_update 把 Redis 中的鎖定狀態
+鏡像到 Seat 的 status、locked_until、locked_by_session。
+同一座位在兩次寫回之間的多次鎖定 / 解鎖只會寫入一次最終狀態。
+
+只會改動 available / cancelled / locked 的座位，下單與取消寫入的持久狀態不受影響。
+取出後寫回前行程中斷時，該批座位的鏡像會落後到下次變動為止；鎖定的正確性不依賴這份鏡像。
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .lockstate import lockable_statuses
+from .models import Seat
+from .services import lock_manager, lock_journal
+
+
+def flush_lock_state(batch_size=500):
+    """寫回一批待處理的座位，回傳 (資料庫有變動的座位數, 本批取出數量)。"""
+    dirty = lock_journal.pop_dirty(batch_size)
+    if not dirty:
+        return 0, 0
+
+    now = timezone.now()
+    changed = []
+    with transaction.atomic():
+        # 依 id 順序取得行鎖 (與建立訂單相同)，避免與下單流程死結
+        seats = list(
+            Seat.objects.select_for_update()
+            .filter(id__in=[seat_id for _, seat_id in dirty], status__in=lockable_statuses())
+            .order_by('id')
+            .only('id', 'event_id', 'status', 'locked_until', 'locked_by_session')
+        )
+        locks = lock_manager.inspect_seats(seats)
+        for seat in seats:
+            owner, ttl = locks[seat.id]
+            if owner is not None:
+                seat.status = 'locked'
+                seat.locked_by_session = owner
+                seat.locked_until = now + timedelta(seconds=max(ttl, 0))
+            elif seat.status == 'locked':
+                seat.status = 'available'
+                seat.locked_by_session = None
+                seat.locked_until = None
+            else:
+                continue
+            changed.append(seat)
+        if changed:
+            Seat.objects.bulk_update(changed, ['status', 'locked_until', 'locked_by_session'])
+    return len(changed), len(dirty)
+
+
+def run_once(batch_size=500):
+    """持續寫回直到 dirty 集合清空，回傳有變動的座位總數。"""
+    total = 0
+    while True:
+        changed, popped = flush_lock_state(batch_size=batch_size)
+        total += changed
+        if popped < batch_size:
+            return total
@@ -101,6 +101,11 @@ LOGGING = {
             'level': 'DEBUG', # 開發時可以使用 DEBUG，生產時用 INFO
             'propagate': False,
         },
+        'booking.requests': { # 每個請求的耗時與資料庫 / Redis 呼叫統計，只寫入 JSON 日誌檔
+            'handlers': ['file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         '': { # root logger
             'handlers': ['console', 'file'],
             'level': 'INFO',
@@ -124,6 +129,8 @@ SPECTACULAR_SETTINGS = {
 }
 
 MIDDLEWARE = [
+    # 放在最前面，統計整個請求的時間與資料庫 / Redis 呼叫 (見 booking/instrumentation.py)
+    'booking.instrumentation.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -169,7 +176,81 @@ WSGI_APPLICATION = 'seat_booking_system_backend.wsgi.application'
 # }
 
 DATABASES = {
-    'default': dj_database_url.config(default=os.environ.get('DATABASE_URL'))
+    # 持續連線：每個工作執行緒重複使用資料庫連線 DB_CONN_MAX_AGE 秒 (0 表示每個請求重新連線)，
+    # 並在重複使用前檢查連線是否仍然可用
+    'default': dj_database_url.config(
+        default=os.environ.get('DATABASE_URL'),
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        conn_health_checks=True,
+    )
+}
+
+# Redis 連線設定，由 booking/connections.py 建立共用連線池
+REDIS = {
+    'HOST': os.environ.get('REDIS_HOST', 'localhost'),
+    'PORT': int(os.environ.get('REDIS_PORT', 6379)),
+    'DB': int(os.environ.get('REDIS_DB', 0)),
+    'PASSWORD': os.environ.get('REDIS_PASSWORD', ''),
+    'MAX_CONNECTIONS': int(os.environ.get('REDIS_MAX_CONNECTIONS', 50)),  # 每個行程的同步連線上限
+    'POOL_TIMEOUT': float(os.environ.get('REDIS_POOL_TIMEOUT', 5)),       # 連線用盡時最多等待秒數
+    'ASYNC_MAX_CONNECTIONS': int(os.environ.get('REDIS_ASYNC_MAX_CONNECTIONS', 1000)),  # SSE 每個事件迴圈共用一條訂閱連線
+    'SOCKET_TIMEOUT': float(os.environ.get('REDIS_SOCKET_TIMEOUT', 5)),
+    'SOCKET_CONNECT_TIMEOUT': float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', 2)),
+    'HEALTH_CHECK_INTERVAL': int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30)),
+}
+
+# 座位鎖分區，見 booking/lockrouter.py
+# 例：REDIS_LOCK_NODES="a=redis://10.0.0.1:6379/0,b=redis://10.0.0.2:6379/0"；未設定時座位鎖使用上面的主連線
+REDIS_LOCK_NODES = dict(
+    node.strip().split('=', 1) for node in os.environ.get('REDIS_LOCK_NODES', '').split(',') if node.strip()
+)
+REDIS_LOCK_DRAINING = [name for name in os.environ.get('REDIS_LOCK_DRAINING', '').split(',') if name]  # 準備移除的節點
+REDIS_LOCK_CLUSTER_URL = os.environ.get('REDIS_LOCK_CLUSTER_URL', '')  # 設定時改用 Redis Cluster
+
+# 快取 (Django 內建 Redis 後端)，場次與場地讀取快取使用，見 booking/cache.py
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_URL', f"redis://{REDIS['HOST']}:{REDIS['PORT']}/1"),
+        'KEY_PREFIX': 'seat_booking',
+    }
+}
+
+# 虛擬排隊室，見 booking/waiting_room.py
+WAITING_ROOM = {
+    'ADMISSION_TTL': int(os.environ.get('WAITING_ROOM_ADMISSION_TTL', 900)),  # 放行後可選座與下單的秒數
+    'TICK_SECONDS': 1,  # 排程程式放行的間隔
+}
+
+# 座位保留 (hold) 的預設時間政策，可依場次覆寫 (Event.hold_ttl_seconds / hold_max_seconds)，見 booking/holds.py
+SEAT_HOLDS = {
+    'TTL': int(os.environ.get('SEAT_HOLD_TTL', 180)),                  # 鎖定或每次續期後保留的秒數
+    'MAX_SECONDS': int(os.environ.get('SEAT_HOLD_MAX_SECONDS', 900)),  # 自建立起最多可續期到的秒數
+}
+
+# 座位鎖定中狀態的儲存位置，見 booking/lockstate.py
+SEAT_LOCK_STATE = {
+    'MODE': os.environ.get('SEAT_LOCK_STATE_MODE', 'database'),  # 'database' 同步寫入 Seat；'redis' 只存在 Redis
+    'WRITE_BEHIND': os.environ.get('SEAT_LOCK_WRITE_BEHIND', '1') == '1',  # redis 模式下由 flush_seat_locks 批次寫回資料庫
+}
+
+# 建立訂單的 Idempotency-Key，見 booking/idempotency.py
+IDEMPOTENCY = {
+    'TTL': int(os.environ.get('IDEMPOTENCY_TTL', 60 * 60 * 24)),  # 成功回應保留秒數
+    'IN_FLIGHT_TTL': 60,  # 處理中標記的秒數，須大於建立訂單的最長處理時間
+}
+
+BOOKING_ENTITY_CACHE = {
+    'ENABLED': os.environ.get('BOOKING_ENTITY_CACHE_ENABLED', '1') == '1',
+    'TIMEOUT': 300,      # 共用 (Redis) 快取秒數，修改時由 signals 主動刪除
+    'LOCAL_TIMEOUT': 5,  # 行程內快取秒數，其他行程的修改最多延遲這麼久才看得到
+    'LOCAL_MAX_ENTRIES': 1024,
+}
+
+# 每個請求的資料庫 / Redis 統計，見 booking/instrumentation.py
+BOOKING_INSTRUMENTATION = {
+    'SERVER_TIMING': os.environ.get('BOOKING_SERVER_TIMING', '1') == '1',  # 回應帶 Server-Timing 標頭
+    'LOG_REQUESTS': os.environ.get('BOOKING_LOG_REQUESTS', '1') == '1',    # 每個請求寫入一筆 booking.requests 日誌
 }
 
 # Password validation
@@ -221,4 +302,9 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 # 或者如果允許所有來源 (開發環境可暫用，生產環境不建議)
-# CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+# CORS_ALLOW_ALL_ORIGINS = True
+
+# 排隊室的放行憑證以 X-Queue-Token 標頭傳送，建立訂單的重送以 Idempotency-Key 標頭辨識
+from corsheaders.defaults import default_headers
+CORS_ALLOW_HEADERS = (*default_headers, 'x-queue-token', 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed', 'Retry-After']
\ No newline at end of file
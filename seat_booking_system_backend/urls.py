@@ -3,7 +3,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from booking import views
+from booking import views, streaming, async_views
 
 # 引入 drf_spectacular 的視圖
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
@@ -18,6 +18,20 @@ router.register(r'orders', views.OrderViewSet, basename='order')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # 座位狀態即時推送 (Server-Sent Events，需以 ASGI 伺服器提供服務)
+    path('api/events/<int:event_id>/stream/', streaming.event_seat_stream, name='event-seat-stream'),
+    path('api/health/', views.health, name='health'),
+    # Prometheus 指標 (各視圖延遲直方圖，見 booking/instrumentation.py)
+    path('metrics', views.metrics, name='metrics'),
+    # 選座熱點端點以 async 的 DRF 視圖實作 (redis.asyncio + async ORM，見 booking/async_views.py)；
+    # EventViewSet / SeatViewSet 的主鍵只接受數字，這些路徑不會與路由器的路由重疊
+    path('api/seats/lock/', async_views.lock_seats, name='seat-lock'),
+    path('api/seats/unlock/', async_views.unlock_seats, name='seat-unlock'),
+    path('api/events/<int:event_id>/seat-map/', async_views.seat_map, name='event-seat-map'),
+    path('api/events/<int:event_id>/best-available/', async_views.best_available, name='event-best-available'),
+    path('api/events/<int:event_id>/hold/', async_views.hold_detail, name='event-hold'),
+    path('api/events/<int:event_id>/hold/renew/', async_views.renew_hold, name='event-hold-renew'),
+    path('api/events/<int:event_id>/hold/release/', async_views.release_hold, name='event-hold-release'),
     # 將 DRF 的路由包含進來，API 的根路徑是 /api/
     path('api/', include(router.urls)),
     # 也可以添加 DRF 的登入/登出 URL，方便瀏覽器 API 測試
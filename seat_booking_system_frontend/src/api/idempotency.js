@@ -0,0 +1,31 @@
+// seat-booking-frontend/src/api/idempotency.js
+import apiClient from "@/api";
+
+// 產生新的 Idempotency-Key；同一次送出的所有重試都使用同一個鍵
+export function newIdempotencyKey() {
+  if (window.crypto && window.crypto.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  return `${Date.now().toString(16)}-${Math.random().toString(16).slice(2)}`;
+}
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// 以 Idempotency-Key 送出 POST，逾時、網路錯誤或伺服器回覆仍在處理中 (409) 時以同一個鍵重試，
+// 後端只會處理一次，重試會拿到第一次的結果
+export async function postIdempotent(url, data, { key, headers = {}, retries = 2 } = {}) {
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await apiClient.post(url, data, {
+        headers: { ...headers, "Idempotency-Key": key },
+      });
+    } catch (err) {
+      const retryable =
+        !err.response ||
+        (err.response.status === 409 &&
+          err.response.headers["retry-after"] !== undefined);
+      if (!retryable || attempt >= retries) throw err;
+      await sleep(1000 * (attempt + 1));
+    }
+  }
+}
@@ -0,0 +1,50 @@
+// seat-booking-frontend/src/api/waitingRoom.js
+import apiClient from "@/api";
+
+// 每個活動的排隊憑證存放在 localStorage，重新整理頁面後可以沿用原本的名次
+const tokenKey = (eventId) => `queue_token_${eventId}`;
+
+// 鎖定座位與建立訂單時需要帶上的標頭
+export function queueHeaders(eventId) {
+  const token = localStorage.getItem(tokenKey(eventId));
+  return token ? { "X-Queue-Token": token } : {};
+}
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// 加入 (或恢復) 排隊並輪詢直到被放行，onUpdate 會收到每次查詢到的名次與預估等待秒數
+export async function waitForAdmission(eventId, onUpdate) {
+  let token = localStorage.getItem(tokenKey(eventId));
+  for (;;) {
+    let queueStatus = null;
+    if (token) {
+      try {
+        const response = await apiClient.get(`/api/events/${eventId}/queue/`, {
+          params: { token },
+        });
+        queueStatus = response.data;
+      } catch (err) {
+        if (!err.response || err.response.status !== 404) throw err;
+        token = null; // 憑證不存在或放行已過期，重新排隊
+      }
+    }
+    if (!queueStatus) {
+      const response = await apiClient.post(`/api/events/${eventId}/queue/`);
+      queueStatus = response.data;
+      token = queueStatus.token;
+      if (token) {
+        localStorage.setItem(tokenKey(eventId), token);
+      } else {
+        localStorage.removeItem(tokenKey(eventId));
+      }
+    }
+    onUpdate(queueStatus);
+    if (queueStatus.admitted) return queueStatus;
+    // 依預估等待時間調整輪詢間隔 (1 ~ 5 秒)
+    const waitSeconds = Math.min(
+      Math.max(queueStatus.estimated_wait_seconds || 1, 1),
+      5
+    );
+    await sleep(waitSeconds * 1000);
+  }
+}